@@ -0,0 +1,108 @@
+"""Aggregate encode throughput of N concurrent hardmux jobs, with and without CPU partitioning.
+
+Usage:
+    python benchmarks/concurrency.py [--jobs 1,2,4] [--source 720p-30s] [--preset veryfast] [--output FILE]
+
+For every N, N identical hardmux jobs of a synthetic source (see
+hardmux_suite.py) take N queue slots at once and run through the bot's own
+launcher. "shared" is every ffmpeg left to use all CPUs; "partitioned"
+splits the CPUs among the jobs, pins each ffmpeg to its share and sizes its
+encoder and filter threads to it. Aggregate fps is the frames of all jobs
+over the wall time of the batch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from hardmux_suite import FRAME_RATE, SOURCES, media_path, prepare_media, subtitle_name  # noqa: E402
+
+SUBTITLE = "dense.ass"
+
+
+async def run_batch(jobs, source, settings, partitioned, work_dir):
+    """Encode `jobs` copies of source at once, returning wall time, CPU time and failures."""
+    from config import Config
+    from helper_func.cores import core_partition
+    from helper_func.ffmpeg import adapt_encoding, run_ffmpeg
+    from helper_func.job_queue import Job, JobQueue
+    from helper_func.planner import plan_hardmux
+    from helper_func.probe import probe
+
+    core_partition.enabled = partitioned
+    queue = JobQueue(jobs)
+    vid = media_path(f"{source}.mkv")
+    sub = media_path(subtitle_name(source, SUBTITLE))
+    font_path = os.path.join(Config.FONTS_DIR, "HelveticaRounded-Bold.ttf")
+    info = await probe(vid)
+
+    async def encode(index):
+        job = Job(index, "benchmark")
+        async with queue.slot(job):
+            job_settings = adapt_encoding(settings, info, job)
+            plan = plan_hardmux(info, job_settings, sub, font_path)
+            out = os.path.join(work_dir, f"out_{index}.mp4")
+            returncode, error = await run_ffmpeg(plan.command(vid, out), job)
+            return returncode == 0 or error[-300:]
+
+    # Every job takes its slot before the first ffmpeg starts, as on a busy bot
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(encode(i) for i in range(jobs)))
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return wall, cpu, [r for r in results if r is not True]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", default="1,2,4", help="comma separated numbers of concurrent jobs")
+    parser.add_argument("--source", default="720p-30s", choices=sorted(SOURCES))
+    parser.add_argument("--preset", default="veryfast")
+    parser.add_argument("--codec", default="libx264")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    prepare_media([args.source], with_video=True)
+    os.chdir(ROOT)
+    from helper_func.cores import available_cpus
+
+    settings = {"codec": args.codec, "preset": args.preset, "crf": "22", "resolution": "1280x720"}
+    frames = SOURCES[args.source][2] * FRAME_RATE
+    results = []
+    print(f"{len(available_cpus())} CPUs, {args.source}, {args.codec} {args.preset}")
+    print(f"{'jobs':>4} {'mode':>12} {'wall s':>8} {'agg fps':>8} {'cpu s':>8}")
+    for jobs in (int(n) for n in args.jobs.split(",")):
+        for partitioned in (False, True):
+            work_dir = tempfile.mkdtemp(prefix="muxconc_")
+            try:
+                wall, cpu, failures = asyncio.run(run_batch(jobs, args.source, settings, partitioned, work_dir))
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            if failures:
+                print(f"{jobs} jobs failed: {failures[0]}")
+                return 1
+            mode = "partitioned" if partitioned else "shared"
+            fps = jobs * frames / wall
+            results.append({"jobs": jobs, "mode": mode, "wall_time": round(wall, 3),
+                            "aggregate_fps": round(fps, 2), "cpu_time": round(cpu, 3)})
+            print(f"{jobs:>4} {mode:>12} {wall:>8.2f} {fps:>8.1f} {cpu:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,394 @@
+"""Reproducible benchmarks of the hardmux, softmux, screenshot and conversion paths.
+
+Usage:
+    python benchmarks/hardmux_suite.py run [--quick] [--only TEXT] [--repeat N] [--presets P,..] [--output FILE]
+    python benchmarks/hardmux_suite.py compare BASELINE.json CURRENT.json [--threshold 0.10]
+
+run generates deterministic test media into benchmarks/media the first time
+(lavfi testsrc2 and sine at 480p, 720p and 1080p, synthetic SRT and ASS with
+sparse and dense dialogue) and runs every case in a fresh worker process
+with its own download directory and database, so no cache carries over from
+one case to the next. Each case records wall time, CPU time of the worker and
+its ffmpeg children, peak RSS, output size and frames per second, and the
+results are written as JSON.
+
+compare matches two result files case by case and exits with status 1 when
+any case got slower, heavier or bigger by more than the threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MEDIA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media")
+FRAME_RATE = 24
+
+# name: (width, height, seconds)
+SOURCES = {
+    "480p-10s": (854, 480, 10),
+    "720p-30s": (1280, 720, 30),
+    "1080p-10s": (1920, 1080, 10),
+}
+QUICK_SOURCES = ["480p-10s"]
+
+# The choices of the /set_preferences keyboard
+CODECS = ["libx264", "libx265"]
+CRFS = ["18", "22", "28"]
+RESOLUTIONS = ["854x480", "1280x720", "1920x1080"]
+DEFAULT_SETTINGS = {"codec": "libx264", "preset": "ultrafast", "crf": "22", "resolution": "1280x720"}
+
+# Subtitle name: (dense dialogue, format)
+SUBTITLES = {
+    "sparse.srt": (False, "srt"),
+    "dense.srt": (True, "srt"),
+    "sparse.ass": (False, "ass"),
+    "dense.ass": (True, "ass"),
+}
+# A film length subtitle for the conversion cases
+LONG_SUBTITLE_SECONDS = 2 * 3600
+CONVERSIONS = [("srt", "ass"), ("ass", "srt"), ("srt", "vtt")]
+
+LINES = [
+    "Where were you last night?",
+    "I told you, the <b>library</b>.",
+    "Then why does your coat smell of rain?",
+    "Because it was raining, obviously.",
+]
+
+# Relative change that counts as a regression, per metric, and which direction is worse
+METRICS = {
+    "wall_time": 1,
+    "cpu_time": 1,
+    "peak_rss_kb": 1,
+    "output_size": 1,
+    "fps": -1,
+}
+
+
+# --- Media ------------------------------------------------------------------
+
+def generate_video(path, width, height, seconds):
+    """A deterministic H.264/AAC test video, written once and reused."""
+    if os.path.exists(path):
+        return
+    tmp = path + ".tmp.mkv"
+    subprocess.run([
+        'ffmpeg', '-hide_banner', '-v', 'error',
+        '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={FRAME_RATE}:duration={seconds}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={seconds}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-g', str(FRAME_RATE * 2),
+        '-pix_fmt', 'yuv420p', '-threads', '1', '-c:a', 'aac', '-b:a', '128k',
+        '-fflags', '+bitexact', '-flags', '+bitexact', '-map_metadata', '-1',
+        '-y', tmp
+    ], check=True)
+    os.replace(tmp, path)
+
+
+def synthetic_cues(seconds, dense):
+    """Sparse: a line every 5s. Dense: a line every 0.5s, shown for 1.8s, so up to four overlap."""
+    from helper_func.convert import Cue
+    step, length = (500, 1800) if dense else (5000, 2000)
+    cues = []
+    for i, start in enumerate(range(0, seconds * 1000, step)):
+        text = LINES[i % len(LINES)]
+        if dense and i % 3 == 0:
+            text = f"<i>{text}</i>\n{LINES[(i + 1) % len(LINES)]}"
+        cues.append(Cue(start, min(start + length, seconds * 1000), text))
+    return cues
+
+
+def generate_subtitle(path, seconds, dense, fmt):
+    if os.path.exists(path):
+        return
+    from helper_func.convert import WRITERS
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        WRITERS[fmt](synthetic_cues(seconds, dense), f)
+
+
+def media_path(name):
+    return os.path.join(MEDIA_DIR, name)
+
+
+def subtitle_name(source, subtitle):
+    return f"{source}.{subtitle}"
+
+
+def prepare_media(sources, with_video):
+    os.makedirs(MEDIA_DIR, exist_ok=True)
+    for source in sources:
+        width, height, seconds = SOURCES[source]
+        if with_video:
+            generate_video(media_path(f"{source}.mkv"), width, height, seconds)
+        for subtitle, (dense, fmt) in SUBTITLES.items():
+            generate_subtitle(media_path(subtitle_name(source, subtitle)), seconds, dense, fmt)
+    for fmt in {src for src, _ in CONVERSIONS}:
+        generate_subtitle(media_path(f"long.dense.{fmt}"), LONG_SUBTITLE_SECONDS, True, fmt)
+
+
+# --- Cases ------------------------------------------------------------------
+
+def build_cases(sources, presets, with_video):
+    """Every case of a run as {'name', 'kind', ...} dicts."""
+    cases = []
+    if with_video:
+        for source in sources:
+            # The full keyboard matrix on the heaviest subtitle
+            for codec in CODECS:
+                for preset in presets:
+                    for crf in CRFS:
+                        for resolution in RESOLUTIONS:
+                            settings = {"codec": codec, "preset": preset, "crf": crf, "resolution": resolution}
+                            cases.append({
+                                "name": f"hardmux/{source}/dense.ass/{codec}-{preset}-crf{crf}-{resolution}",
+                                "kind": "hardmux", "source": source, "subtitle": "dense.ass", "settings": settings,
+                            })
+            # Every subtitle at the default settings
+            for subtitle in SUBTITLES:
+                if subtitle != "dense.ass":
+                    cases.append({
+                        "name": f"hardmux/{source}/{subtitle}/default",
+                        "kind": "hardmux", "source": source, "subtitle": subtitle, "settings": DEFAULT_SETTINGS,
+                    })
+                cases.append({
+                    "name": f"softmux/{source}/{subtitle}",
+                    "kind": "softmux", "source": source, "subtitle": subtitle,
+                })
+            cases.append({"name": f"screenshots/{source}", "kind": "screenshots", "source": source})
+    for src, dst in CONVERSIONS:
+        cases.append({"name": f"convert/long.dense.{src}->{dst}", "kind": "convert", "src": src, "dst": dst})
+    return cases
+
+
+class NullMessage:
+    """Stands in for the pyrogram message the muxing functions edit and reply to."""
+
+    text = ""
+
+    async def edit(self, text):
+        self.text = text
+
+    async def reply_text(self, text):
+        pass
+
+    async def reply_photo(self, photo):
+        pass
+
+    async def reply_media_group(self, media):
+        pass
+
+
+async def run_case(case, work_dir):
+    """Run one case in this process, returning what it produced."""
+    from config import Config
+    from helper_func import ffmpeg
+
+    def stage(name):
+        dest = os.path.join(Config.DOWNLOAD_DIR, name)
+        shutil.copy(media_path(name), dest)
+        return name
+
+    if case["kind"] == "convert":
+        from helper_func.convert import convert_file
+        out = os.path.join(work_dir, f"out.{case['dst']}")
+        cues = convert_file(media_path(f"long.dense.{case['src']}"), out)
+        return {"ok": True, "output_size": os.path.getsize(out), "cues": cues}
+
+    width, height, seconds = SOURCES[case["source"]]
+    frames = seconds * FRAME_RATE
+    vid = stage(f"{case['source']}.mkv")
+    msg = NullMessage()
+
+    if case["kind"] == "screenshots":
+        shots = await ffmpeg.generate_screenshots(os.path.join(Config.DOWNLOAD_DIR, vid))
+        return {"ok": bool(shots), "output_size": sum(os.path.getsize(s) for s in shots)}
+
+    sub = stage(subtitle_name(case["source"], case["subtitle"]))
+    if case["kind"] == "softmux":
+        output = await ffmpeg.softmux_vid(vid, sub, msg)
+    else:
+        output = await ffmpeg.hardmux_vid(vid, sub, msg, dict(case["settings"]))
+    if not output:
+        return {"ok": False, "error": msg.text[-500:]}
+    return {"ok": True, "frames": frames, "output_size": os.path.getsize(os.path.join(Config.DOWNLOAD_DIR, output))}
+
+
+def worker(case):
+    """Entry point of the per-case process: isolate every cache, run, print the metrics as JSON."""
+    work_dir = tempfile.mkdtemp(prefix="muxbench_")
+    os.chdir(ROOT)
+    from config import Config
+    Config.DOWNLOAD_DIR = os.path.join(work_dir, "downloads")
+    Config.SUBTITLE_CACHE_DIR = os.path.join(Config.DOWNLOAD_DIR, "subs")
+    Config.STORE_DIR = os.path.join(Config.DOWNLOAD_DIR, "store")
+    # Progress edits must not make the encode wait for the edit interval
+    Config.EDIT_INTERVAL = 0
+    Config.MAX_EDITS_PER_SECOND = 1e6
+    os.makedirs(Config.DOWNLOAD_DIR)
+    from helper_func import dbhelper
+    dbhelper._db = dbhelper.Database(os.path.join(work_dir, "bench.sqlite"))
+
+    async def measure():
+        self_before = resource.getrusage(resource.RUSAGE_SELF)
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = time.perf_counter()
+        result = await run_case(case, work_dir)
+        wall = time.perf_counter() - start
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = sum(getattr(after, f) - getattr(before, f)
+                  for before, after in ((self_before, self_after), (children_before, children_after))
+                  for f in ("ru_utime", "ru_stime"))
+        result.update(wall_time=round(wall, 3), cpu_time=round(cpu, 3),
+                      peak_rss_kb=max(self_after.ru_maxrss, children_after.ru_maxrss))
+        if result.get("frames"):
+            result["fps"] = round(result.pop("frames") / wall, 2)
+        if result.get("cues"):
+            result["cues_per_s"] = round(result.pop("cues") / wall)
+        return result
+
+    try:
+        result = asyncio.run(measure())
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(json.dumps(result))
+
+
+def run_worker(case):
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "_case", json.dumps(case)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    try:
+        return json.loads(process.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        return {"ok": False, "error": process.stderr[-500:]}
+
+
+def combine(runs):
+    """Median of the timings over repeats, the worst peak memory."""
+    result = dict(runs[0])
+    for key in ("wall_time", "cpu_time", "fps", "cues_per_s"):
+        values = [r[key] for r in runs if key in r]
+        if values:
+            result[key] = round(statistics.median(values), 3)
+    result["peak_rss_kb"] = max(r.get("peak_rss_kb", 0) for r in runs)
+    result["repeats"] = len(runs)
+    return result
+
+
+def environment():
+    try:
+        ffmpeg = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout.splitlines()[0]
+    except (FileNotFoundError, IndexError):
+        ffmpeg = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except FileNotFoundError:
+        commit = None
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "ffmpeg": ffmpeg,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(args):
+    with_video = shutil.which("ffmpeg") is not None
+    if not with_video:
+        print("ffmpeg not found, only the conversion cases will run", file=sys.stderr)
+    sources = QUICK_SOURCES if args.quick else list(SOURCES)
+    presets = args.presets.split(",")
+    prepare_media(sources, with_video)
+
+    cases = build_cases(sources, presets, with_video)
+    if args.quick:
+        cases = [c for c in cases if c["kind"] != "hardmux" or "default" in c["name"]
+                 or c["settings"] == {**DEFAULT_SETTINGS, "preset": presets[0]}]
+    if args.only:
+        cases = [c for c in cases if args.only in c["name"]]
+
+    results = {}
+    for i, case in enumerate(cases, 1):
+        result = combine([run_worker(case) for _ in range(args.repeat)])
+        results[case["name"]] = result
+        status = f"{result['wall_time']:8.2f}s" if result.get("ok") else "  FAILED " + result.get("error", "")[-200:]
+        print(f"[{i}/{len(cases)}] {case['name']:<70} {status}", flush=True)
+
+    with open(args.output, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = 0
+    for name in sorted(set(baseline) | set(current)):
+        old, new = baseline.get(name), current.get(name)
+        if not old or not new:
+            print(f"{'only in ' + ('current' if new else 'baseline'):<14} {name}")
+            continue
+        if old.get("ok") and not new.get("ok"):
+            regressions += 1
+            print(f"{'FAILED':<14} {name}: {new.get('error', '')[-200:]}")
+            continue
+        changes = []
+        for metric, worse in METRICS.items():
+            if not old.get(metric) or metric not in new:
+                continue
+            change = (new[metric] - old[metric]) / old[metric]
+            if change * worse > args.threshold:
+                regressions += 1
+                changes.append(f"{metric} {old[metric]} -> {new[metric]} ({change:+.0%})")
+        if changes:
+            print(f"{'REGRESSION':<14} {name}: " + ", ".join(changes))
+
+    print(f"{regressions} regression(s) over {args.threshold:.0%} across {len(set(baseline) & set(current))} shared case(s)")
+    return 1 if regressions else 0
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "_case":
+        return worker(json.loads(sys.argv[2]))
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the suite")
+    run_parser.add_argument("--quick", action="store_true", help="480p only and the default settings")
+    run_parser.add_argument("--only", help="run the cases whose name contains this text")
+    run_parser.add_argument("--repeat", type=int, default=1, help="runs per case, timings are the median")
+    run_parser.add_argument("--presets", default="ultrafast", help="comma separated x264/x265 presets")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    compare_parser = commands.add_parser("compare", help="flag regressions between two runs")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+        return 0
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Compare encoding the resolution ladder one hardmux at a time against one ladder pass.
+
+Usage: python benchmarks/ladder_hardmux.py VIDEO SUBTITLE
+
+Both files are copied into Config.DOWNLOAD_DIR so hardmux_vid and
+hardmux_ladder see them the same way they do in the bot.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from helper_func.ffmpeg import hardmux_ladder, hardmux_vid
+from helper_func.planner import ladder_crf, resolution_map
+from segmented_hardmux import NullMessage
+
+
+def remove(filename):
+    path = os.path.join(Config.DOWNLOAD_DIR, filename)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+async def separate(vid, sub):
+    """One full hardmux per rendition, the way users had to cycle the resolution button."""
+    start = time.time()
+    sizes = {}
+    for name in resolution_map:
+        msg = NullMessage()
+        output = await hardmux_vid(vid, sub, msg, {"resolution": name, "crf": ladder_crf({}, name)})
+        if not output:
+            print(msg.text)
+            return None
+        sizes[name] = remove(output)
+    return time.time() - start, sizes
+
+
+async def ladder(vid, sub):
+    msg = NullMessage()
+    start = time.time()
+    outputs = await hardmux_ladder(vid, sub, msg, {"mode": "ladder"})
+    if not outputs:
+        print(msg.text)
+        return None
+    elapsed = time.time() - start
+    return elapsed, {name: remove(output) for name, output in outputs}
+
+
+async def main(video, subtitle):
+    os.makedirs(Config.DOWNLOAD_DIR, exist_ok=True)
+    vid = "bench_" + os.path.basename(video)
+    sub = "bench_" + os.path.basename(subtitle)
+    shutil.copy(video, os.path.join(Config.DOWNLOAD_DIR, vid))
+    shutil.copy(subtitle, os.path.join(Config.DOWNLOAD_DIR, sub))
+
+    try:
+        baseline = await separate(vid, sub)
+        result = await ladder(vid, sub)
+        if not baseline or not result:
+            return
+        for label, (elapsed, sizes) in (("separate", baseline), ("ladder", result)):
+            renditions = "  ".join(f"{name} {size / 1024 / 1024:.1f} MiB" for name, size in sizes.items())
+            print(f"{label:<10} {elapsed:8.1f}s  {renditions}")
+        print(f"speedup {baseline[0] / result[0]:.2f}x")
+    finally:
+        os.remove(os.path.join(Config.DOWNLOAD_DIR, vid))
+        os.remove(os.path.join(Config.DOWNLOAD_DIR, sub))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(__doc__)
+    asyncio.run(main(sys.argv[1], sys.argv[2]))
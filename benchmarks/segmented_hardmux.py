@@ -0,0 +1,80 @@
+"""Compare single-process and segmented hardmux wall time on a local episode.
+
+Usage: python benchmarks/segmented_hardmux.py VIDEO SUBTITLE [CHUNKS ...]
+
+Both files are copied into Config.DOWNLOAD_DIR so hardmux_vid sees them the
+same way it does in the bot.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from helper_func.ffmpeg import hardmux_vid
+
+
+class NullMessage:
+    """Stands in for the pyrogram message hardmux_vid edits with progress."""
+
+    text = ""
+
+    async def edit(self, text):
+        self.text = text
+
+    async def reply_text(self, text):
+        pass
+
+    async def reply_photo(self, photo):
+        pass
+
+    async def reply_media_group(self, media):
+        pass
+
+
+async def run(vid, sub, settings):
+    msg = NullMessage()
+    start = time.time()
+    output = await hardmux_vid(vid, sub, msg, settings)
+    elapsed = time.time() - start
+    if not output:
+        print(msg.text)
+        return None
+    path = os.path.join(Config.DOWNLOAD_DIR, output)
+    size = os.path.getsize(path)
+    os.remove(path)
+    return elapsed, size
+
+
+async def main(video, subtitle, chunk_counts):
+    os.makedirs(Config.DOWNLOAD_DIR, exist_ok=True)
+    vid = "bench_" + os.path.basename(video)
+    sub = "bench_" + os.path.basename(subtitle)
+    shutil.copy(video, os.path.join(Config.DOWNLOAD_DIR, vid))
+    shutil.copy(subtitle, os.path.join(Config.DOWNLOAD_DIR, sub))
+
+    try:
+        result = await run(vid, sub, {"mode": "single"})
+        if not result:
+            return
+        baseline = result[0]
+        print(f"single        {baseline:8.1f}s  {result[1] / 1024 / 1024:8.1f} MiB")
+        for chunks in chunk_counts:
+            Config.SEGMENTED_CHUNKS = chunks
+            result = await run(vid, sub, {"mode": "segmented"})
+            if result:
+                print(f"segmented x{chunks:<3} {result[0]:8.1f}s  {result[1] / 1024 / 1024:8.1f} MiB"
+                      f"  speedup {baseline / result[0]:.2f}x")
+    finally:
+        os.remove(os.path.join(Config.DOWNLOAD_DIR, vid))
+        os.remove(os.path.join(Config.DOWNLOAD_DIR, sub))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    counts = [int(c) for c in sys.argv[3:]] or [2, 4, os.cpu_count() or 1]
+    asyncio.run(main(sys.argv[1], sys.argv[2], counts))
@@ -0,0 +1,71 @@
+"""Cold-start time of the bot, up to the point it connects to Telegram.
+
+Usage:
+    python benchmarks/startup.py [--repeat N] [--target SECONDS]
+
+Every run starts a fresh interpreter in an empty working directory (its
+own database, download directory and ffmpeg capability cache) that imports
+muxbot and calls prepare(), and is timed from launch to exit. The first run
+has no capability cache and probes ffmpeg, the others read the cache like a
+restart would. Exits with status 1 when the median of the cached runs is
+over the target, STARTUP_TARGET by default.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Runs in the child, prints the time prepare() reported
+CHILD = "import asyncio, muxbot; print(muxbot.prepare(asyncio.new_event_loop()))"
+
+
+def run_once(work_dir):
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=work_dir, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": ROOT, "METRICS_PORT": "0"}
+    )
+    wall = time.perf_counter() - start
+    if process.returncode:
+        raise RuntimeError(process.stderr[-1000:])
+    return wall, float(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs with a warm capability cache")
+    parser.add_argument("--target", type=float, default=Config.STARTUP_TARGET)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="muxstart_")
+    # Plugins are found relative to the working directory, like when the bot runs from the repo
+    os.symlink(os.path.join(ROOT, "plugins"), os.path.join(work_dir, "plugins"))
+    os.symlink(os.path.join(ROOT, "fonts"), os.path.join(work_dir, "fonts"))
+    try:
+        cold, _ = run_once(work_dir)
+        runs = [run_once(work_dir) for _ in range(args.repeat)]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    wall = statistics.median(r[0] for r in runs)
+    prepared = statistics.median(r[1] for r in runs)
+    print(f"first start (probes ffmpeg): {cold:.3f}s")
+    print(f"restart, median of {len(runs)}: {wall:.3f}s to exit, {prepared:.3f}s in muxbot")
+    if wall > args.target:
+        print(f"over the {args.target}s target")
+        return 1
+    print(f"within the {args.target}s target")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
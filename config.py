@@ -19,3 +19,82 @@ class Config:
 
     # Download Directory
     DOWNLOAD_DIR = 'downloads'
+
+    # Fonts for hardmux and softmux attachments, the only fonts ffmpeg is shown
+    FONTS_DIR = os.path.join(os.getcwd(), 'fonts')
+
+    # Styled ASS files prepared for hardmux, reused by subtitle content and style
+    SUBTITLE_CACHE_DIR = os.path.join(DOWNLOAD_DIR, 'subs')
+    SUBTITLE_CACHE_FILES = int(os.environ.get('SUBTITLE_CACHE_FILES', 500))
+
+    # Downloads are kept here by source so a re-sent file is served from disk, up to MEDIA_STORE_MB
+    STORE_DIR = os.path.join(DOWNLOAD_DIR, 'store')
+    MEDIA_STORE_MB = int(os.environ.get('MEDIA_STORE_MB', 10240))
+
+    # Disk space always left free, work that doesn't fit waits up to STORAGE_WAIT seconds or is refused
+    MIN_FREE_MB = int(os.environ.get('MIN_FREE_MB', 1024))
+    STORAGE_WAIT = float(os.environ.get('STORAGE_WAIT', 600))
+
+    # Unowned files are removed by the janitor every JANITOR_INTERVAL seconds once older than
+    # ORPHAN_MAX_AGE, resumable partial downloads once older than PARTIAL_MAX_AGE
+    JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 1800))
+    ORPHAN_MAX_AGE = float(os.environ.get('ORPHAN_MAX_AGE', 3600))
+    PARTIAL_MAX_AGE = float(os.environ.get('PARTIAL_MAX_AGE', 86400))
+
+    # Parallel HTTP Range connections used for URL downloads
+    DOWNLOAD_CONNECTIONS = int(os.environ.get('DOWNLOAD_CONNECTIONS', 4))
+
+    # Number of encodes allowed to run at once, extra jobs wait in the queue
+    MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', max(1, (os.cpu_count() or 1) // 2)))
+
+    # Chunks the segmented hardmux mode splits a video into, 0 for one per CPU of the job's share
+    SEGMENTED_CHUNKS = int(os.environ.get('SEGMENTED_CHUNKS', 0))
+
+    # Capture screenshots from the encode's output frames instead of a second pass
+    INLINE_SCREENSHOTS = os.environ.get('INLINE_SCREENSHOTS', 'true').lower() == 'true'
+
+    # Upload a single-mode hardmux while it encodes, from fragmented MP4 output
+    PIPELINED_UPLOAD = os.environ.get('PIPELINED_UPLOAD', 'false').lower() == 'true'
+
+    # Start a single-mode hardmux while the video still downloads when its subtitle was sent first
+    PIPELINED_INGEST = os.environ.get('PIPELINED_INGEST', 'false').lower() == 'true'
+
+    # CRF of each rendition in the ladder mode as name:crf pairs
+    LADDER_CRF = dict(
+        pair.split(':', 1) for pair in os.environ.get('LADDER_CRF', '480p:21,720p:22,1080p:23').split(',') if ':' in pair
+    )
+
+    # Allow hardmux to upscale a source smaller than the chosen resolution
+    ALLOW_UPSCALE = os.environ.get('ALLOW_UPSCALE', 'false').lower() == 'true'
+
+    # Minimum seconds between edits in one chat, and edits per second across all chats
+    EDIT_INTERVAL = float(os.environ.get('EDIT_INTERVAL', 5))
+    MAX_EDITS_PER_SECOND = float(os.environ.get('MAX_EDITS_PER_SECOND', 20))
+
+    # User IDs allowed to use admin commands like /stats, comma separated, defaults to ALLOWED_USERS
+    ADMIN_USERS = [x.strip() for x in os.environ.get('ADMIN_USERS', ','.join(ALLOWED_USERS)).split(',')]
+
+    # Prometheus metrics are served on http://METRICS_HOST:METRICS_PORT/metrics, port 0 turns them off
+    METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.environ.get('METRICS_PORT', 9877))
+
+    # Number of user sessions kept in memory in front of the database
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 256))
+
+    # Level of the bot's own log messages, pyrogram's are kept at WARNING
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+    # Where the ffmpeg encoder and filter lists are cached between restarts
+    FFMPEG_CAPS_FILE = os.environ.get('FFMPEG_CAPS_FILE', 'ffmpeg_caps.json')
+
+    # Seconds from process start until the bot connects before startup is logged as slow
+    STARTUP_TARGET = float(os.environ.get('STARTUP_TARGET', 1.5))
+
+    # Preset new users start with; 'auto' (opt-in, here or in /set_preferences) picks one per job from the
+    # queue, cores and source length
+    DEFAULT_PRESET = os.environ.get('DEFAULT_PRESET', 'ultrafast')
+    # Encode time preset 'auto' aims for on an idle bot, shared with every job waiting behind it
+    ADAPTIVE_TARGET_SECONDS = float(os.environ.get('ADAPTIVE_TARGET_SECONDS', 600))
+
+    # Give each running job its own share of the CPUs and pin its ffmpeg processes to it
+    CPU_AFFINITY = os.environ.get('CPU_AFFINITY', 'true').lower() == 'true'
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+from typing import Dict, List, Optional, Set
+
+from config import Config
+from helper_func.planner import watermark_text
+
+logger = logging.getLogger(__name__)
+
+# Bump when the cached format changes
+CACHE_VERSION = 1
+
+# " V....D libx264  libx264 H.264 ..." and " TSC subtitles  V->V  Render text subtitles ..."
+ENCODER_LINE = re.compile(r"^ [A-Z.]{6} (\S+)")
+FILTER_LINE = re.compile(r"^ [A-Z.|]{3} (\S+)")
+
+
+def _names(output: str, pattern) -> Set[str]:
+    names = set()
+    for line in output.splitlines():
+        match = pattern.match(line)
+        if match and match.group(1) != "=":
+            names.add(match.group(1))
+    return names
+
+
+class FFmpegCapabilities:
+    """Encoders and filters of the installed ffmpeg.
+
+    Probed with `ffmpeg -encoders` and `-filters` once per binary: the result
+    is cached on disk keyed by the binary's path, mtime and size, so a
+    restart with the same ffmpeg doesn't run it again.
+    """
+
+    def __init__(self, binary: str = "ffmpeg", cache_path: Optional[str] = None):
+        self.binary = binary
+        self.cache_path = cache_path or Config.FFMPEG_CAPS_FILE
+        self.version: Optional[str] = None
+        self.encoders: Set[str] = set()
+        self.filters: Set[str] = set()
+        self.loaded = False
+
+    @property
+    def available(self) -> bool:
+        return self.version is not None
+
+    def _identity(self) -> Optional[Dict]:
+        path = shutil.which(self.binary)
+        if not path:
+            return None
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        return {"path": path, "mtime": stat.st_mtime_ns, "size": stat.st_size, "version": CACHE_VERSION}
+
+    def _read_cache(self) -> Optional[Dict]:
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _probe(self) -> Dict:
+        def run(*args):
+            return subprocess.run([self.binary, "-hide_banner", *args], capture_output=True, text=True,
+                                  timeout=30).stdout
+
+        version = run("-version").splitlines()
+        return {
+            "version": version[0] if version else "ffmpeg",
+            "encoders": sorted(_names(run("-encoders"), ENCODER_LINE)),
+            "filters": sorted(_names(run("-filters"), FILTER_LINE)),
+        }
+
+    def load(self) -> "FFmpegCapabilities":
+        """Read the cache, or probe ffmpeg when the binary changed (blocking, once per process)."""
+        if self.loaded:
+            return self
+        self.loaded = True
+        identity = self._identity()
+        if identity is None:
+            logger.error(f"{self.binary} not found, muxing will fail")
+            return self
+
+        cached = self._read_cache()
+        if cached and cached.get("identity") == identity:
+            data = cached
+        else:
+            try:
+                data = self._probe()
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error(f"Couldn't probe {self.binary}: {e}")
+                return self
+            try:
+                with open(self.cache_path, "w") as f:
+                    json.dump({"identity": identity, **data}, f)
+            except OSError as e:
+                logger.warning(f"Couldn't cache the ffmpeg capabilities: {e}")
+            logger.info(f"Probed {data['version']}: {len(data['encoders'])} encoders, {len(data['filters'])} filters")
+
+        self.version = data["version"]
+        self.encoders = set(data["encoders"])
+        self.filters = set(data["filters"])
+        return self
+
+    def has_encoder(self, name: str) -> bool:
+        """True when ffmpeg has the encoder, or when it couldn't be probed and a job will tell."""
+        return not self.available or name in self.encoders
+
+    def has_filter(self, name: str) -> bool:
+        return not self.available or name in self.filters
+
+    def check(self, user_settings) -> List[str]:
+        """What a hardmux with these settings needs and this ffmpeg lacks."""
+        self.load()
+        problems = []
+        codec = user_settings.get("codec", "libx264")
+        if not self.has_encoder(codec):
+            problems.append(f"This server's ffmpeg has no {codec} encoder.")
+        if not self.has_filter("subtitles"):
+            problems.append("This server's ffmpeg was built without libass (the subtitles filter).")
+        if watermark_text(user_settings) and not self.has_filter("drawtext"):
+            problems.append("This server's ffmpeg has no drawtext filter, turn the watermark off.")
+        return problems
+
+
+capabilities = FFmpegCapabilities()
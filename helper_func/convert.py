@@ -1,105 +1,417 @@
-from pyrogram import Client, filters
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+"""Streaming subtitle conversion between SRT, ASS, VTT and plain text.
+
+Parsers are generators over the lines of a file and writers consume cues one
+at a time, so converting a file holds a single cue in memory however long it
+is. Nothing here touches the bot, the conversions run in threads for single
+files and in a process pool for zip archives.
+"""
+import asyncio
+import multiprocessing
 import os
-import pysubs2
+import re
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
 
-app = Client("subtitle_bot")
+SAMPLE_SIZE = 64 * 1024  # Bytes looked at to detect the encoding
+MAX_MEMBER_SIZE = 64 * 1024 * 1024  # Larger files in a zip are skipped
+TXT_DURATION = 3000  # Milliseconds each plain text line stays on screen
+TXT_GAP = 1000  # Milliseconds between plain text lines
 
-# Track user states
-user_states = {}
+BOMS = (
+    (b"\xef\xbb\xbf", "utf-8-sig"),
+    (b"\xff\xfe", "utf-16"),
+    (b"\xfe\xff", "utf-16"),
+)
 
-# Command: /convert - Show format options
-@app.on_message(filters.command("convert"))
-async def start_conversion(client, message):
-    user_id = message.from_user.id
-    user_states[user_id] = {"waiting_for_format": True}  # Mark user as selecting format
+TIMING = re.compile(
+    r"(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})"
+)
+ASS_TIME = re.compile(r"(\d+):(\d{1,2}):(\d{1,2})[.:](\d{1,3})")
+ASS_OVERRIDE = re.compile(r"\{([^}]*)\}")
+ASS_TAG = re.compile(r"\\([ibus])([01])")
+HTML_TAG = re.compile(r"<(/?)([a-z]+)([^>]*)>", re.IGNORECASE)
+FONT_COLOR = re.compile(r'color\s*=\s*"?#?([0-9a-f]{6})', re.IGNORECASE)
+VTT_TIMESTAMP_TAG = re.compile(r"<\d{1,2}:\d{2}[:.][\d.]+>")
 
-    buttons = [
-        [InlineKeyboardButton("SRT ➝ ASS", callback_data="format_srt_ass")],
-        [InlineKeyboardButton("ASS ➝ SRT", callback_data="format_ass_srt")],
-        [InlineKeyboardButton("TXT ➝ ASS", callback_data="format_txt_ass")],
-    ]
+FORMATS = ("srt", "ass", "vtt", "txt")
+OUTPUT_FORMATS = ("srt", "ass", "vtt")
 
-    await message.reply_text(
-        "Select the subtitle format you want to convert:",
-        reply_markup=InlineKeyboardMarkup(buttons)
-    )
 
-# Handle format selection
-@app.on_callback_query(filters.regex("^format_"))
-async def handle_format_selection(client, callback_query: CallbackQuery):
-    user_id = callback_query.from_user.id
-    conversion_type = callback_query.data.replace("format_", "")
+class ConversionError(Exception):
+    """Raised for unsupported formats or files without a single cue."""
 
-    user_states[user_id] = {
-        "waiting_for_file": True,
-        "conversion_type": conversion_type
-    }
 
-    await callback_query.message.edit_text(
-        "Now, please send me the subtitle file you want to convert."
-    )
+class Cue:
+    """One subtitle event. Text uses \\n line breaks and <i>/<b>/<u>/<s>/<font color> tags."""
+
+    __slots__ = ("start", "end", "text")
+
+    def __init__(self, start: int, end: int, text: str):
+        self.start = start
+        self.end = end
+        self.text = text
+
+
+def detect_encoding(path: str) -> str:
+    """Encoding of a subtitle file from its BOM or its first SAMPLE_SIZE bytes."""
+    with open(path, "rb") as f:
+        head = f.read(SAMPLE_SIZE)
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if head.count(b"\x00") > len(head) // 4:
+        # UTF-16 without a BOM, ASCII text leaves every other byte zero
+        return "utf-16-le" if head[1::2].count(0) > head[0::2].count(0) else "utf-16-be"
+    try:
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is still UTF-8
+        if len(head) == SAMPLE_SIZE and e.start >= SAMPLE_SIZE - 3:
+            return "utf-8"
+    return "cp1252"
+
+
+def format_of(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip(".").lower().replace("ssa", "ass")
+
+
+def output_path(path: str, fmt: str) -> str:
+    """path with its extension swapped for fmt."""
+    return f"{os.path.splitext(path)[0]}.{fmt}"
+
+
+def _ms(hours, minutes, seconds, fraction) -> int:
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction.ljust(3, "0")[:3])
+
+
+# --- Parsers ---
+
+def parse_srt(lines: Iterable[str]) -> Iterator[Cue]:
+    """Cues of an SRT (or WebVTT) file; numbering, headers and notes are skipped."""
+    cue = None
+    text: List[str] = []
+    for line in lines:
+        line = line.rstrip("\r\n")
+        match = TIMING.search(line) if "-->" in line else None
+        if match and cue is not None:
+            # No blank line after the last cue, drop the number that was taken for text
+            if text and text[-1].strip().isdigit():
+                text.pop()
+            cue.text = "\n".join(text)
+            yield cue
+            cue, text = None, []
+        if cue is None:
+            if match:
+                g = match.groups()
+                cue = Cue(_ms(*g[:4]), _ms(*g[4:]), "")
+            continue
+        if line.strip():
+            text.append(line)
+            continue
+        cue.text = "\n".join(text)
+        yield cue
+        cue, text = None, []
+    if cue is not None:
+        cue.text = "\n".join(text)
+        yield cue
+
 
-# Handle subtitle file upload
-@app.on_message(filters.document)
-async def handle_subtitle(client, message):
-    user_id = message.from_user.id
-    user_data = user_states.get(user_id)
-
-    if not user_data or "waiting_for_file" not in user_data:
-        await message.reply_text("Please use /convert first and select a format before sending a file.")
-        return
-
-    # Download file
-    file_path = await message.download()
-    conversion_type = user_data["conversion_type"]
-
-    # Perform conversion
-    converted_file = None
-    if conversion_type == "srt_ass":
-        converted_file = convert_srt_to_ass(file_path)
-    elif conversion_type == "ass_srt":
-        converted_file = convert_ass_to_srt(file_path)
-    elif conversion_type == "txt_ass":
-        converted_file = convert_txt_to_ass(file_path)
-
-    # Send converted file if successful
-    if converted_file:
-        await message.reply_document(converted_file, caption="Here is your converted subtitle file.")
-        os.remove(converted_file)  # Cleanup after sending
-
-    os.remove(file_path)  # Remove original file
-    user_states.pop(user_id, None)  # Reset user state
-
-# Subtitle conversion functions using pysubs2
-def convert_srt_to_ass(srt_file):
-    subs = pysubs2.load(srt_file, encoding="utf-8")
-    output_file = srt_file.replace(".srt", ".ass")
-    subs.save(output_file, format="ass")
-    return output_file
-
-def convert_ass_to_srt(ass_file):
-    subs = pysubs2.load(ass_file, encoding="utf-8")
-    output_file = ass_file.replace(".ass", ".srt")
-    subs.save(output_file, format="srt")
-    return output_file
-
-def convert_txt_to_ass(txt_file):
-    with open(txt_file, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-
-    subs = pysubs2.Subs()
-    start_time = 0
-    duration = 3000  # Each line lasts 3 seconds
+def _keep_basic_tags(match) -> str:
+    """Keep the <i>, <b> and <u> tags WebVTT supports, drop every other tag."""
+    return match.group(0) if match.group(2).lower() in ("i", "b", "u") else ""
 
+
+def parse_vtt(lines: Iterable[str]) -> Iterator[Cue]:
+    """Cues of a WebVTT file with voice, class and timestamp tags removed."""
+    for cue in parse_srt(lines):
+        text = VTT_TIMESTAMP_TAG.sub("", cue.text)
+        cue.text = HTML_TAG.sub(_keep_basic_tags, text)
+        yield cue
+
+
+def _ass_to_text(text: str) -> str:
+    def override(match):
+        return "".join(f"<{'' if on == '1' else '/'}{tag}>" for tag, on in ASS_TAG.findall(match.group(1)))
+    text = ASS_OVERRIDE.sub(override, text)
+    return text.replace("\\N", "\n").replace("\\n", "\n").replace("\\h", " ")
+
+
+def parse_ass(lines: Iterable[str]) -> Iterator[Cue]:
+    """Dialogue events of an ASS/SSA file, in file order."""
+    fields = ["layer", "start", "end", "style", "name", "marginl", "marginr", "marginv", "effect", "text"]
+    in_events = False
+    for line in lines:
+        line = line.strip()
+        if line.startswith("["):
+            in_events = line.lower() == "[events]"
+            continue
+        if not in_events:
+            continue
+        key, _, value = line.partition(":")
+        key = key.strip().lower()
+        if key == "format":
+            fields = [f.strip().lower() for f in value.split(",")]
+        elif key == "dialogue":
+            values = value.lstrip().split(",", len(fields) - 1)
+            if len(values) < len(fields):
+                continue
+            event = dict(zip(fields, values))
+            start, end = ASS_TIME.match(event["start"].strip()), ASS_TIME.match(event["end"].strip())
+            if not start or not end:
+                continue
+            yield Cue(_ms(*start.groups()), _ms(*end.groups()), _ass_to_text(event["text"]))
+
+
+def parse_txt(lines: Iterable[str], duration: int = TXT_DURATION, gap: int = TXT_GAP) -> Iterator[Cue]:
+    """One cue per non-empty line, shown for `duration` ms with `gap` ms between them."""
+    start = 0
     for line in lines:
         text = line.strip()
         if text:
-            subs.append(pysubs2.Line(start=start_time, end=start_time + duration, text=text))
-            start_time += duration + 1000  # 1s gap between lines
+            yield Cue(start, start + duration, text)
+            start += duration + gap
+
+
+PARSERS = {"srt": parse_srt, "vtt": parse_vtt, "ass": parse_ass, "txt": parse_txt}
+
+
+# --- Writers ---
+
+def _srt_time(ms: int, sep: str = ",") -> str:
+    hours, ms = divmod(max(0, ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{sep}{ms:03d}"
+
+
+def _ass_time(ms: int) -> str:
+    cs = (max(0, ms) + 5) // 10
+    hours, cs = divmod(cs, 360000)
+    minutes, cs = divmod(cs, 6000)
+    seconds, cs = divmod(cs, 100)
+    return f"{hours}:{minutes:02d}:{seconds:02d}.{cs:02d}"
+
+
+def _text_to_ass(text: str) -> str:
+    def tag(match):
+        closing, name, attrs = match.group(1), match.group(2).lower(), match.group(3)
+        if name in ("i", "b", "u", "s"):
+            return f"{{\\{name}{0 if closing else 1}}}"
+        if name == "font":
+            if closing:
+                return "{\\c}"
+            color = FONT_COLOR.search(attrs)
+            if color:
+                rgb = color.group(1).upper()
+                return f"{{\\c&H{rgb[4:6]}{rgb[2:4]}{rgb[0:2]}&}}"
+        return ""
+    return HTML_TAG.sub(tag, text).replace("\n", "\\N")
+
+
+def ass_header(font_name: str = "Arial", font_size=20, primary: str = "&H00FFFFFF",
+               outline_colour: str = "&H00000000", outline=2) -> str:
+    """Script info and a Default style for converted subtitles."""
+    return (
+        "[Script Info]\n"
+        "ScriptType: v4.00+\n"
+        "WrapStyle: 0\n"
+        "ScaledBorderAndShadow: yes\n"
+        "PlayResX: 384\n"
+        "PlayResY: 288\n\n"
+        "[V4+ Styles]\n"
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, "
+        "Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n"
+        f"Style: Default,{font_name},{font_size},{primary},&H000000FF,{outline_colour},&H00000000,"
+        f"0,0,0,0,100,100,0,0,1,{outline},2,2,10,10,10,1\n\n"
+        "[Events]\n"
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n"
+    )
+
+
+def write_ass(cues: Iterable[Cue], out: TextIO, header: Optional[str] = None) -> int:
+    out.write(header or ass_header())
+    count = 0
+    for cue in cues:
+        out.write(f"Dialogue: 0,{_ass_time(cue.start)},{_ass_time(cue.end)},Default,,0,0,0,,{_text_to_ass(cue.text)}\n")
+        count += 1
+    return count
+
+
+def write_srt(cues: Iterable[Cue], out: TextIO, header: Optional[str] = None) -> int:
+    count = 0
+    for cue in cues:
+        count += 1
+        out.write(f"{count}\n{_srt_time(cue.start)} --> {_srt_time(cue.end)}\n{cue.text}\n\n")
+    return count
+
+
+def write_vtt(cues: Iterable[Cue], out: TextIO, header: Optional[str] = None) -> int:
+    out.write("WEBVTT\n\n")
+    count = 0
+    for cue in cues:
+        count += 1
+        text = HTML_TAG.sub(_keep_basic_tags, cue.text)
+        out.write(f"{_srt_time(cue.start, '.')} --> {_srt_time(cue.end, '.')}\n{text}\n\n")
+    return count
+
+
+WRITERS = {"srt": write_srt, "ass": write_ass, "vtt": write_vtt}
+
+
+def convert_file(src: str, dst: str, src_format: Optional[str] = None, dst_format: Optional[str] = None,
+                 header: Optional[str] = None) -> int:
+    """Convert src into dst (formats from the extensions by default). Returns the number of cues.
+
+    `header` replaces the default ASS script header and styles.
+    """
+    src_format = src_format or format_of(src)
+    dst_format = dst_format or format_of(dst)
+    if src_format not in PARSERS:
+        raise ConversionError(f"Can't read .{src_format} subtitles")
+    if dst_format not in WRITERS:
+        raise ConversionError(f"Can't write .{dst_format} subtitles")
+
+    encoding = detect_encoding(src)
+    with open(src, encoding=encoding, errors="replace", newline=None) as f_in, \
+            open(dst, "w", encoding="utf-8", newline="\n") as f_out:
+        count = WRITERS[dst_format](PARSERS[src_format](f_in), f_out, header)
+    if not count:
+        os.remove(dst)
+        raise ConversionError("No subtitles found")
+    return count
+
+
+# --- Batches ---
+
+def _convert_member(job: Tuple[str, str, str, Optional[str]]) -> Optional[str]:
+    """Convert one extracted file in a worker process, returning the error if it failed."""
+    src, dst, dst_format, header = job
+    try:
+        convert_file(src, dst, dst_format=dst_format, header=header)
+        return None
+    except (ConversionError, OSError, ValueError) as e:
+        return str(e)
+
+
+def _archive_name(name: str) -> str:
+    """A zip member path with absolute parts and '..' removed."""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+def convert_zip(zip_path: str, out_path: str, dst_format: str, src_formats: Iterable[str] = FORMATS,
+                workers: Optional[int] = None, header: Optional[str] = None) -> Tuple[int, List[str]]:
+    """Convert every subtitle of src_formats in a zip into a new zip, one file per process.
+
+    Returns (number converted, error messages). Members are extracted under
+    numbered names and written back under their cleaned archive path, so a
+    member can't write outside the working directory.
+    """
+    src_formats = set(src_formats)
+    errors: List[str] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs, names = [], []
+        with zipfile.ZipFile(zip_path) as archive:
+            for index, member in enumerate(archive.infolist()):
+                name = _archive_name(member.filename)
+                if member.is_dir() or not name or format_of(name) not in src_formats:
+                    continue
+                if member.file_size > MAX_MEMBER_SIZE:
+                    errors.append(f"{name}: larger than {MAX_MEMBER_SIZE // 2 ** 20} MiB, skipped")
+                    continue
+                src = os.path.join(tmp, f"{index}.{format_of(name)}")
+                with archive.open(member) as f_in, open(src, "wb") as f_out:
+                    while chunk := f_in.read(1024 * 1024):
+                        f_out.write(chunk)
+                jobs.append((src, output_path(src, dst_format), dst_format, header))
+                names.append(name)
+
+        if not jobs:
+            raise ConversionError("No subtitle files found in the archive")
+
+        # Spawned workers don't inherit the bot's threads, sockets or database connection
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(min(len(jobs), workers or os.cpu_count() or 1), mp_context=context) as pool:
+            results = list(pool.map(_convert_member, jobs, chunksize=max(1, len(jobs) // 64)))
+
+        converted = 0
+        with zipfile.ZipFile(out_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for (_, dst, _, _), name, error in zip(jobs, names, results):
+                if error:
+                    errors.append(f"{name}: {error}")
+                    continue
+                archive.write(dst, output_path(name, dst_format))
+                converted += 1
+    return converted, errors
+
+
+async def convert(src: str, dst_format: str, header: Optional[str] = None) -> Tuple[str, int]:
+    """Convert a file next to itself off the event loop. Returns (output path, cues)."""
+    dst = output_path(src, dst_format)
+    if dst == src:
+        raise ConversionError(f"The file is already .{dst_format}")
+    count = await asyncio.to_thread(convert_file, src, dst, None, dst_format, header)
+    return dst, count
+
+
+async def convert_archive(zip_path: str, dst_format: str, src_formats: Iterable[str] = FORMATS,
+                          header: Optional[str] = None) -> Tuple[str, int, List[str]]:
+    """Convert a zip of subtitles off the event loop. Returns (output zip, converted, errors)."""
+    out_path = f"{os.path.splitext(zip_path)[0]}_{dst_format}.zip"
+    converted, errors = await asyncio.to_thread(convert_zip, zip_path, out_path, dst_format, src_formats, None, header)
+    return out_path, converted, errors
+
+
+if __name__ == "__main__":
+    # Benchmark: this module against pysubs2 on a synthetic SRT, wall time and peak Python memory
+    import sys
+    import time
+    import tracemalloc
+
+    cues = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    def measure(fn):
+        """Wall time of a plain run, then peak memory of a traced run (tracing slows it down)."""
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "bench.srt")
+        with open(src, "w", encoding="utf-8") as f:
+            for i in range(cues):
+                f.write(f"{i + 1}\n{_srt_time(i * 200)} --> {_srt_time(i * 200 + 150)}\n"
+                        f"<i>Line {i}</i> of the benchmark\nsecond line\n\n")
+        print(f"{cues} cues, {os.path.getsize(src) / 2 ** 20:.1f} MiB SRT")
+
+        for dst_format in ("ass", "vtt"):
+            elapsed, peak = measure(lambda: convert_file(src, os.path.join(tmp, f"out.{dst_format}")))
+            print(f"convert    srt->{dst_format}  {elapsed:6.2f}s  peak {peak / 2 ** 20:7.1f} MiB")
 
-    output_file = txt_file.replace(".txt", ".ass")
-    subs.save(output_file, format="ass")
-    return output_file
+        try:
+            import pysubs2
+        except ImportError:
+            print("pysubs2 not installed, skipping the baseline")
+        else:
+            def baseline():
+                pysubs2.load(src, encoding="utf-8").save(os.path.join(tmp, "baseline.ass"), format_="ass")
+            elapsed, peak = measure(baseline)
+            print(f"pysubs2    srt->ass  {elapsed:6.2f}s  peak {peak / 2 ** 20:7.1f} MiB")
 
-app.run()
+        zip_path = os.path.join(tmp, "batch.zip")
+        with zipfile.ZipFile(zip_path, "w") as archive:
+            for i in range(os.cpu_count() or 1):
+                archive.write(src, f"episode_{i:02d}.srt")
+        for workers in (1, os.cpu_count() or 1):
+            start = time.perf_counter()
+            convert_zip(zip_path, os.path.join(tmp, f"batch_{workers}.zip"), "ass", workers=workers)
+            print(f"zip x{os.cpu_count() or 1} files, {workers} worker(s)  {time.perf_counter() - start:6.2f}s")
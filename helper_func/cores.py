@@ -0,0 +1,107 @@
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus() -> List[int]:
+    """CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split(cpus: List[int], parts: int) -> List[List[int]]:
+    """cpus in `parts` contiguous runs differing in length by at most one.
+
+    Neighbouring CPU numbers usually share a cache, so a job keeps its
+    threads close together. With more parts than CPUs they take turns.
+    """
+    if parts <= len(cpus):
+        size, extra = divmod(len(cpus), parts)
+        runs, start = [], 0
+        for i in range(parts):
+            end = start + size + (i < extra)
+            runs.append(cpus[start:end])
+            start = end
+        return runs
+    return [[cpus[i % len(cpus)]] for i in range(parts)]
+
+
+def _pin(pid: int, cpus: List[int]) -> None:
+    """Move every thread of a running process onto cpus."""
+    try:
+        tids = [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        tids = [pid]
+    for tid in tids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except OSError:
+            pass  # The thread or process already exited
+
+
+class CorePartitioner:
+    """Splits the CPUs among running jobs and pins each job's ffmpeg children to its share.
+
+    Jobs are added and removed as they take and free a queue slot, and every
+    change re-partitions and re-pins the processes still running. ffmpeg's
+    thread counts are fixed when it starts, so a job whose share shrinks
+    keeps its threads, now packed onto fewer CPUs.
+    """
+
+    def __init__(self, cpus: Optional[List[int]] = None, enabled: bool = True):
+        self.cpus = cpus or available_cpus()
+        self.enabled = enabled and hasattr(os, "sched_setaffinity")
+        self._shares: Dict[object, List[int]] = {}
+
+    def add(self, job) -> None:
+        self._shares[job] = []
+        self._rebalance()
+
+    def remove(self, job) -> None:
+        if self._shares.pop(job, None) is not None:
+            self._rebalance()
+
+    def _rebalance(self) -> None:
+        jobs = list(self._shares)
+        for job, cpus in zip(jobs, split(self.cpus, len(jobs)) if jobs else []):
+            if cpus == self._shares[job]:
+                continue
+            self._shares[job] = cpus
+            if self.enabled:
+                for process in list(job.processes):
+                    if process.returncode is None:
+                        _pin(process.pid, cpus)
+        logger.debug(f"CPU shares: {[(job.user_id, cpus) for job, cpus in self._shares.items()]}")
+
+    def share(self, job) -> Optional[List[int]]:
+        """The job's CPUs, None when partitioning is off or the job holds no slot."""
+        if not self.enabled or job is None:
+            return None
+        return self._shares.get(job) or None
+
+    def thread_args(self, job) -> List[str]:
+        """Global ffmpeg options keeping the filter graph's threads within the job's share.
+
+        libass and drawtext run on the filter threads; a quarter of the share
+        leaves the rest to the encoder.
+        """
+        cpus = self.share(job)
+        if not cpus:
+            return []
+        threads = str(max(1, len(cpus) // 4))
+        return ['-filter_threads', threads, '-filter_complex_threads', threads]
+
+    def preexec(self, job) -> Optional[Callable[[], None]]:
+        """A preexec_fn pinning a child before it execs, so every thread it starts inherits the mask."""
+        cpus = self.share(job)
+        if not cpus:
+            return None
+        return lambda: os.sched_setaffinity(0, cpus)
+
+
+core_partition = CorePartitioner(enabled=Config.CPU_AFFINITY)
@@ -1,28 +1,101 @@
+import asyncio
+import concurrent.futures
+import queue
 import sqlite3
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, Callable, List
 import json
 import logging
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()]
-)
+import time
 
 logger = logging.getLogger(__name__)
 
+# Most operations one transaction may group together
+MAX_BATCH = 256
+
 class Database:
-    """A SQLite database handler for managing muxbot user data."""
+    """A SQLite database handler for managing muxbot user data.
+
+    The connection lives on a dedicated thread. Every call is queued to that
+    thread and awaited, so the event loop never blocks on SQLite; writes that
+    queue up while a transaction is being committed are grouped into the next
+    single commit.
+    """
 
     def __init__(self, db_path: str = "muxdb.sqlite"):
-        """Initialize the database connection."""
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
-        self.setup()
+        """Start the database thread and open the connection."""
+        self.db_path = db_path
+        self._queue = queue.Queue()
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._worker, name="sqlite", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        # WAL lets readers run alongside the writer and makes commits an append instead of a rewrite
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _worker(self) -> None:
+        try:
+            conn = self._connect()
+            self._setup(conn)
+        except sqlite3.Error as e:
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
 
-    def setup(self) -> None:
-        """Set up the database table if it doesn't exist."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < MAX_BATCH:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # Finish this batch, then stop
+                    break
+                batch.append(item)
+
+            results = []
+            for fn, future in batch:
+                try:
+                    results.append((future, fn(conn), None))
+                except Exception as e:
+                    results.append((future, None, e))
+            try:
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Commit failed: {e}")
+                results = [(future, None, e) for future, _, _ in results]
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        conn.close()
+
+    def _submit(self, fn: Callable[[sqlite3.Connection], Any]) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        self._queue.put((fn, future))
+        return future
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run fn(conn) on the database thread and await its result."""
+        return await asyncio.wrap_future(self._submit(fn))
+
+    def _setup(self, conn: sqlite3.Connection) -> None:
+        """Set up the database tables if they don't exist."""
         cmd = """
         CREATE TABLE IF NOT EXISTS muxbot (
             user_id INTEGER PRIMARY KEY,
@@ -31,158 +104,289 @@ class Database:
             filename TEXT,
             encoding_settings TEXT
         );
+        CREATE TABLE IF NOT EXISTS probe_cache (
+            key TEXT PRIMARY KEY,
+            info TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS media_store (
+            key TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS result_cache (
+            key TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            created REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            outcome TEXT NOT NULL,
+            started REAL NOT NULL,
+            duration REAL NOT NULL,
+            spans TEXT NOT NULL,
+            bytes_in INTEGER NOT NULL DEFAULT 0,
+            bytes_out INTEGER NOT NULL DEFAULT 0,
+            fps REAL,
+            cpu REAL,
+            preset TEXT,
+            threads INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS jobs_started ON jobs (started);
         """
         try:
-            self.conn.execute(cmd)
-            self.conn.commit()
+            conn.executescript(cmd)
+            # Columns added after the table was first created
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("preset", "TEXT"), ("threads", "INTEGER")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            conn.commit()
         except sqlite3.Error as e:
             logger.error(f"Error setting up database: {e}")
             raise
 
-    def _execute_query(self, query: str, params: tuple = ()) -> Optional[sqlite3.Row]:
+    async def _fetch_one(self, query: str, params: tuple = ()) -> Optional[sqlite3.Row]:
         """Execute a query and return the first result."""
+        def fetch(conn):
+            return conn.execute(query, params).fetchone()
         try:
-            cursor = self.conn.execute(query, params)
-            result = cursor.fetchone()
-            cursor.close()
-            return result
+            return await self._run(fetch)
         except sqlite3.Error as e:
             logger.error(f"Query error: {e}")
             return None
 
-    def put_video(self, user_id: int, vid_name: str, filename: str) -> bool:
-        """Store or update video filename for a user."""
-        res = self._execute_query("SELECT * FROM muxbot WHERE user_id = ?", (user_id,))
-        if res:
-            query = "UPDATE muxbot SET vid_name = ?, filename = ? WHERE user_id = ?"
-            params = (vid_name, filename, user_id)
-        else:
-            query = "INSERT INTO muxbot (user_id, vid_name, filename) VALUES (?, ?, ?)"
-            params = (user_id, vid_name, filename)
+    async def _fetch_all(self, query: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Execute a query and return every result."""
+        def fetch(conn):
+            return conn.execute(query, params).fetchall()
+        try:
+            return await self._run(fetch)
+        except sqlite3.Error as e:
+            logger.error(f"Query error: {e}")
+            return []
 
+    async def _write(self, query: str, params: tuple, what: str) -> bool:
+        """Execute a write, committed together with whatever else is queued."""
         try:
-            self.conn.execute(query, params)
-            self.conn.commit()
+            await self._run(lambda conn: conn.execute(query, params))
             return True
         except sqlite3.Error as e:
-            logger.error(f"Error storing video: {e}")
+            logger.error(f"Error storing {what}: {e}")
             return False
 
-    def put_sub(self, user_id: int, sub_name: str) -> bool:
+    async def put_video(self, user_id: int, vid_name: str, filename: str) -> bool:
+        """Store or update video filename for a user."""
+        return await self._write(
+            "INSERT INTO muxbot (user_id, vid_name, filename) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET vid_name = excluded.vid_name, filename = excluded.filename",
+            (user_id, vid_name, filename), "video"
+        )
+
+    async def put_sub(self, user_id: int, sub_name: str) -> bool:
         """Store or update subtitle filename for a user."""
-        res = self._execute_query("SELECT * FROM muxbot WHERE user_id = ?", (user_id,))
-        if res:
-            query = "UPDATE muxbot SET sub_name = ? WHERE user_id = ?"
-            params = (sub_name, user_id)
-        else:
-            query = "INSERT INTO muxbot (user_id, sub_name, vid_name, filename, encoding_settings) VALUES (?, ?, '', '', '')"
-            params = (user_id, sub_name)
+        return await self._write(
+            "INSERT INTO muxbot (user_id, sub_name, vid_name, filename, encoding_settings) VALUES (?, ?, '', '', '') "
+            "ON CONFLICT(user_id) DO UPDATE SET sub_name = excluded.sub_name",
+            (user_id, sub_name), "subtitle"
+        )
 
-        try:
-            self.conn.execute(query, params)
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"Error storing subtitle: {e}")
-            return False
+    async def get_session(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get the whole row of a user in one query."""
+        res = await self._fetch_one("SELECT * FROM muxbot WHERE user_id = ?", (user_id,))
+        return dict(res) if res else None
+
+    async def list_session_files(self) -> List[str]:
+        """Names of every video and subtitle a user session still points at."""
+        rows = await self._fetch_all("SELECT vid_name, sub_name FROM muxbot")
+        return [name for row in rows for name in (row["vid_name"], row["sub_name"]) if name]
 
-    def check_sub(self, user_id: int) -> bool:
+    async def check_sub(self, user_id: int) -> bool:
         """Check if a subtitle file exists for the user."""
-        res = self._execute_query("SELECT sub_name FROM muxbot WHERE user_id = ?", (user_id,))
+        res = await self._fetch_one("SELECT sub_name FROM muxbot WHERE user_id = ?", (user_id,))
         return bool(res and res["sub_name"])
 
-    def check_video(self, user_id: int) -> bool:
+    async def check_video(self, user_id: int) -> bool:
         """Check if a video file exists for the user."""
-        res = self._execute_query("SELECT vid_name FROM muxbot WHERE user_id = ?", (user_id,))
+        res = await self._fetch_one("SELECT vid_name FROM muxbot WHERE user_id = ?", (user_id,))
         return bool(res and res["vid_name"])
 
-    def get_vid_filename(self, user_id: int) -> Optional[str]:
+    async def get_vid_filename(self, user_id: int) -> Optional[str]:
         """Get the video filename for a user."""
-        res = self._execute_query("SELECT vid_name FROM muxbot WHERE user_id = ?", (user_id,))
+        res = await self._fetch_one("SELECT vid_name FROM muxbot WHERE user_id = ?", (user_id,))
         return res["vid_name"] if res else None
 
-    def get_sub_filename(self, user_id: int) -> Optional[str]:
+    async def get_sub_filename(self, user_id: int) -> Optional[str]:
         """Get the subtitle filename for a user."""
-        res = self._execute_query("SELECT sub_name FROM muxbot WHERE user_id = ?", (user_id,))
+        res = await self._fetch_one("SELECT sub_name FROM muxbot WHERE user_id = ?", (user_id,))
         return res["sub_name"] if res else None
 
-    def get_filename(self, user_id: int) -> Optional[str]:
+    async def get_filename(self, user_id: int) -> Optional[str]:
         """Get the final filename for a user."""
-        res = self._execute_query("SELECT filename FROM muxbot WHERE user_id = ?", (user_id,))
+        res = await self._fetch_one("SELECT filename FROM muxbot WHERE user_id = ?", (user_id,))
         return res["filename"] if res else None
 
-    def set_encoding_settings(self, user_id: int, settings: Dict[str, Any]) -> bool:
+    async def set_encoding_settings(self, user_id: int, settings: Dict[str, Any]) -> bool:
         """Store encoding settings for a user as a JSON string."""
-        settings_str = json.dumps(settings)
-        res = self._execute_query("SELECT * FROM muxbot WHERE user_id = ?", (user_id,))
-        if res:
-            query = "UPDATE muxbot SET encoding_settings = ? WHERE user_id = ?"
-            params = (settings_str, user_id)
-        else:
-            query = "INSERT INTO muxbot (user_id, encoding_settings) VALUES (?, ?)"
-            params = (user_id, settings_str)
+        return await self._write(
+            "INSERT INTO muxbot (user_id, encoding_settings) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET encoding_settings = excluded.encoding_settings",
+            (user_id, json.dumps(settings)), "settings"
+        )
 
+    async def get_probe(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached media probe record by file key."""
+        res = await self._fetch_one("SELECT info FROM probe_cache WHERE key = ?", (key,))
+        if not res:
+            return None
         try:
-            self.conn.execute(query, params)
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"Error storing settings: {e}")
-            return False
+            return json.loads(res["info"])
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding probe record: {e}")
+            return None
 
-    def get_encoding_settings(self, user_id: int) -> Dict[str, Any]:
-        """Get encoding settings for a user with default values (480p, 720p, 1080p only)."""
-        res = self._execute_query("SELECT encoding_settings FROM muxbot WHERE user_id = ?", (user_id,))
-        
-        # Default settings
-        defaults = {
-            "crf": "23",
-            "preset": "ultrafast",
-            "codec": "libx264",  # Default H.264
-            "resolution": "720p",  # Default resolution
-            "font_size": "20"
-        }
-
-        if res and res["encoding_settings"]:
-            try:
-                settings = json.loads(res["encoding_settings"])
-                
-                # ✅ Ensure only allowed resolutions (480p, 720p, 1080p)
-                if settings.get("resolution") not in ["480p", "720p", "1080p"]:
-                    settings["resolution"] = "720p"
+    async def put_probe(self, key: str, info: Dict[str, Any]) -> bool:
+        """Cache a media probe record under a file key."""
+        return await self._write(
+            "INSERT INTO probe_cache (key, info, created) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET info = excluded.info, created = excluded.created",
+            (key, json.dumps(info), time.time()), "probe record"
+        )
+
+    async def get_media(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a media store entry by source key."""
+        res = await self._fetch_one("SELECT * FROM media_store WHERE key = ?", (key,))
+        return dict(res) if res else None
+
+    async def put_media(self, key: str, name: str, size: int) -> bool:
+        """Record a file kept in the media store."""
+        return await self._write(
+            "INSERT INTO media_store (key, name, size, last_used) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET name = excluded.name, size = excluded.size, last_used = excluded.last_used",
+            (key, name, size, time.time()), "media entry"
+        )
+
+    async def touch_media(self, key: str) -> bool:
+        """Mark a media store entry as just used."""
+        return await self._write("UPDATE media_store SET last_used = ? WHERE key = ?", (time.time(), key), "media use")
+
+    async def list_media(self) -> List[Dict[str, Any]]:
+        """All media store entries, least recently used first."""
+        return [dict(row) for row in await self._fetch_all("SELECT * FROM media_store ORDER BY last_used")]
+
+    async def delete_media(self, key: str) -> bool:
+        """Forget a media store entry."""
+        return await self._write("DELETE FROM media_store WHERE key = ?", (key,), "media removal")
+
+    async def get_results(self, key: str) -> List[Dict[str, Any]]:
+        """Get the uploaded files of a job key, stored as key or key:<part>, in upload order."""
+        rows = await self._fetch_all(
+            "SELECT * FROM result_cache WHERE key = ? OR key LIKE ? ORDER BY created, key", (key, f"{key}:%")
+        )
+        return [dict(row) for row in rows]
+
+    async def put_result(self, key: str, file_id: str, file_name: str) -> bool:
+        """Remember the Telegram file of an uploaded encode."""
+        return await self._write(
+            "INSERT INTO result_cache (key, file_id, file_name, created) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET file_id = excluded.file_id, file_name = excluded.file_name, "
+            "created = excluded.created",
+            (key, file_id, file_name, time.time()), "result"
+        )
+
+    async def delete_result(self, key: str) -> bool:
+        """Forget the uploaded files of a job key."""
+        return await self._write(
+            "DELETE FROM result_cache WHERE key = ? OR key LIKE ?", (key, f"{key}:%"), "result removal"
+        )
+
+    async def put_job(self, job: Dict[str, Any]) -> bool:
+        """Append a finished job's timings to the history."""
+        return await self._write(
+            "INSERT INTO jobs (user_id, kind, outcome, started, duration, spans, bytes_in, bytes_out, fps, cpu, "
+            "preset, threads) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job["user_id"], job["kind"], job["outcome"], job["started"], job["duration"], json.dumps(job["spans"]),
+             job["bytes_in"], job["bytes_out"], job["fps"], job["cpu"], job["preset"], job["threads"]), "job"
+        )
 
-                return {**defaults, **settings}  # Merge user settings with defaults
-            except json.JSONDecodeError as e:
-                logger.error(f"Error decoding settings: {e}")
+    async def list_jobs(self, since: float) -> List[Dict[str, Any]]:
+        """Jobs started after `since`, oldest first, with their spans decoded."""
+        rows = await self._fetch_all("SELECT * FROM jobs WHERE started >= ? ORDER BY started", (since,))
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["spans"] = json.loads(job["spans"])
+            jobs.append(job)
+        return jobs
 
-        return defaults  # Return default if no settings found
+    async def clear_files(self, user_id: int) -> bool:
+        """Forget a user's files but keep their encoding settings."""
+        return await self._write(
+            "UPDATE muxbot SET vid_name = NULL, sub_name = NULL, filename = NULL WHERE user_id = ?",
+            (user_id,), "cleared files"
+        )
 
-    def erase(self, user_id: int) -> bool:
+    async def erase(self, user_id: int) -> bool:
         """Delete all data for a user."""
-        try:
-            self.conn.execute("DELETE FROM muxbot WHERE user_id = ?", (user_id,))
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            logger.error(f"Error erasing data: {e}")
-            return False
+        return await self._write("DELETE FROM muxbot WHERE user_id = ?", (user_id,), "erase")
 
     def close(self) -> None:
-        """Close the database connection."""
-        try:
-            self.conn.close()
-        except sqlite3.Error as e:
-            logger.error(f"Error closing database connection: {e}")
+        """Flush queued work and stop the database thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+_db: Optional[Database] = None
+
+def get_db() -> Database:
+    """The shared Database instance, created on first use."""
+    global _db
+    if _db is None:
+        _db = Database()
+    return _db
 
 if __name__ == "__main__":
-    # Example usage
-    db = Database()
-    db.put_video(123, "test.mp4", "output.mp4")
-    db.put_sub(123, "test.srt")
-    print(db.get_vid_filename(123))
-    print(db.get_sub_filename(123))
-    print(db.get_encoding_settings(123))
-    db.set_encoding_settings(123, {"crf": "23", "preset": "ultrafast"})
-    print(db.get_encoding_settings(123))
-    db.erase(123)
-    db.close()
+    # Micro-benchmark: the old SELECT + UPDATE/INSERT + commit per call against this class
+    import os
+    import tempfile
+
+    OPS = 2000
+
+    def legacy(path):
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE muxbot (user_id INTEGER PRIMARY KEY, vid_name TEXT, sub_name TEXT, "
+                     "filename TEXT, encoding_settings TEXT)")
+        start = time.perf_counter()
+        for i in range(OPS):
+            user_id = i % 50
+            if conn.execute("SELECT * FROM muxbot WHERE user_id = ?", (user_id,)).fetchone():
+                conn.execute("UPDATE muxbot SET vid_name = ?, filename = ? WHERE user_id = ?", (f"{i}.mp4", "out.mp4", user_id))
+            else:
+                conn.execute("INSERT INTO muxbot (user_id, vid_name, filename) VALUES (?, ?, ?)", (user_id, f"{i}.mp4", "out.mp4"))
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        conn.close()
+        return elapsed
+
+    async def current(path, concurrency):
+        db = Database(path)
+        start = time.perf_counter()
+
+        async def user(n):
+            for i in range(n, OPS, concurrency):
+                await db.put_video(i % 50, f"{i}.mp4", "out.mp4")
+
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        db.close()
+        return elapsed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        elapsed = legacy(os.path.join(tmp, "legacy.sqlite"))
+        print(f"legacy select+upsert+commit    {OPS / elapsed:10.0f} ops/sec")
+        for concurrency in (1, 10, 50):
+            elapsed = asyncio.run(current(os.path.join(tmp, f"wal_{concurrency}.sqlite"), concurrency))
+            print(f"WAL upsert, {concurrency:>2} concurrent users {OPS / elapsed:10.0f} ops/sec")
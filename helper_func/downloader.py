@@ -0,0 +1,312 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import unquote
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+MIN_SEGMENT_SIZE = 16 * 1024 * 1024  # Don't split files smaller than this per connection
+STATE_SAVE_INTERVAL = 2  # Seconds between resume state flushes
+
+
+class DownloadError(Exception):
+    """Raised when a URL can't be downloaded after all retries."""
+
+
+class RangeIgnored(DownloadError):
+    """Raised when a server answers a Range request with something other than that range."""
+
+
+class UrlInfo:
+    """What the server told us about a URL before downloading it."""
+
+    def __init__(self, url: str, size: int, filename: str, accept_ranges: bool, etag: Optional[str]):
+        self.url = url
+        self.size = size
+        self.filename = filename
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+
+
+class ConnectionStats:
+    """Bytes and time spent by a single HTTP connection."""
+
+    def __init__(self, index: int, start: int, end: int):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.bytes = 0
+        self.seconds = 0.0
+        self.retries = 0
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second for this connection."""
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (f"<Connection {self.index} bytes={self.bytes} "
+                f"speed={round(self.throughput / 1024 / 1024, 2)}MiB/s retries={self.retries}>")
+
+
+def _filename_from_response(url: str, headers) -> str:
+    if "content-disposition" in headers:
+        res = re.search(r'filename="(.*?)"', headers["content-disposition"])
+        if res:
+            return res.group(1)
+    return unquote(url.split("?")[0].split("/")[-1])
+
+
+def probe_url(url: str, timeout: int = 30) -> UrlInfo:
+    """Fetch size, filename and range support of a URL (blocking, run it off the loop)."""
+    with requests.get(url, stream=True, allow_redirects=True, timeout=timeout,
+                      headers={"Range": "bytes=0-0"}) as r:
+        if r.status_code == 206:
+            total = r.headers.get("content-range", "").rsplit("/", 1)[-1]
+            size = int(total) if total.isdigit() else 0
+            accept_ranges = bool(size)
+        elif r.status_code == 200:
+            size = int(r.headers.get("content-length", 0))
+            accept_ranges = r.headers.get("accept-ranges", "").lower() == "bytes"
+        else:
+            raise DownloadError(f"Server returned HTTP {r.status_code}")
+        return UrlInfo(r.url, size, _filename_from_response(url, r.headers),
+                       accept_ranges, r.headers.get("etag"))
+
+
+def partial_path(directory: str, url: str, ext: str) -> str:
+    """Stable location of an unfinished download, so a retry resumes it."""
+    digest = hashlib.sha1(url.encode()).hexdigest()[:16]
+    return os.path.join(directory, f"{digest}.{ext}.part")
+
+
+class Downloader:
+    """Download a URL to disk on worker threads, using parallel Range requests when possible."""
+
+    def __init__(self, info: UrlInfo, path: str, connections: int = 4, retries: int = 3, timeout: int = 30):
+        self.info = info
+        self.path = path
+        self.state_path = path + ".state"
+        self.retries = retries
+        self.timeout = timeout
+        # Cleared when the server turns out to ignore Range after all
+        self.ranged = info.accept_ranges
+        self.downloaded = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_save = 0.0
+
+        if info.accept_ranges and info.size:
+            count = max(1, min(connections, info.size // MIN_SEGMENT_SIZE))
+        else:
+            count = 1
+        self.segments = self._load_state() or self._split(count)
+        self.stats = [ConnectionStats(i, start, end) for i, (start, end, _) in enumerate(self.segments)]
+        self.downloaded = sum(done for _, _, done in self.segments)
+
+    def _split(self, count: int) -> List[list]:
+        size = self.info.size
+        if not size:
+            return [[0, -1, 0]]
+        step = size // count
+        bounds = [i * step for i in range(count)] + [size]
+        return [[bounds[i], bounds[i + 1] - 1, 0] for i in range(count)]
+
+    def _load_state(self) -> Optional[List[list]]:
+        """Reuse the segment progress of an earlier attempt on the same file."""
+        if not (self.ranged and os.path.exists(self.state_path) and os.path.exists(self.path)):
+            return None
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("size") != self.info.size or state.get("etag") != self.info.etag:
+            return None
+        logger.info(f"Resuming {self.path} from {sum(s[2] for s in state['segments'])} bytes")
+        return state["segments"]
+
+    def _save_state(self, force: bool = False) -> None:
+        if not self.ranged:
+            return
+        now = time.time()
+        if not force and now - self._last_save < STATE_SAVE_INTERVAL:
+            return
+        self._last_save = now
+        with open(self.state_path, "w") as f:
+            json.dump({"url": self.info.url, "size": self.info.size,
+                       "etag": self.info.etag, "segments": self.segments}, f)
+
+    def _fetch_segment(self, index: int) -> None:
+        segment = self.segments[index]
+        stats = self.stats[index]
+        for attempt in range(self.retries + 1):
+            start, end, done = segment
+            if end >= 0 and start + done > end:
+                return
+            headers = {}
+            if self.ranged:
+                headers["Range"] = f"bytes={start + done}-{end if end >= 0 else ''}"
+            else:
+                # No range support, so a retry has to start over
+                segment[2] = 0
+                with self._lock:
+                    self.downloaded -= done
+                done = 0
+            began = time.time()
+            try:
+                with requests.get(self.info.url, headers=headers, stream=True, timeout=self.timeout) as r:
+                    if headers and r.status_code == 200:
+                        # The whole file from byte 0, writing it at this segment's offset would corrupt it
+                        raise RangeIgnored(f"Server ignored the range of connection {index}")
+                    if r.status_code != (206 if headers else 200):
+                        raise DownloadError(f"Server returned HTTP {r.status_code}")
+                    content_range = r.headers.get("content-range")
+                    if headers and content_range and not content_range.startswith(f"bytes {start + done}-"):
+                        raise RangeIgnored(f"Server sent {content_range} for {headers['Range']}")
+                    with open(self.path, "r+b") as f:
+                        f.seek(start + done)
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            if self._stop.is_set():
+                                return
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            f.flush()
+                            segment[2] += len(chunk)
+                            stats.bytes += len(chunk)
+                            with self._lock:
+                                self.downloaded += len(chunk)
+                                self._save_state()
+                return
+            except RangeIgnored:
+                raise
+            except (requests.RequestException, DownloadError, OSError) as e:
+                stats.retries += 1
+                logger.warning(f"Connection {index} failed (attempt {attempt + 1}): {e}")
+                if attempt == self.retries:
+                    raise DownloadError(str(e)) from e
+                time.sleep(min(2 ** attempt, 10))
+            finally:
+                stats.seconds += time.time() - began
+
+    def _prepare_file(self) -> None:
+        if not os.path.exists(self.path) or not self.downloaded:
+            with open(self.path, "wb") as f:
+                if self.info.size:
+                    f.truncate(self.info.size)
+
+    def _restart_single(self) -> None:
+        """Start over from byte 0 on one connection without Range requests."""
+        self.ranged = False
+        self._stop.clear()
+        self.segments = [[0, self.info.size - 1 if self.info.size else -1, 0]]
+        self.stats = [ConnectionStats(0, self.segments[0][0], self.segments[0][1])]
+        self.downloaded = 0
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    async def run(self, progress=None, progress_args=(), interval: float = 1) -> List[ConnectionStats]:
+        """Download the file, awaiting progress(current, total, *progress_args) every interval seconds."""
+        await asyncio.to_thread(self._prepare_file)
+        try:
+            await self._fetch_all(progress, progress_args, interval)
+        except RangeIgnored as e:
+            logger.warning(f"{e}, downloading {self.path} again over one connection")
+            self._restart_single()
+            await self._fetch_all(progress, progress_args, interval)
+
+        if self.info.size and self.downloaded != self.info.size:
+            raise DownloadError(f"Incomplete download: {self.downloaded} of {self.info.size} bytes")
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+        return self.stats
+
+    async def _fetch_all(self, progress, progress_args, interval: float) -> None:
+        tasks = [asyncio.create_task(asyncio.to_thread(self._fetch_segment, i)) for i in range(len(self.segments))]
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=interval, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if task.exception():
+                        raise task.exception()
+                if progress and self.info.size:
+                    await progress(self.downloaded, self.info.size, *progress_args)
+        except BaseException:
+            self._stop.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._save_state(force=True)
+            raise
+
+
+if __name__ == "__main__":
+    # Self check against a local Range capable http.server stand-in
+    import tempfile
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    class RangeHandler(SimpleHTTPRequestHandler):
+        ignore_range = False
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = self.translate_path(self.path)
+            size = os.path.getsize(path)
+            start, end = 0, size - 1
+            match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+            if match and not self.ignore_range:
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else end
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            with open(path, "rb") as f:
+                f.seek(start)
+                try:
+                    self.wfile.write(f.read(end - start + 1))
+                except BrokenPipeError:
+                    pass  # The client dropped a response it couldn't use
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.mkv")
+        with open(source, "wb") as f:
+            f.write(os.urandom(64 * 1024 * 1024))
+
+        handler = lambda *a, **kw: RangeHandler(*a, directory=tmp, **kw)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/source.mkv"
+
+        info = probe_url(url)
+        target = partial_path(tmp, url, "mkv")
+        start = time.time()
+        stats = asyncio.run(Downloader(info, target, connections=4).run())
+        print(f"Downloaded {info.size} bytes in {round(time.time() - start, 2)}s")
+        for s in stats:
+            print(s)
+        with open(source, "rb") as a, open(target, "rb") as b:
+            assert a.read() == b.read(), "Downloaded file differs from source"
+
+        # A server that advertises ranges but answers every request with the whole file
+        RangeHandler.ignore_range = True
+        os.remove(target)
+        stats = asyncio.run(Downloader(info, target, connections=4).run())
+        print(f"Range ignored: fell back to {len(stats)} connection(s)")
+        with open(source, "rb") as a, open(target, "rb") as b:
+            assert a.read() == b.read(), "Downloaded file differs from source"
+        server.shutdown()
@@ -1,42 +1,106 @@
-from pyrogram import Client, filters
+import asyncio
+import logging
 import os
-import subprocess
-
-app = Client("subtitle_bot")
-
-# Dictionary to track users waiting for a video file
-waiting_for_video = {}
-
-# Command: /extract
-@app.on_message(filters.command("extract"))
-async def extract_subtitle_command(client, message):
-    user_id = message.from_user.id
-    waiting_for_video[user_id] = True  # Mark user as waiting for a file
-    await message.reply_text("📂 Please send me a video file, and I'll extract the subtitles.")
-
-# Handle video file upload
-@app.on_message(filters.video | filters.document)
-async def handle_video(client, message):
-    user_id = message.from_user.id
-    if user_id not in waiting_for_video or not waiting_for_video[user_id]:
-        await message.reply_text("❌ Please use /extract first before sending a video file.")
-        return
-
-    # Download video
-    video_path = await message.download()
-    subtitle_path = video_path.rsplit(".", 1)[0] + ".srt"  # Save subtitle as .srt
-
-    # Extract subtitles using ffmpeg
-    extract_command = f'ffmpeg -i "{video_path}" -map 0:s:0 "{subtitle_path}"'
-    process = subprocess.run(extract_command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    if process.returncode == 0:
-        await message.reply_document(subtitle_path, caption="✅ Subtitle extracted successfully!")
-        os.remove(subtitle_path)  # Cleanup
-    else:
-        await message.reply_text("❌ No subtitles found in the video.")
-
-    os.remove(video_path)  # Cleanup
-    waiting_for_video.pop(user_id, None)  # Remove from waiting list
-
-app.run()
+import re
+import zipfile
+from typing import Any, Dict, List, Optional
+
+from helper_func.probe import probe
+from helper_func.utils import drain_stderr
+
+logger = logging.getLogger(__name__)
+
+# File extension and ffmpeg codec of every subtitle codec; "copy" keeps the stream as it is
+TRACK_FORMATS = {
+    "ass": ("ass", "copy"),
+    "ssa": ("ass", "copy"),
+    "subrip": ("srt", "copy"),
+    "srt": ("srt", "copy"),
+    "webvtt": ("vtt", "copy"),
+    "hdmv_pgs_subtitle": ("sup", "copy"),
+    "dvd_subtitle": ("mks", "copy"),
+    "dvb_subtitle": ("mks", "copy"),
+    # MP4 text tracks have no file format of their own
+    "mov_text": ("srt", "srt"),
+    "text": ("srt", "srt"),
+}
+
+# Container for anything not listed above, Matroska takes every subtitle codec
+FALLBACK_FORMAT = ("mks", "copy")
+
+
+class ExtractionError(Exception):
+    """Raised when a video has no subtitles or ffmpeg fails to demux them."""
+
+
+class SubtitleTrack:
+    """One subtitle stream of a video and the file it is extracted to."""
+
+    def __init__(self, index: int, codec: Optional[str], language: Optional[str] = None,
+                 title: Optional[str] = None):
+        self.index = index
+        self.codec = codec
+        self.language = language
+        self.title = title
+        self.ext, self.output_codec = TRACK_FORMATS.get(codec or "", FALLBACK_FORMAT)
+
+    @classmethod
+    def from_stream(cls, stream: Dict[str, Any]) -> "SubtitleTrack":
+        return cls(stream["index"], stream.get("codec"), stream.get("language"), stream.get("title"))
+
+    def file_name(self, base: str) -> str:
+        """e.g. 'Show.03.eng.Signs.ass'; the stream index keeps tracks with the same tags apart."""
+        parts = [base, str(self.index)] + [p for p in (self.language, self.title) if p]
+        name = ".".join(parts)
+        return re.sub(r'[\\/:*?"<>|\s]+', "_", name)[:120] + f".{self.ext}"
+
+    def describe(self) -> str:
+        tags = " ".join(p for p in (self.language, self.title) if p)
+        return f"#{self.index} {self.codec or 'unknown'}" + (f" ({tags})" if tags else "")
+
+
+def extract_command(vid: str, outputs: List[tuple]) -> List[str]:
+    """One ffmpeg run writing every (track, path) in outputs."""
+    command = ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-v', 'error', '-i', vid]
+    for track, path in outputs:
+        command += ['-map', f'0:{track.index}', '-c', track.output_codec, path]
+    return command
+
+
+async def extract_subtitles(vid: str, out_dir: str, base: Optional[str] = None) -> List[tuple]:
+    """Demux every subtitle track of vid into out_dir in one pass. Returns [(track, path)]."""
+    info = await probe(vid)
+    if info is None:
+        raise ExtractionError("Couldn't read the video.")
+    tracks = [SubtitleTrack.from_stream(s) for s in info.subtitle_streams]
+    if not tracks:
+        raise ExtractionError("No subtitle tracks found in the video.")
+
+    base = base or os.path.splitext(os.path.basename(vid))[0]
+    os.makedirs(out_dir, exist_ok=True)
+    outputs = [(track, os.path.join(out_dir, track.file_name(base))) for track in tracks]
+
+    process = await asyncio.create_subprocess_exec(
+        *extract_command(vid, outputs),
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    error_log = await drain_stderr(process)
+    await process.wait()
+    if process.returncode != 0:
+        logger.error(f"Subtitle extraction failed for {vid}: {error_log}")
+        raise ExtractionError(error_log.strip().splitlines()[-1] if error_log.strip() else "ffmpeg failed")
+
+    # ffmpeg leaves nothing behind for a track with no packets
+    extracted = [(track, path) for track, path in outputs if os.path.exists(path) and os.path.getsize(path)]
+    if not extracted:
+        raise ExtractionError("The subtitle tracks are empty.")
+    return extracted
+
+
+def archive_tracks(paths: List[str], zip_path: str) -> str:
+    """Zip extracted tracks (blocking)."""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for path in paths:
+            archive.write(path, os.path.basename(path))
+    return zip_path
@@ -1,145 +1,470 @@
 import os
+import shutil
 import time
 import asyncio
-import re
 from config import Config
-from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from helper_func.probe import probe
+from helper_func.cores import available_cpus, core_partition
+from helper_func.job_queue import job_queue
+from helper_func.planner import choose_encoding, plan_hardmux, plan_ladder, resolution_map
+from helper_func.ingest import tee_to_process
+from helper_func.message_updater import updater
+from helper_func.metrics import span
+from helper_func.pipelined_upload import FRAGMENT_ARGS
+from helper_func.styling import configure_fonts, prepare_subtitles
+from helper_func.utils import PROGRESS_ARGS, drain_stderr, read_progress, safe_edit_message
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto
 
-progress_pattern = re.compile(r'(frame|fps|size|time|bitrate|speed)\s*\=\s*(\S+)')
+# Every ffmpeg started from here only sees the fonts in Config.FONTS_DIR
+configure_fonts()
 
-def parse_progress(line):
-    return {key: value for key, value in progress_pattern.findall(line)}
+async def probe_duration(path):
+    """Duration of a media file in seconds, 0 when ffprobe can't tell."""
+    info = await probe(path)
+    return info.duration if info else 0.0
 
-async def readlines(stream):
-    pattern = re.compile(br'[\r\n]+')
-    data = bytearray()
-    while not stream.at_eof():
-        lines = pattern.split(data)
-        data[:] = lines.pop(-1)
-        for line in lines:
-            yield line
-        data.extend(await stream.read(1024))
+def screenshot_times(duration, num_screenshots=5):
+    """Evenly spaced timestamps across the video, avoiding the very start and end."""
+    if not duration:
+        return [i * 10 for i in range(num_screenshots)]
+    step = duration / (num_screenshots + 1)
+    return [round(step * (i + 1), 3) for i in range(num_screenshots)]
 
-async def safe_edit_message(msg, text):
-    try:
-        await msg.edit(text)
-    except Exception as e:
-        if "messages.EditMessage" in str(e):
-            await asyncio.sleep(10)
-            try:
-                await msg.edit(text)
-            except Exception as retry_error:
-                print(f"Retry failed: {retry_error}")
-
-async def read_stderr(start, msg, process):
-    error_log = []
-    last_edit_time = time.time()
-
-    async for line in readlines(process.stderr):
-        line = line.decode('utf-8')
-        error_log.append(line)
-        progress = parse_progress(line)
-        
-        if progress and (time.time() - last_edit_time >= 10):
-            text = f"🔄 **Processing...**\nSize: {progress.get('size', 'N/A')}\nTime: {progress.get('time', 'N/A')}\nSpeed: {progress.get('speed', 'N/A')}"
-            await safe_edit_message(msg, text)
-            last_edit_time = time.time()
-
-    return "\n".join(error_log)
-
-async def generate_screenshots(video_path, num_screenshots=5):
-    """Generate multiple screenshots at fixed intervals."""
-    screenshot_paths = []
-
-    for i in range(num_screenshots):
-        timestamp = i * 10  # Take a screenshot every 10 seconds
-        screenshot_filename = f"{os.path.splitext(os.path.basename(video_path))[0]}_screenshot_{i+1}.jpg"
-        screenshot_path = os.path.join(Config.DOWNLOAD_DIR, screenshot_filename)
+def screenshot_path(video_path, index):
+    screenshot_filename = f"{os.path.splitext(os.path.basename(video_path))[0]}_screenshot_{index}.jpg"
+    return os.path.join(Config.DOWNLOAD_DIR, screenshot_filename)
+
+def remove_files(paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def hardmux_output(vid_filename):
+    return f"{os.path.splitext(vid_filename)[0]}_hardmuxed.mp4"
+
+def ladder_output(vid_filename, name):
+    return f"{os.path.splitext(vid_filename)[0]}_hardmuxed_{name}.mp4"
+
+def hardmux_outputs(vid_filename, num_screenshots=5):
+    """Every path a hardmux of vid_filename may write, for storage ownership."""
+    out_location = os.path.join(Config.DOWNLOAD_DIR, hardmux_output(vid_filename))
+    ladder = [os.path.join(Config.DOWNLOAD_DIR, ladder_output(vid_filename, name)) for name in resolution_map]
+    return [out_location, out_location + ".segments", *ladder,
+            *(screenshot_path(path, i + 1) for path in [out_location, *ladder] for i in range(num_screenshots))]
 
+def inline_screenshot_args(video_path, duration, num_screenshots=5):
+    """Filter and output arguments that grab screenshots from the encode's own output frames.
+
+    Returns (filter_suffix, output_args): the suffix splits the filtered video
+    into [main] and [shots] pads, output_args writes the [shots] pad as JPEGs.
+    """
+    interval = duration / (num_screenshots + 1)
+    select = f"if(isnan(prev_selected_t),gte(t,{interval}),gte(t-prev_selected_t,{interval}))"
+    filter_suffix = f",split=2[main][shots];[shots]select='{select}'[shot]"
+    pattern = screenshot_path(video_path, "%d")
+    output_args = ['-map', '[shot]', '-frames:v', str(num_screenshots), '-fps_mode', 'vfr', '-q:v', '2', '-y', pattern]
+    return filter_suffix, output_args
+
+def collect_screenshots(video_path, num_screenshots=5):
+    """Paths of the screenshots an inline capture wrote."""
+    paths = [screenshot_path(video_path, i + 1) for i in range(num_screenshots)]
+    return [path for path in paths if os.path.exists(path)]
+
+async def generate_screenshots(video_path, num_screenshots=5, duration=None):
+    """Generate screenshots spread over the whole video with concurrent input seeks."""
+    if duration is None:
+        duration = await probe_duration(video_path)
+
+    async def grab(index, timestamp):
+        path = screenshot_path(video_path, index + 1)
+        # -ss before -i seeks on the demuxer, so each grab only decodes from the nearest keyframe
         command = [
             'ffmpeg', '-hide_banner', '-ss', str(timestamp), '-i', video_path,
-            '-frames:v', '1', '-q:v', '2', '-y', screenshot_path
+            '-frames:v', '1', '-q:v', '2', '-y', path
         ]
-
         process = await asyncio.create_subprocess_exec(
             *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
         )
         stdout, stderr = await process.communicate()
 
-        if process.returncode == 0 and os.path.exists(screenshot_path):
-            screenshot_paths.append(screenshot_path)
-        else:
-            print(f"⚠️ Screenshot {i+1} failed: {stderr.decode()}")
+        if process.returncode == 0 and os.path.exists(path):
+            return path
+        print(f"⚠️ Screenshot {index + 1} failed: {stderr.decode()}")
+        return None
 
-    return screenshot_paths
+    times = screenshot_times(duration, num_screenshots)
+    results = await asyncio.gather(*(grab(i, t) for i, t in enumerate(times)))
+    return [path for path in results if path]
 
 async def send_screenshots(msg, screenshots):
-    """Send screenshots as images instead of URL buttons."""
+    """Send all screenshots as a single media group."""
     if screenshots:
-        await msg.reply_text("📸 **Screenshots Generated:**")
-        for screenshot in screenshots:
-            await msg.reply_photo(screenshot)
+        media = [InputMediaPhoto(path) for path in screenshots[:10]]
+        media[0].caption = "📸 **Screenshots Generated:**"
+        await msg.reply_media_group(media)
+
+async def softmux_vid(vid_filename, sub_filename, msg, job=None):
+    """Add the subtitle as a new track without re-encoding the video or audio."""
+    start = time.time()
+    vid = os.path.join(Config.DOWNLOAD_DIR, vid_filename)
+    sub = os.path.join(Config.DOWNLOAD_DIR, sub_filename)
+    vid_ext = os.path.splitext(vid_filename)[1].lower()
+    sub_ext = os.path.splitext(sub_filename)[1].lower()
+
+    # MP4 can only carry plain text subs (mov_text), ASS styling and fonts need MKV
+    if vid_ext == '.mp4' and sub_ext == '.srt':
+        output = f"{os.path.splitext(vid_filename)[0]}_softmuxed.mp4"
+        sub_codec = 'mov_text'
+    else:
+        output = f"{os.path.splitext(vid_filename)[0]}_softmuxed.mkv"
+        sub_codec = 'ass' if sub_ext == '.ass' else 'srt'
+    out_location = os.path.join(Config.DOWNLOAD_DIR, output)
+
+    command = ['ffmpeg', '-hide_banner', *PROGRESS_ARGS, '-i', vid, '-i', sub]
+    if sub_codec == 'ass':
+        fonts = sorted(f for f in os.listdir(Config.FONTS_DIR) if f.lower().endswith(('.ttf', '.otf')))
+        for i, font in enumerate(fonts):
+            command += [
+                '-attach', os.path.join(Config.FONTS_DIR, font),
+                f'-metadata:s:t:{i}', 'mimetype=application/x-truetype-font'
+            ]
+    command += [
+        '-map', '0:v', '-map', '0:a?', '-map', '1:0',
+        '-c', 'copy', '-c:s', sub_codec, '-disposition:s:0', 'default',
+        '-y', out_location
+    ]
+
+    returncode, error_output = await run_with_progress(command, msg, await probe_duration(vid), job)
+
+    if job and job.cancelled:
+        remove_files([out_location])
+        await safe_edit_message(msg, '🚫 **Softmux Cancelled!**')
+        return False
+    if returncode == 0:
+        updater.update(msg, f'✅ **Softmux Completed!**\n⏳ Time: {round(time.time() - start)}s')
+        return output
+    else:
+        remove_files([out_location])
+        trimmed_error = error_output[-3000:] if len(error_output) > 3000 else error_output
+        await safe_edit_message(msg, f'❌ **Softmux Failed!**\n\nError:\n```{trimmed_error}```')
+        return False
+
+async def spawn(command, job=None, **kwargs):
+    """Start an ffmpeg owned by job, confined to the job's share of the CPUs."""
+    command = [command[0], *core_partition.thread_args(job), *command[1:]]
+    process = await asyncio.create_subprocess_exec(*command, preexec_fn=core_partition.preexec(job), **kwargs)
+    if job:
+        job.attach(process)
+    return process
+
+async def run_ffmpeg(command, job=None):
+    """Run an ffmpeg command to completion, returning (returncode, stderr)."""
+    process = await spawn(command, job, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+    try:
+        error_output = await drain_stderr(process)
+        await process.wait()
+    finally:
+        if job:
+            job.detach(process)
+    return process.returncode, error_output
+
+async def run_with_progress(command, msg, duration=0, job=None):
+    """Run an ffmpeg command that has PROGRESS_ARGS, reporting to msg. Returns (returncode, stderr)."""
+    process = await spawn(command, job, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+    try:
+        error_output = await read_progress(msg, process, duration)
+        await process.wait()
+    finally:
+        if job:
+            job.detach(process)
+    return process.returncode, error_output
+
+def adapt_encoding(user_settings, info, job=None, renditions=None):
+    """The settings with preset 'auto' resolved for the current load, recorded on the job's trace.
+
+    A job with its own CPU share encodes with one thread per CPU of it,
+    whatever the preset. A ladder passes the renditions plan_ladder kept,
+    they split the job's threads and all count towards the encode time.
+    Without a job (a dry run) the numbers are for a job starting now.
+    """
+    settings = dict(user_settings)
+    stats = job_queue.stats()
+    cpus = core_partition.share(job)
+    if cpus:
+        cores, running = len(cpus), 1
+    else:
+        cores, running = os.cpu_count() or 1, stats["running"] + (0 if job else 1)
+
+    sizes = [r.size or resolution_map[r.name] for r in renditions] if renditions else None
+    threads = len(cpus) if cpus else None
+    if settings.get("preset") == "auto":
+        settings["preset"], threads = choose_encoding(info, settings, cores, running, stats["waiting"], sizes)
+    mode = settings.get("mode", "single")
+    # Segmented chunks split their own threads
+    if threads and mode == "single":
+        settings["threads"] = threads
+    elif threads and mode == "ladder" and renditions:
+        settings["threads"] = max(1, threads // len(renditions))
+    if job:
+        job.trace.preset = settings.get("preset", "ultrafast")
+        job.trace.threads = settings.get("threads")
+    return settings
+
+async def hardmux_segmented(vid, out_location, msg, plan, job=None, chunks=None):
+    """Burn subtitles by encoding keyframe aligned chunks of the video in parallel.
+
+    The video is split with stream copy at keyframes, every chunk is shifted
+    back onto the source timeline for the subtitles filter, encoded in its own
+    ffmpeg process, then the chunks are concatenated losslessly with the
+    source audio. At most one chunk per CPU of the job's share encodes at a
+    time. Returns (ok, error_output).
+    """
+    cpus = core_partition.share(job)
+    # Without partitioning every slot gets an equal part of the machine
+    parallel = len(cpus) if cpus else max(1, len(available_cpus()) // job_queue.slots)
+    chunks = chunks or Config.SEGMENTED_CHUNKS or parallel
+    duration = await probe_duration(vid)
+    if not duration:
+        return False, "Could not read the video duration for a segmented encode."
+    # MP4 tags like hvc1 are rejected by the Matroska chunks, the tag goes on the final MP4 only
+    codec_args, tag_args = list(plan.codec_args), []
+    if '-tag:v' in codec_args:
+        index = codec_args.index('-tag:v')
+        tag_args = codec_args[index:index + 2]
+        del codec_args[index:index + 2]
+
+    work_dir = out_location + ".segments"
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        segment_list = os.path.join(work_dir, "segments.csv")
+        returncode, error = await run_ffmpeg([
+            'ffmpeg', '-hide_banner', '-i', vid, '-map', '0:v:0', '-c', 'copy',
+            '-f', 'segment', '-segment_time', str(max(1.0, duration / chunks)),
+            '-reset_timestamps', '1', '-segment_list', segment_list, '-segment_list_type', 'csv',
+            '-y', os.path.join(work_dir, 'src_%03d.mkv')
+        ], job)
+        if returncode != 0:
+            return False, error
+
+        segments = []
+        with open(segment_list) as f:
+            for line in f:
+                name, seg_start, _ = line.strip().rsplit(',', 2)
+                segments.append((os.path.join(work_dir, name), float(seg_start)))
+        if not segments:
+            return False, "Splitting the video produced no segments."
+
+        running = asyncio.Semaphore(parallel)
+        threads = max(1, parallel // min(parallel, len(segments)))
+        video_filter = plan.video_filter
+        done = 0
 
-async def hardmux_vid(vid_filename, sub_filename, msg, user_settings={}):
+        async def encode(index, seg_path, seg_start):
+            nonlocal done
+            encoded = os.path.join(work_dir, f'enc_{index:03d}.mkv')
+            async with running:
+                result = await run_ffmpeg([
+                    'ffmpeg', '-hide_banner', '-i', seg_path,
+                    # Shift onto the source timeline so subtitle cues line up, then back to zero
+                    '-vf', f"setpts=PTS+{seg_start}/TB,{video_filter},setpts=PTS-STARTPTS",
+                    *codec_args, '-threads', str(threads), '-an', '-y', encoded
+                ], job)
+            done += 1
+            updater.update(msg, f"🔄 **Processing...**\nChunks encoded: {done}/{len(segments)}")
+            return result
+
+        results = await asyncio.gather(*(encode(i, p, t) for i, (p, t) in enumerate(segments)))
+        for returncode, error in results:
+            if returncode != 0:
+                return False, error
+
+        concat_list = os.path.join(work_dir, 'concat.txt')
+        with open(concat_list, 'w') as f:
+            for i in range(len(segments)):
+                # The concat demuxer resolves entries against the list's own directory
+                f.write(f"file 'enc_{i:03d}.mkv'\n")
+
+        returncode, error = await run_ffmpeg([
+            'ffmpeg', '-hide_banner', '-f', 'concat', '-safe', '0', '-i', concat_list,
+            '-i', vid, '-map', '0:v', '-map', '1:a?', '-c', 'copy',
+            *tag_args,
+            '-y', out_location
+        ], job)
+        return returncode == 0, error
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+async def hardmux_vid(vid_filename, sub_filename, msg, user_settings={}, job=None, fragmented=False):
+    """Burn subtitles into one output; fragmented writes an MP4 that can be uploaded while it grows."""
     start = time.time()
     vid = os.path.join(Config.DOWNLOAD_DIR, vid_filename)
     sub = os.path.join(Config.DOWNLOAD_DIR, sub_filename)
-    output = f"{os.path.splitext(vid_filename)[0]}_hardmuxed.mp4"
+    output = hardmux_output(vid_filename)
     out_location = os.path.join(Config.DOWNLOAD_DIR, output)
 
-    font_path = os.path.join(os.getcwd(), "fonts", "HelveticaRounded-Bold.ttf")
+    font_path = os.path.join(Config.FONTS_DIR, "HelveticaRounded-Bold.ttf")
     if not os.path.exists(font_path):
         await safe_edit_message(msg, "❌ Font not found! Place 'HelveticaRounded-Bold.ttf' in 'fonts' folder.")
         return False
 
-    # Ensure subtitle path is correctly formatted
-    formatted_sub = f'"{sub}"'  # Always use double quotes
-
-    # ✅ Allow user-defined encoding settings
-    codec = user_settings.get("codec", "libx264")
-    preset = user_settings.get("preset", "ultrafast")
-    crf = user_settings.get("crf", "20")
-    font_size = user_settings.get("font_size", Config.FONT_SIZE)
-
-    # ✅ Allow dynamic resolution (480p, 720p, 1080p)
-    resolution_map = {
-        "480p": "scale=854:480",
-        "720p": "scale=1280:720",
-        "1080p": "scale=1920:1080"
-    }
-    resolution = user_settings.get("resolution", "720p")
-    scale_filter = resolution_map.get(resolution, "scale=1280:720")
-
-    command = [
-        'ffmpeg', '-hide_banner', '-i', vid,
-        '-vf', (
-            f"{scale_filter},"
-            f"subtitles={formatted_sub}:force_style="
-            f"'FontName=HelveticaRounded-Bold,FontSize={font_size},"
-            f"PrimaryColour={Config.FONT_COLOR},Outline={Config.BORDER_WIDTH}',"
-            f"drawtext=text='{Config.WATERMARK}':fontfile='{font_path}':"
-            "x=w-tw-10:y=10:fontsize=24:fontcolor=white:"
-            "borderw=2:bordercolor=black"
-        ),
-        '-c:v', codec, '-preset', preset, '-crf', crf,
-        '-tag:v', 'hvc1', '-c:a', 'copy', '-y', out_location
-    ]
+    trace = job.trace if job else None
+    with span(trace, "probe"):
+        info = await probe(vid)
+    user_settings = adapt_encoding(user_settings, info, job)
+    styled_sub = await prepare_subtitles(sub, user_settings)
+    plan = plan_hardmux(info, user_settings, styled_sub, font_path, prepared=styled_sub != sub)
+    if plan.warnings:
+        updater.update(msg, "⏳ Your File is Being Hard Subbed.\n" + "\n".join(f"⚠️ {w}" for w in plan.warnings))
 
-    process = await asyncio.create_subprocess_exec(
-        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
+    encode_start = time.time()
+    if user_settings.get("mode") == "segmented":
+        with span(trace, "encode", children=True):
+            success, error_output = await hardmux_segmented(vid, out_location, msg, plan, job)
+    else:
+        if fragmented:
+            plan.codec_args += FRAGMENT_ARGS
+        duration = info.duration if info and Config.INLINE_SCREENSHOTS else 0
+        if duration:
+            # Grab the screenshots from the encoder's own frames instead of re-reading the output
+            filter_suffix, shot_args = inline_screenshot_args(out_location, duration)
+            command = [
+                'ffmpeg', '-hide_banner', *PROGRESS_ARGS, '-i', vid,
+                '-filter_complex', f"[0:v]{plan.video_filter}{filter_suffix}",
+                '-map', '[main]', '-map', '0:a?',
+                *plan.codec_args, '-c:a', 'copy', '-y', out_location,
+                *shot_args
+            ]
+        else:
+            command = plan.command(vid, out_location)
+
+        with span(trace, "encode", children=True):
+            returncode, error_output = await run_with_progress(command, msg, info.duration if info else 0, job)
+        success = returncode == 0
 
-    error_output = await read_stderr(start, msg, process)
-    await process.wait()
+    if trace and success and info and info.frames:
+        trace.fps = round(info.frames / max(time.time() - encode_start, 0.001), 1)
+    return await finish_hardmux(msg, output, success, error_output, start, job)
+
+async def finish_hardmux(msg, output, success, error_output, start, job=None):
+    """Report a single hardmux and send its screenshots, or remove what it left. Returns output or False."""
+    out_location = os.path.join(Config.DOWNLOAD_DIR, output)
+    if job and job.cancelled:
+        remove_files([out_location, *collect_screenshots(out_location)])
+        await safe_edit_message(msg, '🚫 **Muxing Cancelled!**')
+        return False
 
-    if process.returncode == 0:
-        await safe_edit_message(msg, f'✅ **Muxing Completed!**\n⏳ Time: {round(time.time() - start)}s')
+    if success:
+        updater.update(msg, f'✅ **Muxing Completed!**\n⏳ Time: {round(time.time() - start)}s')
 
-        screenshots = await generate_screenshots(out_location)
-        await send_screenshots(msg, screenshots)
+        with span(job.trace if job else None, "screenshots"):
+            screenshots = collect_screenshots(out_location)
+            if not screenshots:
+                screenshots = await generate_screenshots(out_location)
+            try:
+                await send_screenshots(msg, screenshots)
+            finally:
+                remove_files(screenshots)
 
         return output
     else:
+        remove_files([out_location, *collect_screenshots(out_location)])
+        trimmed_error = error_output[-3000:] if len(error_output) > 3000 else error_output
+        await safe_edit_message(msg, f'❌ **Muxing Failed!**\n\nError:\n```{trimmed_error}```')
+        return False
+
+async def hardmux_stream(chunks, vid_filename, sub_filename, msg, user_settings={}, info=None, job=None):
+    """Hardmux a video while it downloads, decoding from the chunks as they arrive.
+
+    The chunks are saved to vid_filename as well, the file is complete when
+    this returns even if the encode failed. info may come from the upload's
+    metadata since the file can't be probed yet. The caller checks the font.
+    """
+    start = time.time()
+    vid = os.path.join(Config.DOWNLOAD_DIR, vid_filename)
+    sub = os.path.join(Config.DOWNLOAD_DIR, sub_filename)
+    output = hardmux_output(vid_filename)
+    out_location = os.path.join(Config.DOWNLOAD_DIR, output)
+
+    font_path = os.path.join(Config.FONTS_DIR, "HelveticaRounded-Bold.ttf")
+    user_settings = adapt_encoding(user_settings, info, job)
+    styled_sub = await prepare_subtitles(sub, user_settings)
+    plan = plan_hardmux(info, user_settings, styled_sub, font_path, prepared=styled_sub != sub)
+
+    process = await spawn(
+        plan.command('pipe:0', out_location), job,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        # Downloading and encoding overlap, the download is part of the encode span
+        with span(job.trace if job else None, "encode", children=True):
+            progress = asyncio.create_task(read_progress(msg, process, info.duration if info else 0))
+            try:
+                await tee_to_process(chunks, vid, process.stdin)
+            except BaseException:
+                if process.returncode is None:
+                    process.kill()
+                raise
+            finally:
+                error_output = await progress
+                await process.wait()
+    finally:
+        if job:
+            job.detach(process)
+
+    return await finish_hardmux(msg, output, process.returncode == 0, error_output, start, job)
+
+async def hardmux_ladder(vid_filename, sub_filename, msg, user_settings={}, job=None):
+    """Burn subtitles once and encode every ladder rendition from the same decoded frames.
+
+    Returns [(rendition name, output filename)] smallest first, or False.
+    """
+    start = time.time()
+    vid = os.path.join(Config.DOWNLOAD_DIR, vid_filename)
+    sub = os.path.join(Config.DOWNLOAD_DIR, sub_filename)
+
+    font_path = os.path.join(Config.FONTS_DIR, "HelveticaRounded-Bold.ttf")
+    if not os.path.exists(font_path):
+        await safe_edit_message(msg, "❌ Font not found! Place 'HelveticaRounded-Bold.ttf' in 'fonts' folder.")
+        return False
+
+    trace = job.trace if job else None
+    with span(trace, "probe"):
+        info = await probe(vid)
+    styled_sub = await prepare_subtitles(sub, user_settings)
+    # Planned twice: the renditions that survive decide the preset and threads
+    renditions = plan_ladder(info, user_settings, styled_sub, font_path, prepared=styled_sub != sub).renditions
+    user_settings = adapt_encoding(user_settings, info, job, renditions)
+    plan = plan_ladder(info, user_settings, styled_sub, font_path, prepared=styled_sub != sub)
+    outputs = [ladder_output(vid_filename, r.name) for r in plan.renditions]
+    out_locations = [os.path.join(Config.DOWNLOAD_DIR, output) for output in outputs]
+    updater.update(msg, "⏳ Encoding " + ", ".join(r.name for r in plan.renditions) + " in one pass."
+                   + "".join(f"\n⚠️ {w}" for w in plan.warnings))
+
+    encode_start = time.time()
+    with span(trace, "encode", children=True):
+        returncode, error_output = await run_with_progress(
+            plan.command(vid, out_locations), msg, info.duration if info else 0, job
+        )
+
+    if job and job.cancelled:
+        remove_files(out_locations)
+        await safe_edit_message(msg, '🚫 **Muxing Cancelled!**')
+        return False
+
+    if returncode != 0:
+        remove_files(out_locations)
         trimmed_error = error_output[-3000:] if len(error_output) > 3000 else error_output
         await safe_edit_message(msg, f'❌ **Muxing Failed!**\n\nError:\n```{trimmed_error}```')
         return False
+
+    if trace and info and info.frames:
+        trace.fps = round(info.frames / max(time.time() - encode_start, 0.001), 1)
+    updater.update(msg, f'✅ **Muxing Completed!** {len(outputs)} renditions\n⏳ Time: {round(time.time() - start)}s')
+    with span(trace, "screenshots"):
+        screenshots = await generate_screenshots(out_locations[-1], duration=info.duration if info else None)
+        try:
+            await send_screenshots(msg, screenshots)
+        finally:
+            remove_files(screenshots)
+    return [(r.name, output) for r, output in zip(plan.renditions, outputs)]
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+from typing import AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+# First bytes of every Matroska file (the EBML header ID)
+MATROSKA_MAGIC = b"\x1a\x45\xdf\xa3"
+# Bytes handed to ffmpeg's stdin at a time
+FEED_SIZE = 1024 * 1024
+
+
+def is_streamable(head: bytes, file_name: str) -> bool:
+    """Whether ffmpeg can decode a file from a pipe, judged by its first bytes.
+
+    Matroska always can. MP4 only when its moov box comes before the media
+    data; a moov written at the end would have to be seeked to.
+    """
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext == ".mkv":
+        return head[:4] == MATROSKA_MAGIC
+    if ext != ".mp4":
+        return False
+    offset = 0
+    while offset + 8 <= len(head):
+        size, kind = struct.unpack(">I4s", head[offset:offset + 8])
+        if size == 1:
+            if offset + 16 > len(head):
+                return False
+            size = struct.unpack(">Q", head[offset + 8:offset + 16])[0]
+        if kind == b"moov":
+            return True
+        if kind == b"mdat" or size < 8:
+            return False
+        offset += size
+    return False
+
+
+async def prepend(head: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Put a chunk already read back in front of the rest."""
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def tee_to_process(chunks: AsyncIterator[bytes], path: str, stdin) -> int:
+    """Save a download to path while feeding what has arrived to a process's stdin.
+
+    The download is written at network speed and the process reads the
+    growing file at its own pace, so a slow encoder doesn't hold the
+    download back. The file is completed even if the process exits early,
+    it is still the user's video. Returns the bytes downloaded.
+    """
+    downloaded = 0
+    finished = asyncio.Event()
+    grown = asyncio.Event()
+
+    async def download():
+        nonlocal downloaded
+        try:
+            with open(path, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+                    f.flush()
+                    downloaded += len(chunk)
+                    grown.set()
+        finally:
+            finished.set()
+            grown.set()
+
+    async def feed():
+        try:
+            with open(path, "rb") as f:
+                while True:
+                    grown.clear()
+                    # Read to the end of what is on disk before waiting for more
+                    done = finished.is_set()
+                    data = f.read(FEED_SIZE)
+                    if data:
+                        stdin.write(data)
+                        await stdin.drain()
+                    elif done:
+                        break
+                    else:
+                        await grown.wait()
+            stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(f"Reader of {path} exited before the download finished")
+
+    feeder = asyncio.create_task(feed())
+    try:
+        await download()
+    except BaseException:
+        feeder.cancel()
+        raise
+    await feeder
+    return downloaded
+
+
+async def fake_chunks(data: bytes, chunk_size: int = FEED_SIZE, delay: float = 0.0) -> AsyncIterator[bytes]:
+    """A stand-in for client.stream_media() yielding data one chunk per `delay` seconds."""
+    for offset in range(0, len(data), chunk_size):
+        await asyncio.sleep(delay)
+        yield data[offset:offset + chunk_size]
+
+
+# Reads stdin slowly like an encoder, reporting when the first and last bytes arrived
+CONSUMER = """
+import hashlib, sys, time
+digest, first = hashlib.sha1(), None
+while chunk := sys.stdin.buffer.read(65536):
+    first = first or time.time()
+    digest.update(chunk)
+    time.sleep({delay})
+print(first, time.time(), digest.hexdigest())
+"""
+
+
+async def _demo(size_mb: int = 16, chunk_delay: float = 0.1, consumer_delay: float = 0.02) -> None:
+    """Download from a fake source into a slow reader and check both copies."""
+    import hashlib
+    import sys
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "video.mkv")
+    data = MATROSKA_MAGIC + os.urandom(size_mb * 1024 * 1024)
+
+    start = time.time()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", CONSUMER.format(delay=consumer_delay),
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE
+    )
+    downloaded = None
+
+    async def source():
+        nonlocal downloaded
+        async for chunk in fake_chunks(data, delay=chunk_delay):
+            yield chunk
+        downloaded = time.time()
+
+    written = await tee_to_process(source(), path, process.stdin)
+    stdout, _ = await process.communicate()
+    first, last, digest = stdout.decode().split()
+
+    with open(path, "rb") as f:
+        assert f.read() == data, "the saved copy differs from the download"
+    assert digest == hashlib.sha1(data).hexdigest(), "the reader got different bytes"
+    os.remove(path)
+    print(f"{written} bytes from a source taking {chunk_delay}s per {FEED_SIZE // 1024} KiB chunk")
+    print(f"reader got its first bytes at {float(first) - start:.2f}s")
+    print(f"download complete at {downloaded - start:.2f}s, reader done at {float(last) - start:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
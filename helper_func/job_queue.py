@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from config import Config
+from helper_func.cores import core_partition
+from helper_func.metrics import JobTrace
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised when a job is cancelled while waiting for or holding a slot."""
+
+
+class Job:
+    """A single encode request and the ffmpeg processes it owns."""
+
+    def __init__(self, user_id: int, label: str = "hardmux"):
+        self.user_id = user_id
+        self.label = label
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = False
+        self.processes = set()
+        self.trace = JobTrace(user_id, label)
+        self._waiter: Optional[asyncio.Future] = None
+
+    @property
+    def wait_time(self) -> float:
+        """Seconds spent waiting for a slot (so far, if still waiting)."""
+        return (self.started_at or time.time()) - self.enqueued_at
+
+    def attach(self, process) -> None:
+        """Register an ffmpeg child so /cancel can kill it."""
+        self.processes.add(process)
+        if self.cancelled:
+            self._kill(process)
+
+    def detach(self, process) -> None:
+        self.processes.discard(process)
+
+    def kill(self) -> None:
+        """Kill every ffmpeg child owned by this job."""
+        for process in list(self.processes):
+            self._kill(process)
+
+    @staticmethod
+    def _kill(process) -> None:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+
+class JobQueue:
+    """FIFO admission control for CPU heavy jobs with a fixed number of slots."""
+
+    def __init__(self, slots: int):
+        self.slots = max(1, slots)
+        self._waiting = deque()
+        self._running: Dict[int, Job] = {}
+        self._started = 0
+        self._completed = 0
+        self._cancelled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def get(self, user_id: int) -> Optional[Job]:
+        """Return the queued or running job of a user, if any."""
+        if user_id in self._running:
+            return self._running[user_id]
+        for job in self._waiting:
+            if job.user_id == user_id:
+                return job
+        return None
+
+    def has_free_slot(self) -> bool:
+        """True when a job submitted now would start right away."""
+        return len(self._running) < self.slots and not self._waiting
+
+    def position(self, job: Job) -> int:
+        """1-based position of a waiting job, 0 when it is already running."""
+        try:
+            return self._waiting.index(job) + 1
+        except ValueError:
+            return 0
+
+    def submit(self, job: Job) -> int:
+        """Add a job to the queue and return its waiting position."""
+        if self.get(job.user_id):
+            raise ValueError("User already has a job in the queue")
+        if len(self._running) < self.slots and not self._waiting:
+            self._start(job)
+            return 0
+        job._waiter = asyncio.get_running_loop().create_future()
+        self._waiting.append(job)
+        return len(self._waiting)
+
+    async def wait(self, job: Job) -> None:
+        """Wait until the job is given a slot."""
+        if job._waiter is not None:
+            await job._waiter
+        if job.cancelled:
+            raise JobCancelled()
+
+    @asynccontextmanager
+    async def slot(self, job: Job):
+        """Hold a slot for the duration of the block, submitting the job if needed.
+
+        A job cancelled before the block is entered raises JobCancelled and is never submitted again.
+        """
+        if job.cancelled:
+            raise JobCancelled()
+        if job.started_at is None and job not in self._waiting:
+            self.submit(job)
+        try:
+            await self.wait(job)
+            yield job
+        finally:
+            self.release(job)
+
+    def cancel(self, user_id: int) -> bool:
+        """Cancel a user's job, killing its ffmpeg children if it is running."""
+        job = self.get(user_id)
+        if not job:
+            return False
+        job.cancelled = True
+        if job in self._waiting:
+            self._waiting.remove(job)
+            self._cancelled += 1
+            # wait() raises JobCancelled, a job cancelled before it waits never looks at the future
+            if not job._waiter.done():
+                job._waiter.set_result(None)
+        else:
+            job.kill()
+        return True
+
+    def withdraw(self, job: Job) -> None:
+        """Drop a submitted job that won't run after all, freeing its slot or its place in line."""
+        job.cancelled = True
+        if job in self._waiting:
+            self._waiting.remove(job)
+            self._cancelled += 1
+            job._waiter.cancel()
+        else:
+            self.release(job)
+
+    def release(self, job: Job) -> None:
+        """Free the slot held by the job and start the next waiting one."""
+        if self._running.get(job.user_id) is not job:
+            return
+        del self._running[job.user_id]
+        core_partition.remove(job)
+        job.finished_at = time.time()
+        if job.cancelled:
+            self._cancelled += 1
+        else:
+            self._completed += 1
+        while self._waiting and len(self._running) < self.slots:
+            self._start(self._waiting.popleft())
+
+    def _start(self, job: Job) -> None:
+        job.started_at = time.time()
+        self._running[job.user_id] = job
+        core_partition.add(job)
+        self._started += 1
+        wait = job.wait_time
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        if job._waiter is not None and not job._waiter.done():
+            job._waiter.set_result(None)
+        logger.info(f"Job for {job.user_id} started after waiting {round(wait, 1)}s")
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and wait time statistics."""
+        started = self._started
+        return {
+            "slots": self.slots,
+            "running": len(self._running),
+            "waiting": len(self._waiting),
+            "completed": self._completed,
+            "cancelled": self._cancelled,
+            "avg_wait": round(self._total_wait / started, 1) if started else 0.0,
+            "max_wait": round(self._max_wait, 1),
+            "oldest_wait": round(self._waiting[0].wait_time, 1) if self._waiting else 0.0,
+        }
+
+
+job_queue = JobQueue(Config.MAX_CONCURRENT_JOBS)
@@ -0,0 +1,146 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+from typing import TYPE_CHECKING, Dict, Optional
+
+from config import Config
+from helper_func.dbhelper import Database, get_db
+
+if TYPE_CHECKING:
+    from helper_func.downloader import UrlInfo
+
+logger = logging.getLogger(__name__)
+
+
+def telegram_key(file_unique_id: str) -> str:
+    """Store key of a Telegram file, the same for every user who sends it."""
+    return f"tg:{file_unique_id}"
+
+
+def url_key(info: "UrlInfo") -> Optional[str]:
+    """Store key of a URL download, None when the server gives nothing to validate it with."""
+    version = info.etag or (str(info.size) if info.size else None)
+    return f"url:{info.url}|{version}" if version else None
+
+
+def _link(src: str, dst: str) -> None:
+    """Hard link dst to src, copying when the filesystem can't link."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class MediaStore:
+    """Downloaded media kept by source key, with reference counts and LRU eviction.
+
+    Jobs never work on the stored file itself: checkout() and add() hard link
+    it to the job's own name in the download directory, so deleting the
+    working file after an upload leaves the stored copy in place, and evicting
+    a stored copy can't pull a file from under a running job. References only
+    decide what eviction may pick, as an entry still linked by a job frees no
+    space when it is removed.
+    """
+
+    def __init__(self, db: Database, root: str, capacity: int):
+        self.db = db
+        self.root = root
+        self.capacity = capacity
+        self._refs: Dict[str, int] = {}
+        self._holders: Dict[str, str] = {}  # Absolute working file path -> store key
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    @staticmethod
+    def _holder(path: str) -> str:
+        """Absolute path of a working file; a bare name is one in the download directory."""
+        if not os.path.dirname(path):
+            path = os.path.join(Config.DOWNLOAD_DIR, path)
+        return os.path.abspath(path)
+
+    def _hold(self, key: str, dest: str) -> None:
+        holder = self._holder(dest)
+        if holder in self._holders:
+            self.release(holder)
+        self._holders[holder] = key
+        self._refs[key] = self._refs.get(key, 0) + 1
+
+    def source_key(self, path: str) -> Optional[str]:
+        """Store key of the source a working file was downloaded from, None when it isn't held."""
+        return self._holders.get(self._holder(path))
+
+    async def checkout(self, key: Optional[str], dest: str) -> bool:
+        """Link the stored file for key to dest, False when it has to be downloaded."""
+        if not key:
+            return False
+        entry = await self.db.get_media(key)
+        if not entry or not os.path.exists(self._path(entry["name"])):
+            if entry:
+                await self.db.delete_media(key)
+            self.misses += 1
+            return False
+        await asyncio.to_thread(_link, self._path(entry["name"]), dest)
+        await self.db.touch_media(key)
+        self._hold(key, dest)
+        self.hits += 1
+        return True
+
+    async def add(self, key: Optional[str], path: str) -> None:
+        """Keep a fresh download under key; path stays the caller's working file."""
+        if not key:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        name = hashlib.sha1(key.encode()).hexdigest() + os.path.splitext(path)[1]
+        try:
+            await asyncio.to_thread(_link, path, self._path(name))
+        except OSError as e:
+            logger.warning(f"Couldn't store {path}: {e}")
+            return
+        await self.db.put_media(key, name, os.path.getsize(path))
+        self._hold(key, path)
+        await self.evict()
+
+    def release(self, name: Optional[str]) -> None:
+        """Drop the reference a working file (a path, or a name in the download directory) holds.
+
+        Call it before deleting the file.
+        """
+        if not name:
+            return
+        key = self._holders.pop(self._holder(name), None)
+        if key is None:
+            return
+        self._refs[key] -= 1
+        if not self._refs[key]:
+            del self._refs[key]
+
+    async def evict(self) -> int:
+        """Remove unreferenced entries, least recently used first, until the store fits. Returns bytes freed."""
+        async with self._lock:
+            entries = await self.db.list_media()
+            used = sum(e["size"] for e in entries)
+            freed = 0
+            for entry in entries:
+                if used - freed <= self.capacity:
+                    break
+                if self._refs.get(entry["key"]):
+                    continue
+                try:
+                    os.remove(self._path(entry["name"]))
+                except FileNotFoundError:
+                    pass
+                await self.db.delete_media(entry["key"])
+                freed += entry["size"]
+                logger.info(f"Evicted {entry['key']} ({entry['size']} bytes) from the media store")
+            return freed
+
+
+media_store = MediaStore(get_db(), Config.STORE_DIR, Config.MEDIA_STORE_MB * 1024 * 1024)
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from pyrogram.errors import FloodWait, MessageNotModified
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Global edit budget shared by every chat."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class MessageUpdater:
+    """Coalesces message edits per chat and sends them within Telegram's limits.
+
+    Producers call update() which only records the latest text for a message
+    and returns immediately; one worker task per chat sends the newest text
+    when the chat's interval and the global budget allow it, and backs off
+    for the duration of any FloodWait.
+    """
+
+    def __init__(self, chat_interval: float, global_rate: float, remember: int = 1000):
+        self.chat_interval = chat_interval
+        self._bucket = TokenBucket(global_rate)
+        self._pending: Dict[int, "OrderedDict[int, list]"] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._next_edit: Dict[int, float] = {}
+        self._sent: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+        self._remember = remember
+        self.flood_waits = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def _key(msg) -> Tuple[int, int]:
+        chat = getattr(msg, "chat", None)
+        return getattr(chat, "id", 0), getattr(msg, "id", id(msg))
+
+    def update(self, msg, text: str) -> asyncio.Future:
+        """Schedule an edit, replacing any edit of the same message still waiting."""
+        chat_id, msg_id = self._key(msg)
+        done = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(chat_id, OrderedDict())
+        if msg_id in pending:
+            self.coalesced += 1
+            pending[msg_id][1] = text
+            pending[msg_id][2].append(done)
+        else:
+            pending[msg_id] = [msg, text, [done]]
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._run(chat_id))
+        return done
+
+    async def edit(self, msg, text: str) -> None:
+        """Schedule an edit and wait until it (or a newer one) has been sent."""
+        await self.update(msg, text)
+
+    async def _run(self, chat_id: int) -> None:
+        try:
+            while self._pending.get(chat_id):
+                delay = self._next_edit.get(chat_id, 0) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._bucket.acquire()
+
+                pending = self._pending[chat_id]
+                msg_id, (msg, text, waiters) = pending.popitem(last=False)
+                self._next_edit[chat_id] = time.monotonic() + self.chat_interval
+                try:
+                    await self._send(chat_id, msg_id, msg, text)
+                except FloodWait as e:
+                    self.flood_waits += 1
+                    logger.warning(f"FloodWait of {e.value}s for chat {chat_id}")
+                    self._next_edit[chat_id] = time.monotonic() + int(e.value)
+                    if msg_id in pending:
+                        pending[msg_id][2].extend(waiters)  # A newer text is already waiting
+                    else:
+                        pending[msg_id] = [msg, text, waiters]
+                        pending.move_to_end(msg_id, last=False)
+                    continue
+                except Exception as e:
+                    logger.warning(f"Edit message failed: {e}")
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+        finally:
+            # No await between the loop check and here, so nothing can be queued in between
+            self._workers.pop(chat_id, None)
+            self._pending.pop(chat_id, None)
+
+    async def _send(self, chat_id: int, msg_id: int, msg, text: str) -> None:
+        key = (chat_id, msg_id)
+        if self._sent.get(key, getattr(msg, "text", None)) == text:
+            return
+        try:
+            await msg.edit(text)
+        except MessageNotModified:
+            pass
+        self._sent[key] = text
+        self._sent.move_to_end(key)
+        while len(self._sent) > self._remember:
+            self._sent.popitem(last=False)
+
+
+updater = MessageUpdater(Config.EDIT_INTERVAL, Config.MAX_EDITS_PER_SECOND)
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import math
+import resource
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+from config import Config
+from helper_func.dbhelper import Database, get_db
+
+logger = logging.getLogger(__name__)
+
+# Phases a job's time is split into, in the order they happen
+PHASES = ("queue", "download", "probe", "encode", "screenshots", "upload", "cleanup")
+# Histogram bucket bounds in seconds for phase durations, and in frames per second for encodes
+SECONDS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+FPS_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800)
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class JobTrace:
+    """Where one job's time went, phase by phase, with its bytes, fps and ffmpeg CPU time."""
+
+    def __init__(self, user_id: int, kind: str):
+        self.user_id = user_id
+        self.kind = kind
+        self.started = time.time()
+        self.spans: Dict[str, float] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.fps: Optional[float] = None
+        self.cpu = 0.0
+        # Encoder preset and threads the job ran with, chosen by the load for preset 'auto'
+        self.preset: Optional[str] = None
+        self.threads: Optional[int] = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.spans[phase] = round(self.spans.get(phase, 0.0) + seconds, 3)
+
+    @contextmanager
+    def span(self, phase: str, children: bool = False):
+        """Time a block as phase; children also adds the CPU time of the processes it reaped.
+
+        The CPU time comes from getrusage(RUSAGE_CHILDREN), so ffmpegs of
+        other jobs that exit during the block are counted as well.
+        """
+        start, cpu = time.monotonic(), _children_cpu() if children else 0.0
+        try:
+            yield self
+        finally:
+            self.add(phase, time.monotonic() - start)
+            if children:
+                self.cpu += _children_cpu() - cpu
+
+    def record(self, outcome: str) -> Dict:
+        return {
+            "user_id": self.user_id,
+            "kind": self.kind,
+            "outcome": outcome,
+            "started": self.started,
+            "duration": round(time.time() - self.started, 3),
+            "spans": self.spans,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "fps": self.fps,
+            "cpu": round(self.cpu, 3),
+            "preset": self.preset,
+            "threads": self.threads,
+        }
+
+
+def span(trace: Optional[JobTrace], phase: str, children: bool = False):
+    """trace.span() that does nothing without a trace, for code that runs both inside and outside jobs."""
+    return trace.span(phase, children) if trace else nullcontext()
+
+
+class Histogram:
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        lines, total = [], 0
+        for bound, count in zip((*self.bounds, "+Inf"), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines += [f"{name}_sum{{{labels}}} {round(self.sum, 3)}", f"{name}_count{{{labels}}} {total}"]
+        return lines
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile, 0 for no values."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+class Metrics:
+    """Job traces kept as a history table and as Prometheus counters and histograms.
+
+    Downloads happen before the user starts a job, so their timing waits in
+    note_download() until that user's next job is finished and is counted
+    as its download phase.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self.jobs: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.phases: Dict[Tuple[str, str], Histogram] = {}
+        self.fps: Dict[str, Histogram] = {}
+        self.cpu: Dict[str, float] = defaultdict(float)
+        self.bytes: Dict[str, int] = defaultdict(int)
+        self._downloads: Dict[int, Tuple[float, int]] = {}
+
+    def note_download(self, user_id: int, seconds: float, size: int) -> None:
+        self._observe_phase("download", "download", seconds)
+        self.bytes["download"] += size
+        self._downloads[user_id] = (seconds, size)
+
+    def _observe_phase(self, kind: str, phase: str, seconds: float) -> None:
+        self.phases.setdefault((kind, phase), Histogram(SECONDS_BUCKETS)).observe(seconds)
+
+    async def finish(self, trace: Optional[JobTrace], outcome: str) -> None:
+        """Count a finished job and append it to the history."""
+        if trace is None:
+            return
+        download = self._downloads.pop(trace.user_id, None)
+        if download and "download" not in trace.spans:
+            trace.add("download", download[0])
+            trace.bytes_in = trace.bytes_in or download[1]
+        for phase, seconds in trace.spans.items():
+            if phase != "download":
+                self._observe_phase(trace.kind, phase, seconds)
+        self.jobs[(trace.kind, outcome)] += 1
+        self.cpu[trace.kind] += trace.cpu
+        self.bytes["out"] += trace.bytes_out
+        if trace.fps:
+            self.fps.setdefault(trace.kind, Histogram(FPS_BUCKETS)).observe(trace.fps)
+        await self.db.put_job(trace.record(outcome))
+
+    def render(self) -> str:
+        """Everything in the Prometheus text format."""
+        from helper_func.job_queue import job_queue
+
+        lines = ["# TYPE muxbot_jobs_total counter"]
+        lines += [f'muxbot_jobs_total{{kind="{kind}",outcome="{outcome}"}} {count}'
+                  for (kind, outcome), count in sorted(self.jobs.items())]
+        lines.append("# TYPE muxbot_phase_seconds histogram")
+        for (kind, phase), histogram in sorted(self.phases.items()):
+            lines += histogram.lines("muxbot_phase_seconds", f'kind="{kind}",phase="{phase}"')
+        lines.append("# TYPE muxbot_encode_fps histogram")
+        for kind, histogram in sorted(self.fps.items()):
+            lines += histogram.lines("muxbot_encode_fps", f'kind="{kind}"')
+        lines.append("# TYPE muxbot_ffmpeg_cpu_seconds_total counter")
+        lines += [f'muxbot_ffmpeg_cpu_seconds_total{{kind="{kind}"}} {round(cpu, 3)}'
+                  for kind, cpu in sorted(self.cpu.items())]
+        lines.append("# TYPE muxbot_bytes_total counter")
+        lines += [f'muxbot_bytes_total{{direction="{direction}"}} {size}'
+                  for direction, size in sorted(self.bytes.items())]
+        stats = job_queue.stats()
+        lines += [
+            "# TYPE muxbot_queue_running gauge", f"muxbot_queue_running {stats['running']}",
+            "# TYPE muxbot_queue_waiting gauge", f"muxbot_queue_waiting {stats['waiting']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    async def summary(self, since: float) -> Dict:
+        """p50/p95 per phase and job counts from the history since a timestamp."""
+        jobs = await self.db.list_jobs(since)
+        phases = {}
+        for phase in PHASES:
+            values = [job["spans"][phase] for job in jobs if phase in job["spans"]]
+            if values:
+                phases[phase] = (percentile(values, 50), percentile(values, 95), len(values))
+        outcomes, presets = defaultdict(int), defaultdict(int)
+        for job in jobs:
+            outcomes[job["outcome"]] += 1
+            if job["preset"]:
+                presets[job["preset"]] += 1
+        fps = [job["fps"] for job in jobs if job["fps"]]
+        return {
+            "jobs": len(jobs),
+            "outcomes": dict(outcomes),
+            "presets": dict(presets),
+            "phases": phases,
+            "total": (percentile([j["duration"] for j in jobs], 50), percentile([j["duration"] for j in jobs], 95)),
+            "fps": percentile(fps, 50) if fps else None,
+            "cpu": round(sum(job["cpu"] or 0 for job in jobs), 1),
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            path = request.split()[1].decode() if len(request.split()) > 1 else ""
+            if path.split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render()
+            else:
+                status, body = "404 Not Found", "Not found\n"
+            payload = body.encode()
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: Optional[str] = None, port: Optional[int] = None) -> None:
+        """Serve /metrics over HTTP until cancelled; port 0 turns it off."""
+        host = host or Config.METRICS_HOST
+        port = Config.METRICS_PORT if port is None else port
+        if not port:
+            return
+        try:
+            server = await asyncio.start_server(self._handle, host, port)
+        except OSError as e:
+            logger.error(f"Metrics endpoint couldn't listen on {host}:{port}: {e}")
+            return
+        logger.info(f"Metrics on http://{host}:{port}/metrics")
+        async with server:
+            await server.serve_forever()
+
+
+metrics = Metrics(get_db())
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+import zlib
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.session import Session
+from pyrogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Telegram's upload part size, every part but the last must be exactly this long
+PART_SIZE = 512 * 1024
+# Files up to this size must be sent with SaveFilePart and an MD5, which needs the whole file first
+BIG_FILE_MIN = 10 * 1024 * 1024
+# MP4 written as a stream of self-contained fragments, nothing before the end is rewritten
+FRAGMENT_ARGS = ['-movflags', '+frag_keyframe+empty_moov+default_base_moof']
+
+
+class UploadError(Exception):
+    """Raised when Telegram refuses a part or the stream can't be sent as a big file."""
+
+
+class PartSink(Protocol):
+    """Where PipelinedUpload sends the parts of a file; sinks that subclass it inherit a no-op close()."""
+
+    async def save_part(self, file_id: int, index: int, total: int, data: bytes) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+class TelegramSink(PartSink):
+    """Parts go to Telegram with upload.SaveBigFilePart over a media session, as pyrogram's own uploads do."""
+
+    def __init__(self, client):
+        self.client = client
+        self._session: Optional[Session] = None
+
+    async def _get_session(self) -> Session:
+        if self._session is None:
+            self._session = Session(
+                self.client, await self.client.storage.dc_id(), await self.client.storage.auth_key(),
+                await self.client.storage.test_mode(), is_media=True
+            )
+            await self._session.start()
+        return self._session
+
+    async def save_part(self, file_id: int, index: int, total: int, data: bytes) -> None:
+        session = await self._get_session()
+        while True:
+            try:
+                ok = await session.invoke(raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=index, file_total_parts=total, bytes=data
+                ))
+                break
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+        if not ok:
+            raise UploadError(f"Telegram refused part {index}")
+
+    async def close(self) -> None:
+        if self._session:
+            await self._session.stop()
+            self._session = None
+
+
+class FakeSink(PartSink):
+    """Records what would be uploaded and when, taking `delay` seconds per part like a slow link."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.parts: Dict[int, bytes] = {}
+        # (index, total, bytes, monotonic time the part finished)
+        self.log: List[Tuple[int, int, int, float]] = []
+
+    async def save_part(self, file_id: int, index: int, total: int, data: bytes) -> None:
+        await asyncio.sleep(self.delay)
+        self.parts[index] = data
+        self.log.append((index, total, len(data), time.monotonic()))
+
+    def data(self) -> bytes:
+        return b"".join(self.parts[i] for i in sorted(self.parts))
+
+
+async def tail_parts(path: str, finished: asyncio.Event, part_size: int = PART_SIZE, poll: float = 0.5):
+    """Yield (index, data) for every full part of a file while it is written, until finished is set.
+
+    The short last part is left to the caller, it's only known once the
+    writer is done.
+    """
+    while not os.path.exists(path):
+        if finished.is_set():
+            return
+        await asyncio.sleep(poll)
+    index = 0
+    with open(path, "rb") as f:
+        while True:
+            # Checked before the size so a part completed right before the writer ended isn't missed
+            done = finished.is_set()
+            if os.fstat(f.fileno()).st_size >= (index + 1) * part_size:
+                f.seek(index * part_size)
+                yield index, f.read(part_size)
+                index += 1
+            elif done:
+                return
+            else:
+                await asyncio.sleep(poll)
+
+
+class PipelinedUpload:
+    """Upload a file in parts while ffmpeg is still writing it.
+
+    start() streams every full part to the sink with an unknown total as the
+    file grows. finish() is called once the writer exited: it re-reads the
+    file, re-sends any part the writer rewrote after it went out (a header
+    finalised at the end) and sends the last part with the real part count.
+    The result is then sent as an InputFileBig of `parts` parts.
+    """
+
+    def __init__(self, sink: PartSink, path: str, part_size: int = PART_SIZE, poll: float = 0.5):
+        self.sink = sink
+        self.path = path
+        self.part_size = part_size
+        self.poll = poll
+        self.file_id = random.getrandbits(63)
+        self.parts = 0
+        self.size = 0
+        self.streamed = 0
+        self.resent = 0
+        self._sent: Dict[int, int] = {}
+        self._finished = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._stream())
+
+    async def _stream(self) -> None:
+        async for index, data in tail_parts(self.path, self._finished, self.part_size, self.poll):
+            await self.sink.save_part(self.file_id, index, -1, data)
+            self._sent[index] = zlib.crc32(data)
+            self.streamed += 1
+
+    async def finish(self) -> int:
+        """Send what the stream hasn't and return the number of parts. Call after the file is complete."""
+        self._finished.set()
+        try:
+            if self._task:
+                await self._task
+            self.size = os.path.getsize(self.path)
+            if self.size <= BIG_FILE_MIN:
+                raise UploadError(f"{self.size} bytes is too small for a streamed upload")
+            self.parts = math.ceil(self.size / self.part_size)
+
+            with open(self.path, "rb") as f:
+                for index in range(self.parts):
+                    f.seek(index * self.part_size)
+                    data = f.read(self.part_size)
+                    changed = index in self._sent and self._sent[index] != zlib.crc32(data)
+                    # The last part always goes again, it carries the part count
+                    if index in self._sent and not changed and index != self.parts - 1:
+                        continue
+                    self.resent += changed
+                    await self.sink.save_part(self.file_id, index, self.parts, data)
+            return self.parts
+        finally:
+            await self.sink.close()
+
+    async def abort(self) -> None:
+        """Stop streaming, e.g. when the encode failed."""
+        self._finished.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await self.sink.close()
+
+
+async def send_uploaded(client, chat_id, upload: PipelinedUpload, file_name: str, caption: str = "") -> Optional[Message]:
+    """Send a finished PipelinedUpload as a document."""
+    media = raw.types.InputMediaUploadedDocument(
+        file=raw.types.InputFileBig(id=upload.file_id, parts=upload.parts, name=file_name),
+        mime_type=client.guess_mime_type(file_name) or "application/octet-stream",
+        attributes=[raw.types.DocumentAttributeFilename(file_name=file_name)],
+    )
+    r = await client.invoke(raw.functions.messages.SendMedia(
+        peer=await client.resolve_peer(chat_id), media=media, message=caption, random_id=client.rnd_id()
+    ))
+    for update in r.updates:
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await Message._parse(
+                client, update.message, {u.id: u for u in r.users}, {c.id: c for c in r.chats}
+            )
+    return None
+
+
+async def _demo(size_mb: int = 24, write_seconds: float = 3.0, part_delay: float = 0.05) -> None:
+    """Write a file at a steady rate like an encode and stream it to a FakeSink meanwhile."""
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), "out.mp4")
+    payload = os.urandom(size_mb * 1024 * 1024)
+    chunk = 256 * 1024
+    steps = len(payload) // chunk
+
+    sink = FakeSink(delay=part_delay)
+    upload = PipelinedUpload(sink, path, poll=0.05)
+    start = time.monotonic()
+    upload.start()
+    with open(path, "wb") as f:
+        for i in range(steps):
+            f.write(payload[i * chunk:(i + 1) * chunk])
+            f.flush()
+            await asyncio.sleep(write_seconds / steps)
+        # A header rewritten at the end, the way a non-fragmented muxer would
+        f.seek(0)
+        f.write(b"moov" * 16)
+    written = time.monotonic()
+    parts = await upload.finish()
+    done = time.monotonic()
+
+    with open(path, "rb") as f:
+        assert sink.data() == f.read(), "uploaded bytes differ from the file"
+    os.remove(path)
+    before = sum(1 for _, _, _, t in sink.log if t <= written)
+    sequential = (written - start) + parts * part_delay
+    print(f"{parts} parts, {before} uploaded while writing, {upload.resent} re-sent after the writer finished")
+    print(f"writer done at {written - start:.2f}s, upload done at {done - start:.2f}s")
+    print(f"upload only after the write would end at ~{sequential:.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
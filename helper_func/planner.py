@@ -0,0 +1,323 @@
+import os
+import re
+import shlex
+from typing import List, Optional, Tuple
+
+from config import Config
+from helper_func.probe import MediaInfo
+from helper_func.utils import PROGRESS_ARGS
+
+# ✅ Allowed output resolutions (480p, 720p, 1080p)
+resolution_map = {
+    "480p": (854, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080)
+}
+
+# Relative cost of x264/x265 presets against ultrafast, roughly from x264 speed tables
+PRESET_COST = {
+    "ultrafast": 1.0, "superfast": 1.4, "veryfast": 2.0, "faster": 2.8, "fast": 3.3,
+    "medium": 4.2, "slow": 6.5, "slower": 12.0, "veryslow": 25.0
+}
+CODEC_COST = {"libx264": 1.0, "libx265": 4.0}
+# Frames per second a single core manages for a 720p libx264 ultrafast hardmux
+BASE_FPS_PER_CORE = 90.0
+# Presets preset 'auto' chooses from, fastest first; slower ones give smaller files at the same CRF
+ADAPTIVE_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium", "slow")
+# Frame rate assumed when only the duration of a source is known
+DEFAULT_FRAME_RATE = 24
+
+TEN_BIT_FORMATS = ("10le", "10be", "p010")
+
+
+def parse_resolution(value) -> Tuple[int, int]:
+    """Accept both '720p' and '1280x720' style resolution settings."""
+    if value in resolution_map:
+        return resolution_map[value]
+    try:
+        width, height = str(value).lower().split("x")
+        return int(width), int(height)
+    except ValueError:
+        return resolution_map["720p"]
+
+
+def fit_resolution(src_w: int, src_h: int, box_w: int, box_h: int) -> Tuple[int, int]:
+    """Largest even size inside the box that keeps the source aspect ratio."""
+    scale = min(box_w / src_w, box_h / src_h)
+    width = int(round(src_w * scale / 2)) * 2
+    height = int(round(src_h * scale / 2)) * 2
+    return width, height
+
+
+def watermark_text(user_settings) -> Optional[str]:
+    """The watermark to draw, None when the user turned it off."""
+    choice = user_settings.get("watermark", Config.WATERMARK)
+    if choice == "None":
+        return None
+    if choice == "Custom Text":
+        return user_settings.get("watermark_text") or Config.WATERMARK
+    return choice or Config.WATERMARK
+
+
+class HardmuxPlan:
+    """The minimal ffmpeg work needed to turn a source into the requested output."""
+
+    def __init__(self):
+        self.filters: List[str] = []
+        self.codec_args: List[str] = []
+        self.warnings: List[str] = []
+        self.output_size: Optional[Tuple[int, int]] = None
+        self.estimated_seconds = 0.0
+
+    @property
+    def video_filter(self) -> str:
+        return ",".join(self.filters)
+
+    def command(self, vid: str, out_location: str) -> List[str]:
+        """The ffmpeg argv for a single-process encode of this plan."""
+        return [
+            'ffmpeg', '-hide_banner', *PROGRESS_ARGS, '-i', vid,
+            '-vf', self.video_filter,
+            *self.codec_args, '-c:a', 'copy', '-y', out_location
+        ]
+
+    def describe(self, vid: str, out_location: str) -> str:
+        """Human readable dry run of the plan."""
+        lines = ["🧾 **Planned ffmpeg command:**", f"`{shlex.join(self.command(vid, out_location))}`", ""]
+        if self.output_size:
+            lines.append(f"📺 Output: {self.output_size[0]}x{self.output_size[1]}")
+        if self.estimated_seconds:
+            lines.append(f"⏳ Estimated encode time: ~{round(self.estimated_seconds)}s")
+        lines += [f"⚠️ {warning}" for warning in self.warnings]
+        return "\n".join(lines)
+
+
+def codec_args(user_settings, info: Optional[MediaInfo] = None) -> List[str]:
+    """Encoder arguments from the user's codec, preset, CRF and bit depth choice."""
+    codec = user_settings.get("codec", "libx264")
+    preset = user_settings.get("preset", "ultrafast")
+    crf = str(user_settings.get("crf", "20"))
+    args = ['-c:v', codec, '-preset', preset, '-crf', crf]
+    if user_settings.get("threads"):
+        args += ['-threads', str(user_settings["threads"])]
+
+    source_10bit = bool(info and info.pix_fmt and info.pix_fmt.endswith(TEN_BIT_FORMATS))
+    bit_depth = user_settings.get("bit_depth")
+    if bit_depth == "10bit" and not source_10bit:
+        args += ['-pix_fmt', 'yuv420p10le']
+    elif bit_depth == "8bit" and source_10bit:
+        args += ['-pix_fmt', 'yuv420p']
+
+    if codec == 'libx265':
+        args += ['-tag:v', 'hvc1']  # hvc1 is only valid for HEVC in MP4
+    return args
+
+
+def filter_value(value) -> str:
+    """A filter option value quoted for both levels of ffmpeg's filtergraph escaping.
+
+    The option parser needs \\, ' and : backslash-escaped; the graph parser
+    then gets the result in single quotes so , ; [ ] stay literal.
+    """
+    escaped = re.sub(r"([\\':])", r"\\\1", str(value))
+    return "'" + escaped.replace("'", "'\\''") + "'"
+
+
+def overlay_filters(user_settings, sub: str, font_path: str, prepared: bool = False) -> List[str]:
+    """The subtitle burn-in and watermark filters.
+
+    A prepared subtitle already carries the user's style, anything else is
+    styled with force_style.
+    """
+    subtitles = f"subtitles=filename={filter_value(sub)}:fontsdir={filter_value(Config.FONTS_DIR)}"
+    if not prepared:
+        font_size = user_settings.get("font_size", Config.FONT_SIZE)
+        subtitles += ":force_style=" + filter_value(
+            f"FontName={Config.FONT_NAME},FontSize={font_size},"
+            f"PrimaryColour={Config.FONT_COLOR},Outline={Config.BORDER_WIDTH}"
+        )
+    filters = [subtitles]
+
+    text = watermark_text(user_settings)
+    if text:
+        filters.append(
+            # expansion=none keeps a % in the text from starting a %{...} sequence
+            f"drawtext=text={filter_value(text)}:expansion=none:fontfile={filter_value(font_path)}:"
+            "x=w-tw-10:y=10:fontsize=24:fontcolor=white:"
+            "borderw=2:bordercolor=black"
+        )
+    return filters
+
+
+def plan_hardmux(info: Optional[MediaInfo], user_settings, sub: str, font_path: str,
+                 prepared: bool = False) -> HardmuxPlan:
+    """Plan the filter graph and codec arguments, dropping stages that do nothing."""
+    plan = HardmuxPlan()
+    box_w, box_h = parse_resolution(user_settings.get("resolution", "720p"))
+
+    if info and info.width and info.height:
+        width, height = fit_resolution(info.width, info.height, box_w, box_h)
+        if (width > info.width or height > info.height) and not Config.ALLOW_UPSCALE:
+            plan.warnings.append(
+                f"Source is {info.width}x{info.height}, keeping it instead of upscaling to {box_w}x{box_h}."
+            )
+            width, height = info.width, info.height
+        if (width, height) != (info.width, info.height):
+            plan.filters.append(f"scale={width}:{height}")
+        plan.output_size = (width, height)
+    else:
+        # Unknown source, let ffmpeg keep the aspect ratio inside the box
+        plan.filters.append(
+            f"scale={box_w}:{box_h}:force_original_aspect_ratio=decrease:force_divisible_by=2"
+        )
+
+    plan.filters += overlay_filters(user_settings, sub, font_path, prepared)
+    plan.codec_args = codec_args(user_settings, info)
+    plan.estimated_seconds = estimate_seconds(info, plan, user_settings)
+    return plan
+
+
+def encode_seconds(frames: float, size: Tuple[int, int], preset: str, codec: str, cores: int) -> float:
+    """Very rough encode time of frames at an output size on a number of cores."""
+    pixel_factor = (size[0] * size[1]) / (1280 * 720)
+    cost = PRESET_COST.get(preset, 4.0) * CODEC_COST.get(codec, 1.0)
+    return frames * pixel_factor * cost / (BASE_FPS_PER_CORE * max(1, cores))
+
+
+def estimate_seconds(info: Optional[MediaInfo], plan: HardmuxPlan, user_settings) -> float:
+    """Very rough encode time from frame count, output pixels, preset and codec."""
+    if not info or not info.frames:
+        return 0.0
+    size = plan.output_size or parse_resolution(user_settings.get("resolution", "720p"))
+    return encode_seconds(info.frames, size, user_settings.get("preset", "ultrafast"),
+                          user_settings.get("codec", "libx264"),
+                          user_settings.get("threads") or os.cpu_count() or 1)
+
+
+def choose_encoding(info: Optional[MediaInfo], user_settings, cores: int, running: int,
+                    waiting: int, sizes: Optional[List[Tuple[int, int]]] = None) -> Tuple[str, int]:
+    """(preset, threads) for preset 'auto' under the current load.
+
+    Every running job gets an equal share of the cores. The preset is the
+    slowest one whose estimated encode on that share fits in
+    ADAPTIVE_TARGET_SECONDS split over this job and the ones waiting behind
+    it: an idle bot spends time on smaller files, a backlog gets fast
+    presets so it drains. sizes are the outputs encoded together, a
+    ladder's renditions; by default the single output of the resolution.
+    """
+    threads = max(1, cores // max(1, running))
+    frames = 0.0
+    if info and info.frames:
+        frames = info.frames
+    elif info and info.duration:
+        frames = info.duration * (info.frame_rate or DEFAULT_FRAME_RATE)
+    if not frames:
+        # Unknown length, judge by the queue alone
+        return ("ultrafast" if waiting else "veryfast"), threads
+
+    if not sizes:
+        size = parse_resolution(user_settings.get("resolution", "720p"))
+        if info.width and info.height:
+            size = fit_resolution(info.width, info.height, *size)
+            if size[0] > info.width and not Config.ALLOW_UPSCALE:
+                size = (info.width, info.height)
+        sizes = [size]
+    codec = user_settings.get("codec", "libx264")
+    target = Config.ADAPTIVE_TARGET_SECONDS / (1 + waiting)
+    preset = ADAPTIVE_PRESETS[0]
+    for candidate in ADAPTIVE_PRESETS:
+        # The outputs share the job's threads, so their encode times add up
+        if sum(encode_seconds(frames, size, candidate, codec, threads) for size in sizes) > target:
+            break
+        preset = candidate
+    return preset, threads
+
+
+class Rendition:
+    """One output of a ladder encode."""
+
+    def __init__(self, name: str, size: Optional[Tuple[int, int]], crf: str, codec_args: List[str]):
+        self.name = name
+        self.size = size
+        self.crf = crf
+        self.codec_args = codec_args
+
+
+class LadderPlan:
+    """Several renditions encoded from one decode and one subtitle render.
+
+    The subtitles and watermark are drawn once at the source resolution, then
+    the frames are split and scaled down for each rendition's encoder.
+    """
+
+    def __init__(self):
+        self.filters: List[str] = []
+        self.renditions: List[Rendition] = []
+        self.warnings: List[str] = []
+        self.source_size: Optional[Tuple[int, int]] = None  # None: unknown, let ffmpeg fit each box
+
+    def filter_complex(self) -> str:
+        count = len(self.renditions)
+        graph = f"[0:v]{','.join(self.filters)},split={count}" + "".join(f"[s{i}]" for i in range(count))
+        for i, rendition in enumerate(self.renditions):
+            if not self.source_size:
+                box_w, box_h = resolution_map[rendition.name]
+                scale = f"scale={box_w}:{box_h}:force_original_aspect_ratio=decrease:force_divisible_by=2"
+            elif rendition.size != self.source_size:
+                scale = f"scale={rendition.size[0]}:{rendition.size[1]}"
+            else:
+                scale = "null"
+            graph += f";[s{i}]{scale}[v{i}]"
+        return graph
+
+    def command(self, vid: str, out_locations: List[str]) -> List[str]:
+        """The ffmpeg argv writing rendition i to out_locations[i]."""
+        command = ['ffmpeg', '-hide_banner', *PROGRESS_ARGS, '-i', vid, '-filter_complex', self.filter_complex()]
+        for i, (rendition, out_location) in enumerate(zip(self.renditions, out_locations)):
+            command += ['-map', f'[v{i}]', '-map', '0:a?', *rendition.codec_args, '-c:a', 'copy', '-y', out_location]
+        return command
+
+    def describe(self, vid: str, out_locations: List[str]) -> str:
+        """Human readable dry run of the plan."""
+        lines = ["🧾 **Planned ffmpeg command:**", f"`{shlex.join(self.command(vid, out_locations))}`", ""]
+        for rendition in self.renditions:
+            size = f"{rendition.size[0]}x{rendition.size[1]}" if rendition.size else "fit"
+            lines.append(f"📺 {rendition.name}: {size} at CRF {rendition.crf}")
+        lines += [f"⚠️ {warning}" for warning in self.warnings]
+        return "\n".join(lines)
+
+
+def ladder_crf(user_settings, name: str) -> str:
+    """CRF of a rendition: the user's crf_<name> setting, else Config.LADDER_CRF."""
+    return str(user_settings.get(f"crf_{name}") or Config.LADDER_CRF.get(name) or user_settings.get("crf", "20"))
+
+
+def plan_ladder(info: Optional[MediaInfo], user_settings, sub: str, font_path: str,
+                names: Optional[List[str]] = None, prepared: bool = False) -> LadderPlan:
+    """Plan one encode producing every rendition in names (default: the whole resolution_map).
+
+    Renditions that would upscale the source collapse into a single one at
+    the source size unless ALLOW_UPSCALE is set.
+    """
+    plan = LadderPlan()
+    plan.filters = overlay_filters(user_settings, sub, font_path, prepared)
+    known = bool(info and info.width and info.height)
+    if known:
+        plan.source_size = (info.width, info.height)
+    sizes = set()
+
+    for name in names or list(resolution_map):
+        size = None
+        if known:
+            box_w, box_h = resolution_map[name]
+            width, height = fit_resolution(info.width, info.height, box_w, box_h)
+            if (width > info.width or height > info.height) and not Config.ALLOW_UPSCALE:
+                width, height = info.width, info.height
+            if (width, height) in sizes:
+                plan.warnings.append(f"Skipping {name}, the source is only {info.width}x{info.height}.")
+                continue
+            sizes.add((width, height))
+            size = (width, height)
+        crf = ladder_crf(user_settings, name)
+        plan.renditions.append(Rendition(name, size, crf, codec_args({**user_settings, "crf": crf}, info)))
+    return plan
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from helper_func.dbhelper import get_db
+from helper_func.media_store import media_store
+
+logger = logging.getLogger(__name__)
+
+db = get_db()
+
+FINGERPRINT_BLOCK = 1024 * 1024  # Bytes hashed from the head and the tail of a file
+
+
+class MediaInfo:
+    """The parts of an ffprobe report the muxing pipeline cares about."""
+
+    def __init__(self, duration: float = 0.0, width: int = 0, height: int = 0,
+                 video_codec: Optional[str] = None, pix_fmt: Optional[str] = None,
+                 frame_rate: float = 0.0, frames: int = 0, bit_rate: int = 0,
+                 audio_codecs: Optional[List[str]] = None,
+                 subtitle_streams: Optional[List[Dict[str, Any]]] = None):
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.video_codec = video_codec
+        self.pix_fmt = pix_fmt
+        self.frame_rate = frame_rate
+        self.frames = frames
+        self.bit_rate = bit_rate
+        self.audio_codecs = audio_codecs or []
+        self.subtitle_streams = subtitle_streams or []
+
+    @property
+    def resolution(self) -> str:
+        return f"{self.width}x{self.height}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MediaInfo":
+        return cls(**data)
+
+    @classmethod
+    def from_ffprobe(cls, report: Dict[str, Any]) -> "MediaInfo":
+        """Build a record from `ffprobe -show_format -show_streams -of json` output."""
+        fmt = report.get("format", {})
+        streams = report.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"
+                      and not s.get("disposition", {}).get("attached_pic")), {})
+
+        duration = _to_float(fmt.get("duration")) or _to_float(video.get("duration"))
+        frame_rate = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+        frames = int(video.get("nb_frames") or 0) or int(duration * frame_rate)
+
+        return cls(
+            duration=duration,
+            width=int(video.get("width") or 0),
+            height=int(video.get("height") or 0),
+            video_codec=video.get("codec_name"),
+            pix_fmt=video.get("pix_fmt"),
+            frame_rate=round(frame_rate, 3),
+            frames=frames,
+            bit_rate=int(fmt.get("bit_rate") or 0),
+            audio_codecs=[s.get("codec_name") for s in streams if s.get("codec_type") == "audio"],
+            subtitle_streams=[
+                {
+                    "index": s.get("index"),
+                    "codec": s.get("codec_name"),
+                    "language": s.get("tags", {}).get("language"),
+                    "title": s.get("tags", {}).get("title"),
+                }
+                for s in streams if s.get("codec_type") == "subtitle"
+            ],
+        )
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Turn an ffprobe rational like '24000/1001' into a float."""
+    if not rate or "/" not in rate:
+        return _to_float(rate)
+    num, den = rate.split("/", 1)
+    return _to_float(num) / _to_float(den) if _to_float(den) else 0.0
+
+
+def content_hash(path: str) -> str:
+    """SHA-1 of the whole file (blocking)."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(FINGERPRINT_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint(path: str) -> str:
+    """Cheap content hash: file size plus the first and last megabyte."""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BLOCK))
+        if size > 2 * FINGERPRINT_BLOCK:
+            f.seek(-FINGERPRINT_BLOCK, os.SEEK_END)
+            digest.update(f.read(FINGERPRINT_BLOCK))
+    return digest.hexdigest()
+
+
+async def run_ffprobe(path: str) -> Optional[Dict[str, Any]]:
+    """Raw ffprobe JSON report for a file, None if ffprobe fails."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            'ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+    except FileNotFoundError:
+        logger.error("ffprobe is not installed")
+        return None
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        logger.warning(f"ffprobe failed for {path}: {stderr.decode(errors='ignore').strip()}")
+        return None
+    try:
+        return json.loads(stdout)
+    except ValueError:
+        return None
+
+
+async def probe(path: str) -> Optional[MediaInfo]:
+    """Probe a media file, reusing the cached record for the same content.
+
+    A file from the media store is keyed by its source (Telegram
+    file_unique_id or URL), anything else by its content fingerprint.
+    """
+    if not os.path.exists(path):
+        return None
+    key = media_store.source_key(path) or await asyncio.to_thread(fingerprint, path)
+
+    cached = await db.get_probe(key)
+    if cached:
+        return MediaInfo.from_dict(cached)
+
+    report = await run_ffprobe(path)
+    if report is None:
+        return None
+    info = MediaInfo.from_ffprobe(report)
+    await db.put_probe(key, info.to_dict())
+    return info
@@ -2,39 +2,36 @@
 import time
 import math
 
+from helper_func.message_updater import updater
+
 async def progress_bar(current, total, text, message, start):
 
     now = time.time()
-    diff = now-start
-    if round(diff % 10) == 0 or current == total:
-        percentage = current*100/total
-        speed = current/diff
-        elapsed_time = round(diff)*1000
-        eta = round((total-current)/speed)*1000
-        ett = eta + elapsed_time
-
-        elapsed_time = TimeFormatter(elapsed_time)
-        ett = TimeFormatter(ett)
-
-        progress = "[{0}{1}] \n\n🔹Progress: {2}%\n".format(
-            ''.join(["◼️" for i in range(math.floor(percentage / 5))]),
-            ''.join(["◻️" for i in range(20 - math.floor(percentage / 5))]),
-            round(percentage, 2))
-
-        tmp = progress + "{0} of {1}\n\n️🔹Speed: {2}/s\n\n🔹ETA: {3}\n".format(
-            humanbytes(current),
-            humanbytes(total),
-            humanbytes(speed),
-            # elapsed_time if elapsed_time != '' else "0 s",
-            ett if ett != '' else "0 s"
-        )
-
-        try :
-            await message.edit(
-                text = '{}.\n{}'.format(text, tmp)
-            )
-        except:
-            pass
+    diff = max(now - start, 0.001)
+    percentage = current*100/total
+    speed = current/diff
+    elapsed_time = round(diff)*1000
+    eta = round((total-current)/speed)*1000 if speed else 0
+    ett = eta + elapsed_time
+
+    elapsed_time = TimeFormatter(elapsed_time)
+    ett = TimeFormatter(ett)
+
+    progress = "[{0}{1}] \n\n🔹Progress: {2}%\n".format(
+        ''.join(["◼️" for i in range(math.floor(percentage / 5))]),
+        ''.join(["◻️" for i in range(20 - math.floor(percentage / 5))]),
+        round(percentage, 2))
+
+    tmp = progress + "{0} of {1}\n\n️🔹Speed: {2}/s\n\n🔹ETA: {3}\n".format(
+        humanbytes(current),
+        humanbytes(total),
+        humanbytes(speed),
+        # elapsed_time if elapsed_time != '' else "0 s",
+        ett if ett != '' else "0 s"
+    )
+
+    # Coalesced and rate limited by the updater, so the transfer never waits on Telegram
+    updater.update(message, '{}.\n{}'.format(text, tmp))
 
 def humanbytes(size):
     # https://stackoverflow.com/a/49361727/4723940
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from helper_func.dbhelper import Database, get_db
+from helper_func.planner import ladder_crf, parse_resolution, resolution_map, watermark_text
+from helper_func.media_store import media_store
+from helper_func.probe import content_hash
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_settings(user_settings) -> Dict[str, Any]:
+    """The settings that change the encoded output, spelled one way each.
+
+    Defaults are filled in the way the planner fills them and '720p' and
+    '1280x720' become the same key. The mode is left out, single and
+    segmented encodes of the same settings are interchangeable, but a ladder
+    is keyed by its renditions' CRFs instead of one resolution and CRF.
+    """
+    width, height = parse_resolution(user_settings.get("resolution", "720p"))
+    settings = {
+        "codec": user_settings.get("codec", "libx264"),
+        "preset": user_settings.get("preset", "ultrafast"),
+        "crf": str(user_settings.get("crf", "20")),
+        "bit_depth": user_settings.get("bit_depth"),
+        "resolution": f"{width}x{height}",
+        "font_size": str(user_settings.get("font_size", Config.FONT_SIZE)),
+        "watermark": watermark_text(user_settings),
+        "upscale": Config.ALLOW_UPSCALE,
+    }
+    if user_settings.get("mode") == "ladder":
+        # Every rendition is encoded, each at its own CRF
+        del settings["resolution"], settings["crf"]
+        settings["ladder"] = {name: ladder_crf(user_settings, name) for name in resolution_map}
+    return settings
+
+
+def result_key(vid_path: str, sub_path: str, user_settings) -> str:
+    """Key of a hardmux: video source, subtitle hash and normalised settings (blocking).
+
+    The video is identified by its media store key (Telegram file_unique_id
+    or URL), or by a hash of all of it. A sampled fingerprint would mistake
+    trims and re-encodes sharing a header and trailer for the same video and
+    send another video's encode.
+    """
+    with open(sub_path, "rb") as f:
+        sub_hash = hashlib.sha1(f.read()).hexdigest()
+    source = media_store.source_key(vid_path) or content_hash(vid_path)
+    settings = json.dumps(normalise_settings(user_settings), sort_keys=True)
+    return hashlib.sha1(f"{source}|{sub_hash}|{settings}".encode()).hexdigest()
+
+
+class ResultCache:
+    """Uploaded encodes by job key, and the encodes still running for a key.
+
+    The job for which begin() returns True must call finish() however it
+    ends; identical jobs arriving meanwhile await running() and reuse the
+    file it uploaded, or call begin() again if it produced nothing.
+    """
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._running: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.coalesced = 0
+
+    async def get(self, key: str) -> List[Dict[str, Any]]:
+        """The files uploaded for key as [{'key', 'file_id', 'file_name'}], empty if none."""
+        results = await self.db.get_results(key)
+        if results:
+            self.hits += 1
+        return results
+
+    async def forget(self, key: str) -> None:
+        """Drop a stored result, e.g. when Telegram no longer accepts its file_id."""
+        await self.db.delete_result(key)
+
+    def running(self, key: str) -> Optional[asyncio.Future]:
+        """Future resolving to True once the running job for key has stored its result."""
+        future = self._running.get(key)
+        if future:
+            self.coalesced += 1
+            return asyncio.shield(future)
+        return None
+
+    def begin(self, key: str) -> bool:
+        """Claim the encode of key, False when another job already runs it."""
+        if key in self._running:
+            return False
+        self._running[key] = asyncio.get_running_loop().create_future()
+        return True
+
+    async def finish(self, key: str, files: Optional[List[Tuple[str, str, str]]] = None) -> None:
+        """Store the uploads and wake the jobs waiting on key.
+
+        files holds (part, file_id, file_name) for every upload, part is ""
+        for a single output and the rendition name for a ladder.
+        """
+        stored = False
+        try:
+            if files:
+                stored = True
+                for part, file_id, file_name in files:
+                    stored &= await self.db.put_result(f"{key}:{part}" if part else key, file_id, file_name)
+        finally:
+            future = self._running.pop(key, None)
+            if future and not future.done():
+                future.set_result(stored)
+
+
+result_cache = ResultCache(get_db())
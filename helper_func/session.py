@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from config import Config
+from helper_func.dbhelper import Database, get_db
+
+logger = logging.getLogger(__name__)
+
+# Encoding preferences a new user starts with
+DEFAULT_PREFERENCES = {
+    "codec": "libx264",
+    "crf": "22",
+    "preset": Config.DEFAULT_PRESET,
+    "bit_depth": "8bit",
+    "resolution": "1280x720",
+    "font_size": "20",
+    "watermark": "CHS Anime",
+    "mode": "single"
+}
+
+
+class Session:
+    """Everything the bot knows about one user: their files and encode preferences."""
+
+    def __init__(self, user_id: int, vid_name: Optional[str] = None, sub_name: Optional[str] = None,
+                 filename: Optional[str] = None, settings: Optional[Dict[str, Any]] = None):
+        self.user_id = user_id
+        self.vid_name = vid_name or None
+        self.sub_name = sub_name or None
+        self.filename = filename or None
+        self.settings = {**DEFAULT_PREFERENCES, **(settings or {})}
+
+    @property
+    def has_video(self) -> bool:
+        return bool(self.vid_name)
+
+    @property
+    def has_sub(self) -> bool:
+        return bool(self.sub_name)
+
+    @classmethod
+    def from_row(cls, user_id: int, row: Optional[Dict[str, Any]]) -> "Session":
+        if not row:
+            return cls(user_id)
+        settings = {}
+        if row.get("encoding_settings"):
+            try:
+                settings = json.loads(row["encoding_settings"])
+            except json.JSONDecodeError as e:
+                logger.error(f"Error decoding settings: {e}")
+        return cls(user_id, row.get("vid_name"), row.get("sub_name"), row.get("filename"), settings)
+
+
+class SessionStore:
+    """LRU cache of sessions in front of the database, writing changes through."""
+
+    def __init__(self, db: Database, capacity: int = 256):
+        self.db = db
+        self.capacity = capacity
+        self._sessions: "OrderedDict[int, Session]" = OrderedDict()
+        self._loading: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: int) -> Session:
+        """The user's session, loaded from the database with one query on a miss."""
+        session = self._sessions.get(user_id)
+        if session:
+            self.hits += 1
+            self._sessions.move_to_end(user_id)
+            return session
+
+        # Concurrent misses for the same user share one load
+        if user_id in self._loading:
+            return await asyncio.shield(self._loading[user_id])
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = future
+        try:
+            session = Session.from_row(user_id, await self.db.get_session(user_id))
+            self._remember(session)
+            future.set_result(session)
+            return session
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Waiters re-raise it, don't warn when there are none
+            raise
+        finally:
+            del self._loading[user_id]
+
+    def _remember(self, session: Session) -> None:
+        self._sessions[session.user_id] = session
+        self._sessions.move_to_end(session.user_id)
+        while len(self._sessions) > self.capacity:
+            self._sessions.popitem(last=False)
+
+    async def put_video(self, user_id: int, vid_name: str, filename: str) -> Session:
+        session = await self.get(user_id)
+        session.vid_name, session.filename = vid_name, filename
+        await self.db.put_video(user_id, vid_name, filename)
+        return session
+
+    async def put_sub(self, user_id: int, sub_name: str) -> Session:
+        session = await self.get(user_id)
+        session.sub_name = sub_name
+        await self.db.put_sub(user_id, sub_name)
+        return session
+
+    async def set_preference(self, user_id: int, key: str, value: Any) -> Session:
+        """Change one encode preference and persist all of them to encoding_settings."""
+        session = await self.get(user_id)
+        session.settings[key] = value
+        await self.db.set_encoding_settings(user_id, session.settings)
+        return session
+
+    async def clear_files(self, user_id: int) -> None:
+        """Forget the user's files after a job, keeping their preferences."""
+        session = await self.get(user_id)
+        session.vid_name = session.sub_name = session.filename = None
+        await self.db.clear_files(user_id)
+
+
+sessions = SessionStore(get_db(), Config.SESSION_CACHE_SIZE)
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, Optional, Set
+
+from config import Config
+from helper_func.dbhelper import Database, get_db
+from helper_func.media_store import media_store
+
+logger = logging.getLogger(__name__)
+
+# Resumable URL downloads, kept longer than other unowned files
+PARTIAL_SUFFIXES = (".part", ".state")
+
+
+class InsufficientStorage(Exception):
+    """Raised when a reservation doesn't fit in the free disk space."""
+
+
+def _size(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f))
+                   for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+
+class StorageManager:
+    """Disk space reservations and file ownership for everything in DOWNLOAD_DIR.
+
+    Work reserves the space it expects to write before starting, so two big
+    jobs can't both pass a free-space check and then fill the disk together.
+    Files a job writes are tracked under its owner and deleted with
+    release(owner, delete=True) however the job ended. The janitor deletes
+    whatever is left that no owner, user session or the media store claims.
+    """
+
+    def __init__(self, db: Database, root: str, min_free: int):
+        self.db = db
+        self.root = root
+        self.min_free = min_free
+        self._reserved: Dict[Hashable, int] = {}
+        self._files: Dict[Hashable, Set[str]] = {}
+        self._changed = asyncio.Condition()
+        self.refused = 0
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+
+    @property
+    def reserved(self) -> int:
+        return sum(self._reserved.values())
+
+    def _outstanding(self, owner: Hashable) -> int:
+        """Part of owner's reservation its tracked files haven't written yet."""
+        written = 0
+        for path in self._files.get(owner, ()):
+            try:
+                written += _size(path)
+            except OSError:
+                pass  # Not written yet, or already removed
+        return max(0, self._reserved[owner] - written)
+
+    def available(self) -> int:
+        """Bytes that can still be reserved.
+
+        What reservations already wrote is gone from the free space, so only
+        the rest of each reservation is taken off it.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        outstanding = sum(self._outstanding(owner) for owner in self._reserved)
+        return shutil.disk_usage(self.root).free - self.min_free - outstanding
+
+    async def reserve(self, owner: Hashable, size: int, wait: float = 0) -> None:
+        """Reserve size bytes for owner, waiting up to `wait` seconds for space to be released."""
+        deadline = time.monotonic() + wait
+        async with self._changed:
+            while size > self.available():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.refused += 1
+                    raise InsufficientStorage(
+                        f"Need {size // 2 ** 20} MiB, only {max(0, self.available()) // 2 ** 20} MiB free"
+                    )
+                try:
+                    await asyncio.wait_for(self._changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            self._reserved[owner] = self._reserved.get(owner, 0) + size
+
+    def track(self, owner: Hashable, *paths: str) -> None:
+        """Record files or directories owner may write, so they are removed with it."""
+        self._files.setdefault(owner, set()).update(os.path.abspath(p) for p in paths if p)
+
+    async def release(self, owner: Hashable, delete: bool = False) -> int:
+        """Drop owner's reservation and, with delete, the files it tracked. Returns bytes deleted."""
+        self._reserved.pop(owner, None)
+        freed = 0
+        for path in self._files.pop(owner, set()):
+            if delete:
+                freed += self._remove(path)
+        async with self._changed:
+            self._changed.notify_all()
+        return freed
+
+    @asynccontextmanager
+    async def claim(self, owner: Hashable, size: int, wait: float = 0):
+        """Reserve for the duration of a block; tracked files are deleted if it fails."""
+        await self.reserve(owner, size, wait)
+        try:
+            yield self
+        except BaseException:
+            await self.release(owner, delete=True)
+            raise
+        await self.release(owner)
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = _size(path)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Couldn't remove {path}: {e}")
+            return 0
+
+    async def sweep(self, max_age: Optional[float] = None) -> int:
+        """Delete unowned files older than max_age seconds. Returns bytes reclaimed."""
+        max_age = Config.ORPHAN_MAX_AGE if max_age is None else max_age
+        if not os.path.isdir(self.root):
+            return 0
+        keep = {os.path.abspath(os.path.join(self.root, name)) for name in await self.db.list_session_files()}
+        keep.add(os.path.abspath(Config.STORE_DIR))
+        keep.add(os.path.abspath(Config.SUBTITLE_CACHE_DIR))
+        for paths in self._files.values():
+            keep.update(paths)
+
+        now = time.time()
+        freed = 0
+        for entry in os.scandir(self.root):
+            path = os.path.abspath(entry.path)
+            if path in keep:
+                continue
+            age = now - entry.stat(follow_symlinks=False).st_mtime
+            limit = Config.PARTIAL_MAX_AGE if entry.name.endswith(PARTIAL_SUFFIXES) else max_age
+            if age < limit:
+                continue
+            size = self._remove(path)
+            if size or not os.path.exists(path):
+                self.reclaimed_files += 1
+                self.reclaimed_bytes += size
+                freed += size
+                logger.info(f"Janitor removed {entry.name} ({size} bytes, {round(age)}s old)")
+        if freed:
+            async with self._changed:
+                self._changed.notify_all()
+        return freed
+
+    async def janitor(self, interval: Optional[float] = None) -> None:
+        """Sweep orphans and trim the media store forever."""
+        interval = interval or Config.JANITOR_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+                await media_store.evict()
+            except Exception as e:
+                logger.error(f"Janitor sweep failed: {e}")
+
+    async def stats(self) -> Dict[str, int]:
+        """Disk, download directory, store and reservation figures in bytes."""
+        os.makedirs(self.root, exist_ok=True)
+        usage = shutil.disk_usage(self.root)
+        store = await asyncio.to_thread(_size, Config.STORE_DIR) if os.path.isdir(Config.STORE_DIR) else 0
+        used = await asyncio.to_thread(_size, self.root)
+        return {
+            "disk_total": usage.total,
+            "disk_free": usage.free,
+            "downloads": used - store,
+            "store": store,
+            "reserved": self.reserved,
+            "available": max(0, self.available()),
+            "owners": len(set(self._reserved) | set(self._files)),
+            "refused": self.refused,
+            "reclaimed_files": self.reclaimed_files,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
+
+
+storage = StorageManager(get_db(), Config.DOWNLOAD_DIR, Config.MIN_FREE_MB * 1024 * 1024)
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, Iterator
+
+from config import Config
+from helper_func.convert import ConversionError, ass_header, convert_file, detect_encoding, format_of
+
+logger = logging.getLogger(__name__)
+
+FONTCONFIG_TEMPLATE = """<?xml version="1.0"?>
+<!DOCTYPE fontconfig SYSTEM "fonts.dtd">
+<fontconfig>
+  <dir>{fonts}</dir>
+  <cachedir>{cache}</cachedir>
+</fontconfig>
+"""
+
+
+def style_for(user_settings) -> Dict[str, str]:
+    """The style a user's hardmux draws subtitles with, what force_style used to set."""
+    return {
+        "fontname": Config.FONT_NAME,
+        "fontsize": str(user_settings.get("font_size", Config.FONT_SIZE)),
+        "primarycolour": Config.FONT_COLOR,
+        "outlinecolour": Config.BORDER_COLOR,
+        "outline": str(Config.BORDER_WIDTH),
+    }
+
+
+def restyle_ass(lines: Iterable[str], style: Dict[str, str]) -> Iterator[str]:
+    """Stream an ASS file with the style fields replaced in every Style line."""
+    fields = []
+    in_styles = False
+    for line in lines:
+        stripped = line.strip()
+        if stripped.startswith("["):
+            in_styles = stripped.lower() in ("[v4+ styles]", "[v4 styles]")
+        elif in_styles:
+            key, _, value = stripped.partition(":")
+            if key.lower() == "format":
+                fields = [f.strip().lower() for f in value.split(",")]
+            elif key.lower() == "style" and fields:
+                values = [v.strip() for v in value.split(",", len(fields) - 1)]
+                values = [style.get(field, v) for field, v in zip(fields, values)]
+                line = "Style: " + ",".join(values) + "\n"
+        yield line
+
+
+def _prepare(sub_path: str, out_path: str, style: Dict[str, str]) -> None:
+    """Write the styled ASS for sub_path to out_path (blocking)."""
+    tmp_path = out_path + ".tmp"
+    if format_of(sub_path) == "ass":
+        with open(sub_path, encoding=detect_encoding(sub_path), errors="replace") as f_in, \
+                open(tmp_path, "w", encoding="utf-8", newline="\n") as f_out:
+            f_out.writelines(restyle_ass(f_in, style))
+    else:
+        header = ass_header(
+            style["fontname"], style["fontsize"], style["primarycolour"], style["outlinecolour"], style["outline"]
+        )
+        convert_file(sub_path, tmp_path, dst_format="ass", header=header)
+    os.replace(tmp_path, out_path)
+
+
+def _prune(directory: str, keep: int) -> None:
+    """Delete the least recently used prepared files beyond `keep`."""
+    entries = [e for e in os.scandir(directory) if e.name.endswith(".ass")]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for entry in entries[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def prepared_key(sub_path: str, style: Dict[str, str]) -> str:
+    """Hash of the subtitle's bytes and the style applied to it (blocking)."""
+    digest = hashlib.sha1(json.dumps(style, sort_keys=True).encode())
+    digest.update(format_of(sub_path).encode())
+    with open(sub_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+async def prepare_subtitles(sub_path: str, user_settings) -> str:
+    """A styled ASS copy of sub_path from the cache, written on the first use of a file and style.
+
+    Falls back to sub_path itself when it can't be converted, the caller
+    then has to style it with force_style.
+    """
+    style = style_for(user_settings)
+    os.makedirs(Config.SUBTITLE_CACHE_DIR, exist_ok=True)
+    key = await asyncio.to_thread(prepared_key, sub_path, style)
+    out_path = os.path.join(Config.SUBTITLE_CACHE_DIR, f"{key}.ass")
+    if os.path.exists(out_path):
+        os.utime(out_path)
+        return out_path
+    try:
+        await asyncio.to_thread(_prepare, sub_path, out_path, style)
+    except (ConversionError, OSError, UnicodeError) as e:
+        logger.warning(f"Couldn't prepare {sub_path}, using it as is: {e}")
+        return sub_path
+    await asyncio.to_thread(_prune, Config.SUBTITLE_CACHE_DIR, Config.SUBTITLE_CACHE_FILES)
+    return out_path
+
+
+def fontconfig_file() -> str:
+    """A fontconfig file that only knows the project's fonts directory, written once."""
+    cache_dir = os.path.abspath(os.path.join(Config.SUBTITLE_CACHE_DIR, "fontconfig"))
+    path = os.path.join(cache_dir, "fonts.conf")
+    config = FONTCONFIG_TEMPLATE.format(fonts=os.path.abspath(Config.FONTS_DIR), cache=cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == config:
+                return path
+    with open(path, "w") as f:
+        f.write(config)
+    return path
+
+
+def configure_fonts() -> None:
+    """Point every ffmpeg we start at the project fonts instead of a scan of the system ones."""
+    if "FONTCONFIG_FILE" not in os.environ:
+        os.environ["FONTCONFIG_FILE"] = fontconfig_file()
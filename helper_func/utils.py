@@ -1,61 +1,110 @@
 import logging
 import time
 import asyncio
-import re
+import math
+from collections import deque
+
+from helper_func.progress_bar import TimeFormatter
+from helper_func.message_updater import updater
 
 logger = logging.getLogger(__name__)
 
-# Regex pattern to parse FFmpeg progress
-PROGRESS_PATTERN = re.compile(r'(frame|fps|size|time|bitrate|speed)\s*=\s*(\S+)')
-
-def parse_progress(line: str):
-    """Parse FFmpeg progress output into a dictionary."""
-    return dict(PROGRESS_PATTERN.findall(line))
-
-async def readlines(stream):
-    """Asynchronously read lines from a stream."""
-    pattern = re.compile(br'[\r\n]+')
-    data = bytearray()
-    while not stream.at_eof():
-        lines = pattern.split(data)
-        data[:] = lines.pop(-1)
-        for line in lines:
-            yield line
-        data.extend(await stream.read(1024))
-
-async def safe_edit_message(msg, new_text: str, retries: int = 1):
-    """Safely edit a message with retry logic, avoiding unnecessary edits."""
-    for attempt in range(retries + 1):
+# Arguments that make ffmpeg write key=value progress blocks to stdout instead of stats to stderr
+PROGRESS_ARGS = ['-progress', 'pipe:1', '-nostats']
+
+# Number of stderr lines kept for error reports
+ERROR_LOG_LINES = 200
+
+def parse_progress_block(lines) -> dict:
+    """Turn one `-progress` block (key=value lines) into a dictionary."""
+    progress = {}
+    for line in lines:
+        key, sep, value = line.partition('=')
+        if sep:
+            progress[key.strip()] = value.strip()
+    return progress
+
+def progress_seconds(progress: dict) -> float:
+    """Output position in seconds from a `-progress` block."""
+    # out_time_ms is in microseconds as well, ffmpeg kept the name for compatibility
+    for key in ('out_time_us', 'out_time_ms'):
         try:
-            if msg.text != new_text:  # ✅ Prevents 400 MESSAGE_NOT_MODIFIED error
-                await msg.edit(new_text)
+            return max(0, int(progress[key])) / 1_000_000
+        except (KeyError, ValueError):
+            continue
+    return 0.0
+
+def format_progress(progress: dict, duration: float, start: float) -> str:
+    """Progress message with percentage, fps and ETA when the duration is known."""
+    position = progress_seconds(progress)
+    fps = progress.get('fps', 'N/A')
+    speed = progress.get('speed', 'N/A').rstrip('x') or 'N/A'
+
+    if not duration:
+        return (
+            "🔄 **Processing...**\n"
+            f"⏳ Time: `{TimeFormatter(position * 1000) or '0s'}`\n"
+            f"🎞 FPS: `{fps}` | ⚡ Speed: `{speed}x`"
+        )
+
+    percentage = min(100.0, position * 100 / duration)
+    elapsed = time.time() - start
+    eta = elapsed * (duration - position) / position if position else 0
+    return (
+        "🔄 **Processing...**\n"
+        "[{0}{1}] {2}%\n".format(
+            ''.join("◼️" for _ in range(math.floor(percentage / 10))),
+            ''.join("◻️" for _ in range(10 - math.floor(percentage / 10))),
+            round(percentage, 1)
+        ) +
+        f"🎞 FPS: `{fps}` | ⚡ Speed: `{speed}x`\n"
+        f"⏳ ETA: `{TimeFormatter(eta * 1000) or '0s'}`"
+    )
+
+async def safe_edit_message(msg, new_text: str):
+    """Edit a message through the shared updater and wait until it is delivered."""
+    await updater.edit(msg, new_text)
+
+async def _lines(stream):
+    """Yield decoded lines from a stream, splitting over-long ones instead of failing."""
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # Line longer than the StreamReader limit, take what is buffered
+            line = await stream.read(2 ** 16)
+        if not line:
             return
-        except Exception as e:
-            logger.warning(f"Edit failed: {e}")
-            if "messages.EditMessage" in str(e) and attempt < retries:
-                await asyncio.sleep(5)
-            else:
-                logger.error(f"Failed to edit message after {retries} retries: {e}")
-                break
-
-async def read_stderr(start: float, msg, process) -> str:
-    """Read FFmpeg stderr and update progress messages."""
-    error_log = []
-    last_edit_time = time.time()
-    
-    async for line in readlines(process.stderr):
-        line_str = line.decode('utf-8', errors='ignore')
-        error_log.append(line_str)
-        progress = parse_progress(line_str)
-        
-        if progress and (time.time() - last_edit_time >= 10):  # ✅ Updates every 10 seconds
-            text = (
-                "🔄 **Processing...**\n"
-                f"📦 Size: `{progress.get('size', 'N/A')}`\n"
-                f"⏳ Time: `{progress.get('time', 'N/A')}`\n"
-                f"⚡ Speed: `{progress.get('speed', 'N/A')}`"
-            )
-            await safe_edit_message(msg, text)
-            last_edit_time = time.time()
-    
+        yield line.decode('utf-8', errors='ignore').rstrip('\r\n')
+
+async def drain_stderr(process, max_lines: int = ERROR_LOG_LINES) -> str:
+    """Read stderr to the end, keeping only the last lines in a ring buffer."""
+    error_log = deque(maxlen=max_lines)
+    async for line in _lines(process.stderr):
+        error_log.append(line)
     return "\n".join(error_log)
+
+async def read_progress(msg, process, duration: float = 0.0, interval: float = 1) -> str:
+    """Follow ffmpeg `-progress pipe:1` output, update msg and return the tail of stderr.
+
+    The command must include PROGRESS_ARGS. Updates are handed to the shared
+    updater at most every `interval` seconds without waiting for delivery.
+    """
+    start = time.time()
+    last_edit_time = start
+
+    async def follow():
+        nonlocal last_edit_time
+        block = []
+        async for line in _lines(process.stdout):
+            block.append(line)
+            if not line.startswith('progress='):
+                continue
+            progress = parse_progress_block(block)
+            block = []
+            if msg and time.time() - last_edit_time >= interval:
+                updater.update(msg, format_progress(progress, duration, start))
+                last_edit_time = time.time()
+
+    error_output, _ = await asyncio.gather(drain_stderr(process), follow())
+    return error_output
@@ -1,26 +1,73 @@
 # (c) DevXkirito
 
+import time
+started = time.monotonic()
+
+import asyncio
+import importlib
 import logging
-logging.basicConfig(level = logging.DEBUG,
+import os
+import pkgutil
+from config import Config
+
+logging.basicConfig(level = getattr(logging, Config.LOG_LEVEL, logging.INFO),
                      format="%(asctime)s - %(name)s - %(message)s - %(levelname)s")
+logging.getLogger('pyrogram').setLevel(logging.WARNING)
 
 logger = logging.getLogger(__name__)
 
-import os
-from config import Config
-from helper_func.dbhelper import Database as Db  # Import callback handler
+from helper_func.dbhelper import get_db
 
-db = Db().setup()
+db = get_db()  # Shared by every plugin
 
 import pyrogram
-logging.getLogger('pyrogram').setLevel(logging.WARNING)
 
-if __name__ == '__main__':
+PLUGINS_ROOT = 'plugins'
 
+
+def prepare(loop) -> float:
+    """Everything startup does before connecting to Telegram, returns the seconds it took."""
     if not os.path.isdir(Config.DOWNLOAD_DIR):
         os.mkdir(Config.DOWNLOAD_DIR)
 
-    plugins = dict(root='plugins')
+    # Cached on disk per ffmpeg binary, so this only runs ffmpeg after an upgrade
+    from helper_func.capabilities import capabilities
+    capabilities.load()
+    if capabilities.available:
+        missing = [name for name in ("libx264", "libx265") if not capabilities.has_encoder(name)]
+        missing += [name for name in ("subtitles", "drawtext") if not capabilities.has_filter(name)]
+        if missing:
+            logger.warning(f"{capabilities.version} lacks {', '.join(missing)}, jobs needing them are refused")
+
+    # Nothing is running yet, so every file no session points at is left over from a crash
+    from helper_func.storage import storage
+    reclaimed = loop.run_until_complete(storage.sweep(max_age=0))
+    logger.info(f"Startup sweep reclaimed {reclaimed} bytes")
+
+    # Imported here rather than by pyrogram so the time they take is counted
+    for module in pkgutil.iter_modules([PLUGINS_ROOT]):
+        importlib.import_module(f"{PLUGINS_ROOT}.{module.name}")
+
+    elapsed = time.monotonic() - started
+    if elapsed > Config.STARTUP_TARGET:
+        logger.warning(f"Startup took {elapsed:.2f}s, over the {Config.STARTUP_TARGET}s target")
+    else:
+        logger.info(f"Started in {elapsed:.2f}s")
+    return elapsed
+
+
+if __name__ == '__main__':
+
+    loop = asyncio.get_event_loop()
+    prepare(loop)
+
+    from helper_func.storage import storage
+    loop.create_task(storage.janitor())
+
+    from helper_func.metrics import metrics
+    loop.create_task(metrics.serve())
+
+    plugins = dict(root=PLUGINS_ROOT)
 
     app = pyrogram.Client(
         'Subtitle Muxer',
@@ -29,5 +76,5 @@ if __name__ == '__main__':
         api_hash = Config.API_HASH,
         plugins = plugins
     )
-    
+
     app.run()
@@ -0,0 +1,100 @@
+import logging
+import os
+import shutil
+import time
+from pyrogram import Client, filters
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from config import Config
+from helper_func.convert import ConversionError, convert, convert_archive, format_of
+from helper_func.storage import storage
+from helper_func.utils import safe_edit_message
+
+logger = logging.getLogger(__name__)
+
+async def _check_user(filt, c, m):
+    return str(m.from_user.id) in Config.ALLOWED_USERS
+
+check_user = filters.create(_check_user)
+
+# Source and target format of every conversion offered by /convert
+CONVERSIONS = {
+    "srt_ass": "SRT ➝ ASS",
+    "ass_srt": "ASS ➝ SRT",
+    "txt_ass": "TXT ➝ ASS",
+    "srt_vtt": "SRT ➝ VTT",
+    "vtt_srt": "VTT ➝ SRT",
+    "vtt_ass": "VTT ➝ ASS",
+}
+
+# Users who picked a conversion and whose next document is the file to convert
+user_states = {}
+
+async def _waiting_for_file(filt, c, m):
+    return m.from_user and m.from_user.id in user_states
+
+waiting_for_file = filters.create(_waiting_for_file)
+
+@Client.on_message(filters.command("convert") & check_user & filters.private)
+async def start_conversion(client, message):
+    """Show the conversions a subtitle file can go through."""
+    buttons = [
+        [InlineKeyboardButton(label, callback_data=f"format_{key}")]
+        for key, label in CONVERSIONS.items()
+    ]
+    await message.reply_text(
+        "🔄 Select the subtitle conversion:\nA .zip of subtitles is converted file by file.",
+        reply_markup=InlineKeyboardMarkup(buttons)
+    )
+
+@Client.on_callback_query(filters.regex("^format_"))
+async def handle_format_selection(client, callback_query: CallbackQuery):
+    conversion = callback_query.data.replace("format_", "", 1)
+    if conversion not in CONVERSIONS:
+        await callback_query.answer("⚠️ Unknown conversion", show_alert=True)
+        return
+
+    user_states[callback_query.from_user.id] = conversion
+    await callback_query.answer()
+    await callback_query.message.edit_text(f"📄 {CONVERSIONS[conversion]}\nNow send me the subtitle file or a .zip of them.")
+
+# Runs before the muxing upload handlers and stops them from also saving the file
+@Client.on_message(filters.document & check_user & filters.private & waiting_for_file, group=-1)
+async def handle_subtitle(client, message):
+    """Convert the file a user sent after picking a conversion."""
+    user_id = message.from_user.id
+    src_format, dst_format = user_states.pop(user_id).split("_")
+    file_name = os.path.basename(message.document.file_name or f"subtitle.{src_format}")
+    work_dir = os.path.join(Config.DOWNLOAD_DIR, f"convert_{user_id}_{round(time.time())}")
+    owner = ("convert", user_id)
+    storage.track(owner, work_dir)
+    sent_msg = await message.reply_text("🔄 Converting...")
+
+    try:
+        is_zip = format_of(file_name) == "zip"
+        if not is_zip and format_of(file_name) != src_format:
+            await safe_edit_message(sent_msg, f"❌ Expected a .{src_format} file, got `{file_name}`. Use /convert to start again.")
+            return
+
+        os.makedirs(work_dir, exist_ok=True)
+        src = await client.download_media(message, file_name=os.path.join(work_dir, file_name))
+
+        if is_zip:
+            out_path, converted, errors = await convert_archive(src, dst_format, [src_format])
+            caption = f"✅ Converted {converted} file(s) to {dst_format.upper()}."
+            if errors:
+                caption += f"\n⚠️ {len(errors)} failed:\n" + "\n".join(errors[:10])
+        else:
+            out_path, cues = await convert(src, dst_format)
+            caption = f"✅ Converted {cues} lines to {dst_format.upper()}."
+
+        await message.reply_document(out_path, caption=caption[:1024])
+        await sent_msg.delete()
+    except ConversionError as e:
+        await safe_edit_message(sent_msg, f"❌ Conversion failed: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error converting {file_name}: {e}")
+        await safe_edit_message(sent_msg, f"❌ An error occurred: {str(e)}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        await storage.release(owner, delete=True)
+        message.stop_propagation()
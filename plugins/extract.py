@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from pyrogram import Client, filters
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from config import Config
+from helper_func.extract import ExtractionError, archive_tracks, extract_subtitles
+from helper_func.media_store import media_store, telegram_key
+from helper_func.progress_bar import progress_bar
+from helper_func.storage import storage, InsufficientStorage
+from helper_func.utils import safe_edit_message
+
+logger = logging.getLogger(__name__)
+
+async def _check_user(filt, c, m):
+    return str(m.from_user.id) in Config.ALLOWED_USERS
+
+check_user = filters.create(_check_user)
+
+# Ways the extracted tracks can be sent back
+DELIVERY = {
+    "zip": "📦 One .zip",
+    "files": "📄 Separate files",
+}
+
+# Users who ran /extract, with how they want the tracks, until they send the video
+user_states = {}
+
+async def _waiting_for_video(filt, c, m):
+    return m.from_user and m.from_user.id in user_states
+
+waiting_for_video = filters.create(_waiting_for_video)
+
+@Client.on_message(filters.command("extract") & check_user & filters.private)
+async def start_extraction(client, message):
+    """Ask how the subtitle tracks of the next video should be sent."""
+    buttons = [[InlineKeyboardButton(label, callback_data=f"extract_{key}")] for key, label in DELIVERY.items()]
+    await message.reply_text(
+        "🗂 Every subtitle track of the video is extracted in its own format.\nHow should I send them?",
+        reply_markup=InlineKeyboardMarkup(buttons)
+    )
+
+@Client.on_callback_query(filters.regex("^extract_"))
+async def handle_delivery_selection(client, callback_query: CallbackQuery):
+    delivery = callback_query.data.replace("extract_", "", 1)
+    if delivery not in DELIVERY:
+        await callback_query.answer("⚠️ Unknown option", show_alert=True)
+        return
+
+    user_states[callback_query.from_user.id] = delivery
+    await callback_query.answer()
+    await callback_query.message.edit_text(f"{DELIVERY[delivery]}\n📂 Now send me the video file.")
+
+async def download_video(client, message, media, work_dir, sent_msg, owner):
+    """The video's path in work_dir, linked from the media store when it was sent before."""
+    file_name = os.path.basename(media.file_name or f"video_{media.file_unique_id}.mkv")
+    path = os.path.join(work_dir, file_name)
+    key = telegram_key(media.file_unique_id)
+    if await media_store.checkout(key, path):
+        return path
+    # The download's own claim, so releasing it leaves work_dir tracked under owner
+    async with storage.claim(owner + ("download",), media.file_size or 0):
+        path = await client.download_media(
+            message,
+            file_name=path,
+            progress=progress_bar,
+            progress_args=("Downloading", sent_msg, time.time()),
+        )
+    if path and path.lower().endswith((".mp4", ".mkv")):
+        await media_store.add(key, path)
+    return path
+
+# Runs before the muxing upload handlers and stops them from also saving the file
+@Client.on_message((filters.video | filters.document) & check_user & filters.private & waiting_for_video, group=-1)
+async def handle_video(client, message):
+    """Extract the subtitle tracks of the video a user sent after /extract."""
+    user_id = message.from_user.id
+    delivery = user_states.pop(user_id)
+    media = message.video or message.document
+    work_dir = os.path.join(Config.DOWNLOAD_DIR, f"extract_{user_id}_{round(time.time())}")
+    owner = ("extract", user_id, message.id)
+    storage.track(owner, work_dir)
+    sent_msg = await message.reply_text("📥 Downloading your video...")
+    video_path = None
+
+    try:
+        os.makedirs(work_dir, exist_ok=True)
+        video_path = await download_video(client, message, media, work_dir, sent_msg, owner)
+        if not video_path:
+            await safe_edit_message(sent_msg, "❌ Downloading Failed!")
+            return
+
+        await safe_edit_message(sent_msg, "🗂 Extracting subtitle tracks...")
+        tracks = await extract_subtitles(video_path, os.path.join(work_dir, "subs"))
+        listing = "\n".join(f"• {track.describe()}" for track, _ in tracks)
+
+        if delivery == "zip":
+            base = os.path.splitext(os.path.basename(video_path))[0]
+            zip_path = await asyncio.to_thread(
+                archive_tracks, [path for _, path in tracks], os.path.join(work_dir, f"{base}.subs.zip")
+            )
+            await message.reply_document(zip_path, caption=f"✅ Extracted {len(tracks)} track(s):\n{listing}"[:1024])
+        else:
+            for track, path in tracks:
+                await message.reply_document(path, caption=f"✅ {track.describe()}")
+        await sent_msg.delete()
+    except InsufficientStorage as e:
+        await safe_edit_message(sent_msg, f"💾 Not enough disk space right now, try again later.\n{e}")
+    except ExtractionError as e:
+        await safe_edit_message(sent_msg, f"❌ {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error extracting subtitles for {user_id}: {e}")
+        await safe_edit_message(sent_msg, f"❌ An error occurred: {str(e)}")
+    finally:
+        media_store.release(video_path)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        await storage.release(owner, delete=True)
+        message.stop_propagation()
@@ -7,12 +7,7 @@ from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG,
-                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
 logger = logging.getLogger(__name__)
-logging.getLogger('pyrogram').setLevel(logging.WARNING)
 
 # Start Command
 @Client.on_message(filters.command(['start']))
@@ -55,7 +50,10 @@ async def help_callback(bot, query):
         "**Welcome to the Help Section**\n\n"
         "1️⃣ Send a Video File.\n"
         "2️⃣ Send a Subtitle File. (ass or srt)\n"
-        "3️⃣ Select the Mux Type!\n\n"
+        "3️⃣ Select the Mux Type!\n"
+        "4️⃣ Use /queue to see your position or /cancel to drop your job, /storage for disk usage.\n"
+        "🔄 Use /convert to change subtitles between SRT, ASS, VTT and TXT.\n"
+        "🗂 Use /extract to pull every subtitle track out of a video.\n\n"
         "⚠️ **Note:** Only English fonts are supported in Hardmux.\n"
         "Other fonts will appear as empty blocks in the video!\n\n"
         "Created by 💕 CHS ANIME"
@@ -93,7 +91,7 @@ async def about_callback(bot, query):
     ))
 
 # Back to Start Command (Callback)
-@Client.on_callback_query(filters.regex("start"))
+@Client.on_callback_query(filters.regex("^start$"))
 async def back_to_start(bot, query):
     await query.answer()  # Confirm button press (faster response)
     
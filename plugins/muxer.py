@@ -1,14 +1,29 @@
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from helper_func.progress_bar import progress_bar
-from helper_func.dbhelper import Database as Db
-from helper_func.ffmpeg import hardmux_vid
+from helper_func.session import sessions
+from helper_func.media_store import media_store
+from helper_func.result_cache import result_cache, result_key
+from helper_func.capabilities import capabilities
+from helper_func.ffmpeg import adapt_encoding, hardmux_vid, hardmux_ladder, hardmux_stream, softmux_vid, hardmux_output, hardmux_outputs, ladder_output
+from helper_func.ingest import is_streamable, prepend
+from helper_func.pipelined_upload import PipelinedUpload, TelegramSink, send_uploaded
+from helper_func.storage import storage, InsufficientStorage
+from helper_func.progress_bar import humanbytes
+from helper_func.job_queue import job_queue, Job, JobCancelled
+from helper_func.message_updater import updater
+from helper_func.metrics import JobTrace, metrics
+from helper_func.planner import plan_hardmux, plan_ladder, resolution_map
+from helper_func.probe import MediaInfo, probe
+from helper_func.styling import prepare_subtitles
+from helper_func.utils import safe_edit_message
 from config import Config
+import asyncio
+import logging
 import time
 import os
-import json
 
-db = Db()
+logger = logging.getLogger(__name__)
 
 async def _check_user(filt, c, m):
     chat_id = str(m.from_user.id)
@@ -16,23 +31,26 @@ async def _check_user(filt, c, m):
 
 check_user = filters.create(_check_user)
 
-# Store user preferences (Temporary Storage)
-user_preferences = {}
+# Users whose hardmux is being set up but not queued yet
+starting_users = set()
+
+# Users who picked the custom watermark and whose next text message is its text
+watermark_states = set()
+# Longest custom watermark, it has to fit in a corner of a 480p frame
+MAX_WATERMARK_LENGTH = 40
+
+async def _waiting_for_watermark(filt, c, m):
+    return m.from_user and m.from_user.id in watermark_states
+
+waiting_for_watermark = filters.create(_waiting_for_watermark)
+
+# Callback option names that differ from their preference keys
+OPTION_KEYS = {"bitdepth": "bit_depth", "fontsize": "font_size"}
 
 # --- 🔹 Dynamic Button Handlers ---
 async def get_dynamic_keyboard(chat_id):
     """Generate InlineKeyboard with user preferences."""
-    if chat_id not in user_preferences:
-        user_preferences[chat_id] = {
-            "codec": "libx264",
-            "crf": "22",
-            "bit_depth": "8bit",
-            "resolution": "1280x720",
-            "font_size": "20",
-            "watermark": "CHS Anime"
-        }
-
-    prefs = user_preferences[chat_id]
+    prefs = (await sessions.get(chat_id)).settings
 
     keyboard = [
         [
@@ -47,6 +65,10 @@ async def get_dynamic_keyboard(chat_id):
             InlineKeyboardButton(f"🔤 Font Size: {prefs['font_size']}", callback_data="set_fontsize"),
             InlineKeyboardButton(f"💧 Watermark: {prefs['watermark']}", callback_data="set_watermark")
         ],
+        [
+            InlineKeyboardButton(f"⚡ Preset: {prefs['preset']}", callback_data="set_preset"),
+            InlineKeyboardButton(f"⚙️ Mode: {prefs['mode']}", callback_data="set_mode")
+        ],
         [InlineKeyboardButton("✅ Start Hardmux", callback_data="start_hardmux")]
     ]
 
@@ -56,18 +78,6 @@ async def get_dynamic_keyboard(chat_id):
 async def set_preferences(client, message):
     """Send dynamic buttons for users to select preferences."""
     chat_id = message.from_user.id
-    
-    # ✅ Initialize defaults if not present
-    if chat_id not in user_preferences:
-        user_preferences[chat_id] = {
-            "codec": "libx264",
-            "crf": "22",
-            "bit_depth": "8bit",
-            "resolution": "1280x720",
-            "font_size": "20",
-            "watermark": "CHS Anime"
-        }
-
     await message.reply_text("🔧 **Select Encoding Preferences:**", reply_markup=await get_dynamic_keyboard(chat_id))
     
 @Client.on_callback_query(filters.regex(r"set_(.+)"))
@@ -77,27 +87,54 @@ async def update_preferences(client, callback: CallbackQuery):
     option = callback.data.split("_")[1]
 
     options_map = {
-        "codec": ["libx264", "libx265"],
+        "codec": [c for c in ("libx264", "libx265") if capabilities.has_encoder(c)] or ["libx264"],
         "crf": ["18", "22", "28"],
+        "preset": ["auto", "ultrafast", "veryfast", "medium", "slow"],
         "bitdepth": ["8bit", "10bit"],
         "resolution": ["854x480", "1280x720", "1920x1080"],
         "fontsize": ["16", "20", "24"],
-        "watermark": ["CHS Anime", "Custom Text", "None"]
+        "watermark": ["CHS Anime", "Custom Text", "None"],
+        "mode": ["single", "segmented", "ladder"]
     }
 
-    current_value = user_preferences[chat_id].get(option, options_map[option][0])
-    new_index = (options_map[option].index(current_value) + 1) % len(options_map[option])
-    user_preferences[chat_id][option] = options_map[option][new_index]
+    key = OPTION_KEYS.get(option, option)
+    current_value = (await sessions.get(chat_id)).settings.get(key, options_map[option][0])
+    current_index = options_map[option].index(current_value) if current_value in options_map[option] else -1
+    new_value = options_map[option][(current_index + 1) % len(options_map[option])]
+    await sessions.set_preference(chat_id, key, new_value)
 
     await callback.message.edit_text("🔧 **Updated Preferences:**", reply_markup=await get_dynamic_keyboard(chat_id))
     await callback.answer("Updated!")
+    if key == "watermark" and new_value == "Custom Text":
+        watermark_states.add(chat_id)
+        await client.send_message(chat_id, f"✍️ Send the text for your watermark (up to {MAX_WATERMARK_LENGTH} characters).")
+    elif key == "watermark":
+        watermark_states.discard(chat_id)
+
+# Runs before the URL handler so the text isn't taken for a link
+@Client.on_message(filters.text & check_user & filters.private & waiting_for_watermark, group=-1)
+async def set_watermark_text(client, message):
+    """Save the text a user sent after choosing the custom watermark."""
+    chat_id = message.from_user.id
+    text = message.text.strip()
+    if text.startswith("/"):
+        # A command instead of the text, keep the previous one
+        watermark_states.discard(chat_id)
+        return
+    if len(text) > MAX_WATERMARK_LENGTH:
+        await message.reply_text(f"⚠️ Keep the watermark under {MAX_WATERMARK_LENGTH} characters, send it again.")
+    else:
+        watermark_states.discard(chat_id)
+        await sessions.set_preference(chat_id, "watermark_text", text)
+        await message.reply_text(f"💧 Watermark set to: {text}")
+    message.stop_propagation()
 
 # --- 🔹 Hardmux Function ---
 @Client.on_message(filters.command('hardmux') & check_user & filters.private)
 async def hardmux(client, message):
     chat_id = message.from_user.id
-    og_vid_filename = db.get_vid_filename(chat_id)
-    og_sub_filename = db.get_sub_filename(chat_id)
+    session = await sessions.get(chat_id)
+    og_vid_filename, og_sub_filename = session.vid_name, session.sub_name
 
     # Validation Checks
     text = ''
@@ -116,44 +153,516 @@ async def hardmux(client, message):
 @Client.on_callback_query(filters.regex("start_hardmux"))
 async def start_hardmux(client, callback: CallbackQuery):
     chat_id = callback.from_user.id
-    og_vid_filename = db.get_vid_filename(chat_id)
-    og_sub_filename = db.get_sub_filename(chat_id)
-
-    if not og_vid_filename or not og_sub_filename:
+    session = await sessions.get(chat_id)
+    if not session.vid_name or not session.sub_name:
         await callback.answer("⚠️ Missing files. Please upload them first!", show_alert=True)
         return
 
-    sent_msg = await client.send_message(chat_id, "⏳ Your File is Being Hard Subbed. This might take a long time!")
+    if job_queue.get(chat_id) or chat_id in starting_users:
+        await callback.answer("⚠️ You already have a job in the queue. Use /cancel to drop it.", show_alert=True)
+        return
+
+    # Marked before the first await so a double tap can't start a second job
+    starting_users.add(chat_id)
+    try:
+        await run_hardmux(client, callback, session)
+    finally:
+        starting_users.discard(chat_id)
 
-    hardmux_filename = await hardmux_vid(og_vid_filename, og_sub_filename, sent_msg, user_preferences.get(chat_id, {}))
-    if not hardmux_filename:
+async def run_hardmux(client, callback: CallbackQuery, session):
+    """Send a cached or coalesced result, or queue and run the encode."""
+    chat_id = callback.from_user.id
+    og_vid_filename, og_sub_filename, final_filename = session.vid_name, session.sub_name, session.filename
+    settings = dict(session.settings)
+    problems = await asyncio.to_thread(capabilities.check, settings)
+    if problems:
+        await callback.answer("⚠️ " + " ".join(problems), show_alert=True)
         return
-    
-    final_filename = db.get_filename(chat_id)
-    os.rename(os.path.join(Config.DOWNLOAD_DIR, hardmux_filename), os.path.join(Config.DOWNLOAD_DIR, final_filename))
+    key = await asyncio.to_thread(
+        result_key,
+        os.path.join(Config.DOWNLOAD_DIR, og_vid_filename),
+        os.path.join(Config.DOWNLOAD_DIR, og_sub_filename),
+        settings
+    )
+    if await send_cached_result(client, chat_id, key, final_filename):
+        await callback.answer("⚡ Already encoded, sending it!")
+        await cleanup_files(chat_id, og_vid_filename, og_sub_filename)
+        await metrics.finish(JobTrace(chat_id, "hardmux"), "cached")
+        return
+
+    # Identical jobs share one encode: wait for the running one and send its upload
+    answered = False
+    while not result_cache.begin(key):
+        if not answered:
+            answered = True
+            await callback.answer("🔗 The same job is already running, sharing its result!")
+            sent_msg = await client.send_message(chat_id, "🔗 An identical hardmux is already running, waiting for it...")
+        running = result_cache.running(key)
+        if running and await running and await send_cached_result(client, chat_id, key, final_filename):
+            await safe_edit_message(sent_msg, "✅ File Successfully Uploaded!")
+            await cleanup_files(chat_id, og_vid_filename, og_sub_filename)
+            await metrics.finish(JobTrace(chat_id, "hardmux"), "coalesced")
+            return
+        # The running job failed or was cancelled, whoever claims the key next does the encode
+
+    uploads = None
+    pipeline = None
+    owner = f"hardmux:{chat_id}"
+    job = Job(chat_id)
+    outcome = "failed"
+    try:
+        # An output is rarely bigger than the source, reserve that much per output before queueing
+        # so a job waiting for disk space doesn't hold an encode slot
+        storage.track(owner, *hardmux_outputs(og_vid_filename))
+        outputs_count = len(resolution_map) if settings.get("mode") == "ladder" else 1
+        source_size = os.path.getsize(os.path.join(Config.DOWNLOAD_DIR, og_vid_filename))
+        job.trace.bytes_in = source_size
+        space_msg = None
+        if source_size * outputs_count > storage.available():
+            if not answered:
+                answered = True
+                await callback.answer("💾 Waiting for disk space...")
+            space_msg = await client.send_message(chat_id, "💾 Waiting for disk space to free up for your job...")
+        try:
+            await storage.reserve(owner, source_size * outputs_count, wait=Config.STORAGE_WAIT)
+        except InsufficientStorage as e:
+            outcome = "no_space"
+            text = f"💾 Not enough disk space for this job right now, try again later.\n{e}"
+            if space_msg:
+                await safe_edit_message(space_msg, text)
+            else:
+                await client.send_message(chat_id, text)
+            return
+
+        position = job_queue.submit(job)
+        if not answered:
+            await callback.answer("✅ Hardmuxing Started!" if not position else f"⏳ Queued at position {position}")
+
+        if position:
+            text = f"⏳ Your job is queued at position {position}.\nSend /cancel to drop it."
+        else:
+            text = "⏳ Your File is Being Hard Subbed. This might take a long time!"
+        if space_msg:
+            sent_msg = space_msg
+            updater.update(sent_msg, text)
+        else:
+            sent_msg = await client.send_message(chat_id, text)
+
+        try:
+            async with job_queue.slot(job):
+                job.trace.add("queue", job.wait_time)
+                if position:
+                    updater.update(sent_msg, "⏳ Your File is Being Hard Subbed. This might take a long time!")
+                if settings.get("mode") == "ladder":
+                    outputs = await hardmux_ladder(og_vid_filename, og_sub_filename, sent_msg, settings, job=job)
+                else:
+                    # A single encode can be uploaded while ffmpeg is still writing it
+                    if Config.PIPELINED_UPLOAD and settings.get("mode", "single") == "single":
+                        pipeline = PipelinedUpload(
+                            TelegramSink(client), os.path.join(Config.DOWNLOAD_DIR, hardmux_output(og_vid_filename))
+                        )
+                        pipeline.start()
+                    hardmux_filename = await hardmux_vid(
+                        og_vid_filename, og_sub_filename, sent_msg, settings, job=job, fragmented=bool(pipeline)
+                    )
+                    outputs = [("", hardmux_filename)] if hardmux_filename else False
+        except JobCancelled:
+            outcome = "cancelled"
+            await safe_edit_message(sent_msg, "🚫 Your queued job was cancelled.")
+            return
+        if not outputs:
+            return
+
+        # Every rendition of a ladder goes out as its own file
+        uploads = []
+        with job.trace.span("upload"):
+            for part, out_filename in outputs:
+                name = final_filename or out_filename
+                if part:
+                    name = f"{os.path.splitext(name)[0]} [{part}]"
+                job.trace.bytes_out += os.path.getsize(os.path.join(Config.DOWNLOAD_DIR, out_filename))
+                if pipeline:
+                    file_id, uploaded_name = await upload_pipelined(client, chat_id, sent_msg, pipeline, out_filename, name, owner)
+                else:
+                    file_id, uploaded_name = await upload_file(client, chat_id, sent_msg, out_filename, name, owner)
+                uploads.append((part, file_id, uploaded_name))
+        with job.trace.span("cleanup"):
+            await cleanup_files(chat_id, og_vid_filename, og_sub_filename)
+        outcome = "ok" if all(file_id for _, file_id, _ in uploads) else "upload_failed"
+    finally:
+        if pipeline:
+            await pipeline.abort()
+        await storage.release(owner, delete=True)
+        await metrics.finish(job.trace, "cancelled" if job.cancelled else outcome)
+        # Only a complete set of uploads can stand in for the encode
+        complete = uploads and all(file_id for _, file_id, _ in uploads)
+        await result_cache.finish(key, uploads if complete else None)
+
+async def ingest_hardmux(client, message, media, key, og_filename, filename, sent_msg):
+    """Hardmux a video while it is still downloading, when its subtitle was sent first.
+
+    Returns False without having saved anything when the video has to be
+    downloaded first: no subtitle yet, no free encode slot, a mode that needs
+    the whole file, or an MP4 with its index at the end.
+    """
+    chat_id = message.from_user.id
+    session = await sessions.get(chat_id)
+    settings = dict(session.settings)
+    if not session.has_sub or settings.get("mode", "single") != "single":
+        return False
+    if not os.path.exists(os.path.join(Config.FONTS_DIR, "HelveticaRounded-Bold.ttf")):
+        return False
+    if job_queue.get(chat_id) or chat_id in starting_users or not job_queue.has_free_slot():
+        return False
+
+    # Take the slot before the first await, another job could get it in between
+    job = Job(chat_id, "ingest")
+    job.trace.bytes_in = media.file_size or 0
+    try:
+        position = job_queue.submit(job)
+    except ValueError:
+        return False
+    if position:
+        job_queue.withdraw(job)
+        return False
+
+    chunks = None
+    try:
+        # start_hardmux tells the user what is missing once the video is saved
+        if await asyncio.to_thread(capabilities.check, settings):
+            job_queue.withdraw(job)
+            return False
+        chunks = client.stream_media(message)
+        head = await anext(chunks, b"")
+    except Exception as e:
+        logger.warning(f"Couldn't start streaming {og_filename}, downloading it first: {e}")
+        head = None
+    if head is None or not is_streamable(head, filename):
+        if chunks:
+            await chunks.aclose()
+        job_queue.withdraw(job)
+        return False
+
+    # Telegram knows the size of an uploaded video, enough to plan the scaling
+    info = None
+    if message.video and message.video.width:
+        info = MediaInfo(duration=message.video.duration or 0,
+                         width=message.video.width, height=message.video.height)
+
+    path = os.path.join(Config.DOWNLOAD_DIR, filename)
+    download_owner = ("download", chat_id, message.id)
+    owner = f"hardmux:{chat_id}"
+    storage.track(download_owner, path)
+    storage.track(owner, *hardmux_outputs(filename))
+
+    async def abandon():
+        """Free the slot if the block was never entered, stop the download and delete what it wrote."""
+        job_queue.release(job)
+        await chunks.aclose()
+        await storage.release(download_owner, delete=True)
+        await storage.release(owner, delete=True)
+
+    try:
+        # The download and the output each take about the size of the source, reserved without
+        # waiting so the slot taken above never sits idle
+        await storage.reserve(download_owner, media.file_size or 0)
+        await storage.reserve(owner, media.file_size or 0)
+        async with job_queue.slot(job):
+            updater.update(sent_msg, "⚡ Subtitle already here, hardmuxing while your video downloads!")
+            hardmux_filename = await hardmux_stream(
+                prepend(head, chunks), filename, session.sub_name, sent_msg, settings, info, job
+            )
+    except JobCancelled:
+        await abandon()
+        await safe_edit_message(sent_msg, "🚫 Your queued job was cancelled.")
+        await metrics.finish(job.trace, "cancelled")
+        return True
+    except Exception as e:
+        await abandon()
+        if isinstance(e, InsufficientStorage):
+            await safe_edit_message(sent_msg, f"💾 Not enough disk space right now, try again later.\n{e}")
+        else:
+            logger.error(f"Pipelined ingest of {og_filename} failed: {e}")
+            await safe_edit_message(sent_msg, "❌ Downloading Failed!")
+        await metrics.finish(job.trace, "no_space" if isinstance(e, InsufficientStorage) else "failed")
+        return True
+
+    # The download completed whatever the encode did, it is the user's video now
+    await storage.release(download_owner)
+    await media_store.add(key, path)
+    session = await sessions.put_video(chat_id, filename, og_filename)
+    outcome = "failed"
+    try:
+        if not hardmux_filename:
+            await client.send_message(chat_id, "📥 Your video is saved, use /hardmux to try again.")
+            return True
+        job.trace.bytes_out = os.path.getsize(os.path.join(Config.DOWNLOAD_DIR, hardmux_filename))
+        with job.trace.span("upload"):
+            file_id, _ = await upload_file(client, chat_id, sent_msg, hardmux_filename, session.filename, owner)
+        with job.trace.span("cleanup"):
+            await cleanup_files(chat_id, filename, session.sub_name)
+        outcome = "ok" if file_id else "upload_failed"
+    finally:
+        await storage.release(owner, delete=True)
+        await metrics.finish(job.trace, "cancelled" if job.cancelled else outcome)
+    return True
+
+async def send_cached_result(client, chat_id, key, final_filename):
+    """Send the files of an encode uploaded before by file_id, False when there are none to send."""
+    results = await result_cache.get(key)
+    if not results:
+        return False
+    try:
+        for result in results:
+            # A single output takes the user's filename, ladder renditions keep their labelled names
+            caption = final_filename if len(results) == 1 and final_filename else result["file_name"]
+            await client.send_document(chat_id, document=result["file_id"], caption=caption)
+        return True
+    except Exception as e:
+        logger.warning(f"Cached result {key} could not be sent, encoding again: {e}")
+        await result_cache.forget(key)
+        return False
+
+async def upload_file(client, chat_id, sent_msg, out_filename, final_filename, owner=None):
+    """Upload an output under final_filename and delete it. Returns (file_id or None, uploaded name)."""
+    final_filename = final_filename or out_filename
+    # Softmux may switch the container, so keep the extension of what ffmpeg wrote
+    final_filename = os.path.splitext(final_filename)[0] + os.path.splitext(out_filename)[1]
+    if owner:
+        storage.track(owner, os.path.join(Config.DOWNLOAD_DIR, final_filename))
+    os.rename(os.path.join(Config.DOWNLOAD_DIR, out_filename), os.path.join(Config.DOWNLOAD_DIR, final_filename))
 
     start_time = time.time()
+    file_id = None
     try:
-        await client.send_document(
+        uploaded = await client.send_document(
             chat_id,
             progress=progress_bar,
             progress_args=('Uploading your File!', sent_msg, start_time),
             document=os.path.join(Config.DOWNLOAD_DIR, final_filename),
             caption=final_filename
         )
-        await sent_msg.edit(f'✅ File Successfully Uploaded!\n⏳ Time Taken: {round(time.time() - start_time)}s')
+        file_id = uploaded.document.file_id if uploaded and uploaded.document else None
+        await safe_edit_message(sent_msg, f'✅ File Successfully Uploaded!\n⏳ Time Taken: {round(time.time() - start_time)}s')
     except Exception as e:
         print(e)
         await client.send_message(chat_id, '❌ An error occurred while uploading the file!')
 
-    # Safe Cleanup
+    path = os.path.join(Config.DOWNLOAD_DIR, final_filename)
+    if os.path.exists(path):
+        os.remove(path)
+    return file_id, final_filename
+
+async def upload_pipelined(client, chat_id, sent_msg, pipeline, out_filename, final_filename, owner=None):
+    """Finish an upload that streamed during the encode and send it, uploading the file again if that fails.
+
+    Returns (file_id or None, uploaded name) like upload_file.
+    """
+    final_filename = os.path.splitext(final_filename or out_filename)[0] + os.path.splitext(out_filename)[1]
+    path = os.path.join(Config.DOWNLOAD_DIR, out_filename)
+    start_time = time.time()
+    try:
+        await safe_edit_message(sent_msg, "📤 Sending the last parts of your File...")
+        await pipeline.finish()
+        uploaded = await send_uploaded(client, chat_id, pipeline, final_filename, caption=final_filename)
+    except Exception as e:
+        logger.warning(f"Pipelined upload of {out_filename} failed, uploading it again: {e}")
+        return await upload_file(client, chat_id, sent_msg, out_filename, final_filename, owner)
+
+    file_id = uploaded.document.file_id if uploaded and uploaded.document else None
+    await safe_edit_message(
+        sent_msg,
+        f'✅ File Successfully Uploaded!\n⏳ Time after encoding: {round(time.time() - start_time)}s\n'
+        f'📦 {pipeline.streamed}/{pipeline.parts} parts were sent during the encode'
+    )
+    if os.path.exists(path):
+        os.remove(path)
+    return file_id, final_filename
+
+async def cleanup_files(chat_id, og_vid_filename, og_sub_filename):
+    """Remove a finished job's source files and forget them in the user's session."""
+    # The media store keeps its own copy of the sources
+    media_store.release(og_sub_filename)
+    media_store.release(og_vid_filename)
     path = Config.DOWNLOAD_DIR + '/'
     if og_sub_filename and os.path.exists(path + og_sub_filename):
         os.remove(path + og_sub_filename)
     if og_vid_filename and os.path.exists(path + og_vid_filename):
         os.remove(path + og_vid_filename)
-    if final_filename and os.path.exists(path + final_filename):
-        os.remove(path + final_filename)
 
-    db.erase(chat_id)
-    await callback.answer("✅ Hardmuxing Started!")
+    await sessions.clear_files(chat_id)
+
+# --- 🔹 Softmux Function ---
+@Client.on_message(filters.command('softmux') & check_user & filters.private)
+async def softmux(client, message):
+    """Add the subtitle as a track with stream copy, no re-encode."""
+    chat_id = message.from_user.id
+    session = await sessions.get(chat_id)
+    og_vid_filename, og_sub_filename, final_filename = session.vid_name, session.sub_name, session.filename
+
+    text = ''
+    if not og_vid_filename or not os.path.exists(os.path.join(Config.DOWNLOAD_DIR, og_vid_filename)):
+        text += 'First send a Video File\n'
+    if not og_sub_filename or not os.path.exists(os.path.join(Config.DOWNLOAD_DIR, og_sub_filename)):
+        text += 'Send a Subtitle File!'
+
+    if text:
+        await client.send_message(chat_id, text)
+        return
+
+    if job_queue.get(chat_id) or chat_id in starting_users:
+        await client.send_message(chat_id, "⚠️ Your files are in use by another job. Use /cancel to drop it first.")
+        return
+
+    owner = f"softmux:{chat_id}"
+    base = os.path.join(Config.DOWNLOAD_DIR, os.path.splitext(og_vid_filename)[0])
+    storage.track(owner, base + "_softmuxed.mp4", base + "_softmuxed.mkv")
+    job = Job(chat_id, "softmux")
+    source_size = os.path.getsize(os.path.join(Config.DOWNLOAD_DIR, og_vid_filename))
+    job.trace.bytes_in = source_size
+    outcome = "failed"
+    # Marked until the job is queued so a hardmux of the same files can't start meanwhile
+    starting_users.add(chat_id)
+    try:
+        try:
+            # Stream copy writes about as much as the source, reserved before queueing so no slot waits on it
+            await storage.reserve(owner, source_size)
+        except InsufficientStorage as e:
+            outcome = "no_space"
+            await client.send_message(chat_id, f"💾 Not enough disk space right now, try again later.\n{e}")
+            return
+        finally:
+            starting_users.discard(chat_id)
+
+        position = job_queue.submit(job)
+        if position:
+            sent_msg = await client.send_message(chat_id, f"⏳ Your softmux is queued at position {position}.\nSend /cancel to drop it.")
+        else:
+            sent_msg = await client.send_message(chat_id, "⏳ Your File is Being Soft Subbed. This should be quick!")
+
+        try:
+            async with job_queue.slot(job):
+                job.trace.add("queue", job.wait_time)
+                if position:
+                    updater.update(sent_msg, "⏳ Your File is Being Soft Subbed. This should be quick!")
+                with job.trace.span("encode", children=True):
+                    softmux_filename = await softmux_vid(og_vid_filename, og_sub_filename, sent_msg, job=job)
+        except JobCancelled:
+            outcome = "cancelled"
+            await safe_edit_message(sent_msg, "🚫 Your queued job was cancelled.")
+            return
+        if not softmux_filename:
+            return
+
+        job.trace.bytes_out = os.path.getsize(os.path.join(Config.DOWNLOAD_DIR, softmux_filename))
+        with job.trace.span("upload"):
+            file_id, _ = await upload_file(client, chat_id, sent_msg, softmux_filename, final_filename, owner)
+        with job.trace.span("cleanup"):
+            await cleanup_files(chat_id, og_vid_filename, og_sub_filename)
+        outcome = "ok" if file_id else "upload_failed"
+    finally:
+        # The slot already let go of the job unless it never got that far
+        if job_queue.position(job):
+            job_queue.withdraw(job)
+        else:
+            job_queue.release(job)
+        await storage.release(owner, delete=True)
+        await metrics.finish(job.trace, "cancelled" if job.cancelled else outcome)
+
+@Client.on_message(filters.command('plan') & check_user & filters.private)
+async def dry_run(client, message):
+    """Show the ffmpeg command hardmux would run with the current preferences, without running it."""
+    chat_id = message.from_user.id
+    session = await sessions.get(chat_id)
+    og_vid_filename, og_sub_filename = session.vid_name, session.sub_name
+    if not og_vid_filename or not og_sub_filename:
+        await message.reply_text("⚠️ Send a Video File and a Subtitle File first!")
+        return
+
+    vid = os.path.join(Config.DOWNLOAD_DIR, og_vid_filename)
+    sub = os.path.join(Config.DOWNLOAD_DIR, og_sub_filename)
+    font_path = os.path.join(Config.FONTS_DIR, "HelveticaRounded-Bold.ttf")
+    out_location = os.path.join(Config.DOWNLOAD_DIR, f"{os.path.splitext(og_vid_filename)[0]}_hardmuxed.mp4")
+
+    info = await probe(vid)
+    styled_sub = await prepare_subtitles(sub, session.settings)
+    prepared = styled_sub != sub
+    if session.settings.get("mode") == "ladder":
+        renditions = plan_ladder(info, session.settings, styled_sub, font_path, prepared=prepared).renditions
+        settings = adapt_encoding(session.settings, info, renditions=renditions)
+        plan = plan_ladder(info, settings, styled_sub, font_path, prepared=prepared)
+        out_locations = [os.path.join(Config.DOWNLOAD_DIR, ladder_output(og_vid_filename, r.name)) for r in plan.renditions]
+        await message.reply_text(plan.describe(vid, out_locations))
+        return
+
+    plan = plan_hardmux(info, adapt_encoding(session.settings, info), styled_sub, font_path, prepared=prepared)
+    await message.reply_text(plan.describe(vid, out_location))
+
+@Client.on_message(filters.command('cancel') & check_user & filters.private)
+async def cancel(client, message):
+    """Cancel the user's queued or running hardmux or softmux job."""
+    if job_queue.cancel(message.from_user.id):
+        await message.reply_text("🚫 Cancelling your job...")
+    else:
+        await message.reply_text("⚠️ You have no job in the queue.")
+
+@Client.on_message(filters.command('queue') & check_user & filters.private)
+async def queue_status(client, message):
+    """Show queue depth, wait times and the user's position."""
+    stats = job_queue.stats()
+    text = (
+        "📊 **Queue Status**\n"
+        f"⚙️ Running: {stats['running']}/{stats['slots']}\n"
+        f"⏳ Waiting: {stats['waiting']}\n"
+        f"✅ Completed: {stats['completed']} | 🚫 Cancelled: {stats['cancelled']}\n"
+        f"⏱ Avg Wait: {stats['avg_wait']}s | Max Wait: {stats['max_wait']}s"
+    )
+    job = job_queue.get(message.from_user.id)
+    if job:
+        position = job_queue.position(job)
+        text += f"\n\n📍 Your job: {'running' if not position else f'position {position}'}"
+    await message.reply_text(text)
+
+async def _check_admin(filt, c, m):
+    return str(m.from_user.id) in Config.ADMIN_USERS
+
+check_admin = filters.create(_check_admin)
+
+@Client.on_message(filters.command('stats') & check_admin & filters.private)
+async def job_stats(client, message):
+    """Summarise where job time went over the last day (or `/stats HOURS`), p50/p95 per phase."""
+    args = message.text.split()
+    hours = float(args[1]) if len(args) > 1 and args[1].replace('.', '', 1).isdigit() else 24
+    summary = await metrics.summary(time.time() - hours * 3600)
+    if not summary["jobs"]:
+        await message.reply_text(f"📈 No jobs in the last {hours:g}h.")
+        return
+
+    outcomes = " | ".join(f"{outcome}: {count}" for outcome, count in sorted(summary["outcomes"].items()))
+    lines = [
+        f"📈 **Job Stats, last {hours:g}h**",
+        f"🧾 Jobs: {summary['jobs']} ({outcomes})",
+        f"⏱ Total: p50 {summary['total'][0]:.1f}s | p95 {summary['total'][1]:.1f}s",
+        "",
+    ]
+    for phase, (p50, p95, count) in summary["phases"].items():
+        lines.append(f"• {phase}: p50 {p50:.1f}s | p95 {p95:.1f}s ({count})")
+    if summary["fps"]:
+        lines.append(f"\n🎞 Encode fps p50: {summary['fps']:.1f}")
+    lines.append(f"🧮 ffmpeg CPU: {summary['cpu']}s")
+    if summary["presets"]:
+        lines.append("⚡ Presets: " + " | ".join(f"{p}: {c}" for p, c in sorted(summary["presets"].items())))
+    await message.reply_text("\n".join(lines))
+
+@Client.on_message(filters.command('storage') & check_user & filters.private)
+async def storage_status(client, message):
+    """Show disk usage, reservations and what the janitor reclaimed."""
+    stats = await storage.stats()
+    await message.reply_text(
+        "💾 **Storage Status**\n"
+        f"🗄 Disk: {humanbytes(stats['disk_free'])} free of {humanbytes(stats['disk_total'])}\n"
+        f"📥 Downloads: {humanbytes(stats['downloads'])} | 📦 Store: {humanbytes(stats['store'])}\n"
+        f"🔒 Reserved: {humanbytes(stats['reserved'])} by {stats['owners']} job(s)\n"
+        f"✅ Available: {humanbytes(stats['available'])} | 🚫 Refused: {stats['refused']}\n"
+        f"🧹 Reclaimed: {stats['reclaimed_files']} file(s), {humanbytes(stats['reclaimed_bytes'])}"
+    )
@@ -1,27 +1,22 @@
+import asyncio
 import logging
 import os
 import time
-import re
-import requests
-from urllib.parse import unquote
 from pathlib import Path
 from pyrogram import Client, filters
 from config import Config
-from helper_func.progress_bar import progress_bar
-from helper_func.dbhelper import Database as Db
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()]
-)
+from helper_func.progress_bar import progress_bar, TimeFormatter
+from helper_func.session import sessions
+from helper_func.probe import probe
+from helper_func.utils import safe_edit_message
+from helper_func.message_updater import updater
+from helper_func.media_store import media_store, telegram_key, url_key
+from helper_func.storage import storage, InsufficientStorage
+from helper_func.metrics import metrics
+from plugins.muxer import ingest_hardmux
 
 logger = logging.getLogger(__name__)
 
-# Initialize database
-db = Db()
-
 # Custom filter to check if the user is allowed
 async def _check_user(_, __, m):
     return str(m.from_user.id) in Config.ALLOWED_USERS
@@ -30,63 +25,83 @@ check_user = filters.create(_check_user)
 
 class Chat:
     DOWNLOAD_SUCCESS = "✅ File downloaded successfully in {} seconds!"
+    DOWNLOAD_CACHED = "⚡ Seen this file before, reusing the saved copy!"
     UNSUPPORTED_FORMAT = "❌ Unsupported file format: `{}`"
     FILE_SIZE_ERROR = "❌ Couldn't determine the file size."
     MAX_FILE_SIZE = "❌ File size exceeds the 2GB limit."
+    NO_SPACE = "💾 Not enough disk space right now, try again later.\n{}"
     LONG_CUS_FILENAME = "❌ Filename too long! Keep it under 60 characters."
 
-async def safe_edit_message(message, new_text):
-    """Safe edit function to avoid duplicate messages."""
-    try:
-        if message.text != new_text:  # ✅ Check for duplicate message
-            await message.edit_text(new_text)
-    except Exception as e:
-        logger.warning(f"Edit message failed: {e}")
+async def describe_video(path):
+    """Probe a fresh download (warming the probe cache) and summarise it for the user."""
+    info = await probe(path)
+    if not info or not info.width:
+        return ""
+    return f"\n\n🎞 {info.resolution} • {info.video_codec} • {TimeFormatter(info.duration * 1000) or '0s'}"
 
 async def save_document_or_video(client, message, is_video=False):
     """Handles both document and video files."""
     chat_id = message.from_user.id
     start_time = time.time()
+    media = message.video if is_video else message.document
     downloading = await client.send_message(chat_id, "📥 Downloading your File...")
 
-    download_location = await client.download_media(
-        message=message,
-        file_name=os.path.join(Config.DOWNLOAD_DIR, ""),
-        progress=progress_bar,
-        progress_args=("Initializing", downloading, start_time),
-    )
-
-    if not download_location:
-        return await safe_edit_message(downloading, "❌ Downloading Failed!")
-
-    await safe_edit_message(downloading, Chat.DOWNLOAD_SUCCESS.format(round(time.time() - start_time)))
+    # A file someone already sent is linked from the media store instead of downloaded again
+    key = telegram_key(media.file_unique_id)
+    og_filename = media.file_name
+    ext = og_filename.split(".")[-1].lower() if og_filename else None
+    if ext and await media_store.checkout(key, os.path.join(Config.DOWNLOAD_DIR, f"{round(start_time)}.{ext}")):
+        tg_filename = None
+        updater.update(downloading, Chat.DOWNLOAD_CACHED)
+    elif Config.PIPELINED_INGEST and ext in ["mp4", "mkv"] and await ingest_hardmux(
+            client, message, media, key, og_filename, f"{round(start_time)}.{ext}", downloading):
+        return
+    else:
+        try:
+            async with storage.claim(("download", chat_id, message.id), media.file_size or 0):
+                download_location = await client.download_media(
+                    message=message,
+                    file_name=os.path.join(Config.DOWNLOAD_DIR, ""),
+                    progress=progress_bar,
+                    progress_args=("Initializing", downloading, start_time),
+                )
+        except InsufficientStorage as e:
+            return await safe_edit_message(downloading, Chat.NO_SPACE.format(e))
+
+        if not download_location:
+            return await safe_edit_message(downloading, "❌ Downloading Failed!")
+
+        updater.update(downloading, Chat.DOWNLOAD_SUCCESS.format(round(time.time() - start_time)))
+        metrics.note_download(chat_id, time.time() - start_time, media.file_size or 0)
+        tg_filename = os.path.basename(download_location)
 
-    tg_filename = os.path.basename(download_location)
-    og_filename = message.video.file_name if is_video else message.document.file_name
     og_filename = og_filename if og_filename else tg_filename
 
     ext = og_filename.split(".")[-1].lower()
     filename = f"{round(start_time)}.{ext}"
 
-    os.rename(os.path.join(Config.DOWNLOAD_DIR, tg_filename), os.path.join(Config.DOWNLOAD_DIR, filename))
+    if tg_filename:
+        os.rename(os.path.join(Config.DOWNLOAD_DIR, tg_filename), os.path.join(Config.DOWNLOAD_DIR, filename))
+        if ext in ["srt", "ass", "mp4", "mkv"]:
+            await media_store.add(key, os.path.join(Config.DOWNLOAD_DIR, filename))
 
     if ext in ["srt", "ass"]:
-        db.put_sub(chat_id, filename)
+        session = await sessions.put_sub(chat_id, filename)
         new_text = (
             "✅ Subtitle file downloaded successfully.\n"
             "Choose your desired muxing!\n[ /softmux , /hardmux ]"
-            if db.check_video(chat_id) else "✅ Subtitle file downloaded.\nNow send a Video File!"
+            if session.has_video else "✅ Subtitle file downloaded.\nNow send a Video File!"
         )
     elif ext in ["mp4", "mkv"]:
-        db.put_video(chat_id, filename, og_filename)
+        session = await sessions.put_video(chat_id, filename, og_filename)
         new_text = (
             "✅ Video file downloaded successfully.\n"
             "Choose your desired muxing.\n[ /softmux , /hardmux ]"
-            if db.check_sub(chat_id) else "✅ Video file downloaded successfully.\nNow send a Subtitle file!"
-        )
+            if session.has_sub else "✅ Video file downloaded successfully.\nNow send a Subtitle file!"
+        ) + await describe_video(os.path.join(Config.DOWNLOAD_DIR, filename))
     else:
         new_text = Chat.UNSUPPORTED_FORMAT.format(ext) + f"\nFile = {tg_filename}"
-        os.remove(os.path.join(Config.DOWNLOAD_DIR, tg_filename))
+        os.remove(os.path.join(Config.DOWNLOAD_DIR, filename))
 
     await safe_edit_message(downloading, new_text)
 
@@ -103,6 +118,10 @@ async def save_video(client, message):
 @Client.on_message(filters.text & filters.regex(r"^https?://") & check_user)
 async def save_url(client, message):
     """Save a video file from a URL."""
+    # requests is only needed once someone sends a link, keep it out of startup
+    import requests
+    from helper_func.downloader import Downloader, DownloadError, partial_path, probe_url
+
     chat_id = message.from_user.id
     url = message.text.split("|")[0].strip()
     save_filename = message.text.split("|")[1].strip() if "|" in message.text and len(message.text.split("|")) == 2 else None
@@ -113,29 +132,20 @@ async def save_url(client, message):
 
     try:
         sent_msg = await client.send_message(chat_id, "📥 Preparing Your Download...")
-        r = requests.get(url, stream=True, allow_redirects=True, timeout=30)
-
-        if r.status_code != 200:
-            await sent_msg.edit_text("❌ Invalid URL or server error.")
-            return
-
-        if "content-disposition" in r.headers:
-            res = re.search(r'filename="(.*?)"', r.headers["content-disposition"])
-            save_filename = res.group(1) if res else unquote(url.split("?")[0].split("/")[-1])
-        else:
-            save_filename = unquote(url.split("?")[0].split("/")[-1])
+        info = await asyncio.to_thread(probe_url, url)
+        save_filename = save_filename or info.filename
 
         ext = save_filename.split(".")[-1].lower()
         if ext not in ["mp4", "mkv"]:
-            await sent_msg.edit_text(Chat.UNSUPPORTED_FORMAT.format(ext))
+            await safe_edit_message(sent_msg, Chat.UNSUPPORTED_FORMAT.format(ext))
             return
 
-        size = int(r.headers.get("content-length", 0))
+        size = info.size
         if not size:
-            await sent_msg.edit_text(Chat.FILE_SIZE_ERROR)
+            await safe_edit_message(sent_msg, Chat.FILE_SIZE_ERROR)
             return
         if size > 2 * 1000 * 1000 * 1000:  # 2GB Limit
-            await sent_msg.edit_text(Chat.MAX_FILE_SIZE)
+            await safe_edit_message(sent_msg, Chat.MAX_FILE_SIZE)
             return
 
         os.makedirs(Config.DOWNLOAD_DIR, exist_ok=True)
@@ -149,32 +159,41 @@ async def save_url(client, message):
             base_filename = f"{timestamp}_{counter}.{ext}"
             file_path = Path(Config.DOWNLOAD_DIR) / base_filename
 
-        current = 0
-        start = time.time()
-        with open(file_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    written = f.write(chunk)
-                    current += written
-                    await progress_bar(current, size, "Downloading Your File!", sent_msg, start)
-
-        await sent_msg.edit_text(Chat.DOWNLOAD_SUCCESS.format(round(time.time() - start)))
-
-        db.put_video(chat_id, str(file_path.name), save_filename)
+        key = url_key(info)
+        if await media_store.checkout(key, str(file_path)):
+            updater.update(sent_msg, Chat.DOWNLOAD_CACHED)
+        else:
+            # Unfinished downloads keep a URL based name so sending the link again resumes them
+            part_path = partial_path(Config.DOWNLOAD_DIR, info.url, ext)
+            # The partial file is sparse, count the blocks actually written
+            done = os.stat(part_path).st_blocks * 512 if os.path.exists(part_path) else 0
+            start = time.time()
+            async with storage.claim(("download", chat_id, message.id), max(0, size - done)):
+                stats = await Downloader(info, part_path, connections=Config.DOWNLOAD_CONNECTIONS).run(
+                    progress=progress_bar,
+                    progress_args=("Downloading Your File!", sent_msg, start)
+                )
+            os.rename(part_path, file_path)
+            metrics.note_download(chat_id, time.time() - start, max(0, size - done))
+            logger.info(f"Downloaded {url} with {len(stats)} connection(s): {stats}")
+            await media_store.add(key, str(file_path))
+
+            updater.update(sent_msg, Chat.DOWNLOAD_SUCCESS.format(round(time.time() - start)))
+
+        session = await sessions.put_video(chat_id, str(file_path.name), save_filename)
         response = (
             "✅ Video File Downloaded.\n"
             "Choose your desired muxing!\n[ /softmux , /hardmux ]"
-            if db.check_sub(chat_id) else
+            if session.has_sub else
             "✅ Video File Downloaded.\nNow send a Subtitle file!"
-        )
-        await sent_msg.edit_text(response)
+        ) + await describe_video(str(file_path))
+        await safe_edit_message(sent_msg, response)
 
-    except requests.RequestException as e:
+    except InsufficientStorage as e:
+        await safe_edit_message(sent_msg, Chat.NO_SPACE.format(e))
+    except (requests.RequestException, DownloadError) as e:
         logger.error(f"URL download error: {e}")
-        await sent_msg.edit_text(f"❌ Download failed: {str(e)}")
+        await safe_edit_message(sent_msg, f"❌ Download failed: {str(e)}\nSend the link again to resume.")
     except Exception as e:
         logger.error(f"Unexpected error in URL download: {e}")
-        await sent_msg.edit_text(f"❌ An error occurred: {str(e)}")
-
-if __name__ == "__main__":
-    Client("muxbot").run()
+        await safe_edit_message(sent_msg, f"❌ An error occurred: {str(e)}")